@@ -1,6 +1,28 @@
+import sys
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
+
+
+def _warm_up():
+    """Opens the Firestore channel and fills the distributor map cache."""
+    from .datastore import get_datastore
+    from .distributor_data_utility import get_distributor_map
+
+    try:
+        # A one-document read sets up credentials, the gRPC channel and TLS.
+        get_datastore().distributors.collection().limit(1).get()
+        get_distributor_map()
+    except Exception as e:
+        print(f"Firebase Warm-up Error: {e}", file=sys.stderr)
 
 
 class EcmanagerappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ecmanagerapp'
+
+    def ready(self):
+        # Runs in every worker process; the warm-up does not hold up startup.
+        if getattr(settings, 'FIREBASE_WARM_UP', False):
+            threading.Thread(target=_warm_up, name='firebase-warm-up', daemon=True).start()
@@ -0,0 +1,191 @@
+import json
+import math
+import platform
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from .client_data_utility import get_client_data
+from .datastore import MemoryDataStore, get_datastore, set_datastore
+from .distributor_data_utility import (
+    get_distributor_data, invalidate_distributor_data, invalidate_distributor_map,
+)
+from .employee_clients_data_utility import get_employee_clients
+from .employee_leader_board_data_utility import get_monthly_leaderboard
+from .login_utility import invalidate_distributor_profile
+from .memory_store import seed_synthetic_data
+from .monthly_aggregate_utility import invalidate_monthly_aggregate
+
+# Client counts the suite runs at by default (1,000,000 is opt-in: it needs several GB)
+DEFAULT_SCALES = (10_000, 100_000)
+# Target is flagged when its p50 grows by more than this fraction over the baseline
+DEFAULT_TOLERANCE = 0.25
+
+
+def reset_caches():
+    """Empties every in-process cache so each run measures the full read path."""
+    invalidate_distributor_map()
+    invalidate_distributor_data()
+    invalidate_monthly_aggregate()
+    invalidate_distributor_profile()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def measure(func, iterations):
+    """
+    Calls `func()` `iterations` times from cold caches, then once more under
+    tracemalloc (which slows it down, so that run is not timed).
+
+    Returns:
+        dict: p50_ms, p99_ms, ops_per_sec and peak_kib of the target.
+    """
+    timings = []
+    for _ in range(iterations):
+        reset_caches()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    reset_caches()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'p50_ms': round(percentile(timings, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'ops_per_sec': round(len(timings) / sum(timings), 2) if sum(timings) else 0.0,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def _view_client(role, uid):
+    """Test client logged in as `role` (the session user the views expect)."""
+    client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else 'localhost')
+    session = client.session
+    session['user'] = {'uid': uid, 'email': f'{role}@example.com', 'role': role}
+    session.save()
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+    return client
+
+
+def _render(client, url_name):
+    def call():
+        response = client.get(reverse(url_name))
+        if response.status_code != 200:
+            raise RuntimeError(f"{url_name} returned HTTP {response.status_code}")
+    return call
+
+
+def benchmark_targets(owner_ids, seed=0):
+    """The utilities and views timed at every scale, as {name: zero-argument callable}."""
+    from .views import check_for_duplicate_contact
+
+    rng = random.Random(seed)
+    store = get_datastore()
+    busiest_owner = owner_ids[0]
+    known_contact = store.clients.owned_by(busiest_owner).limit(1).get()[0].to_dict()['contact1']
+    contacts = [known_contact, f'07{rng.randrange(10 ** 9, 10 ** 10)}']
+
+    admin = _view_client('admin', 'benchmark-admin')
+    employee = _view_client('employee', busiest_owner)
+
+    return {
+        'get_client_data': get_client_data,
+        'get_employee_clients': lambda: get_employee_clients(busiest_owner),
+        'get_monthly_leaderboard': get_monthly_leaderboard,
+        'get_distributor_data': get_distributor_data,
+        'check_for_duplicate_contact': lambda: [check_for_duplicate_contact(c) for c in contacts],
+        'view:admin_dashboard': _render(admin, 'admin_dashboard'),
+        'view:employee_dashboard': _render(employee, 'employee_dashboard'),
+    }
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, num_distributors=300, iterations=20, only=None, log=print):
+    """
+    Seeds a fresh in-memory datastore per scale and times every target in it.
+    The configured datastore is restored afterwards.
+
+    Args:
+        scales: Client counts to seed.
+        num_distributors: Distributors the clients are spread across.
+        iterations: Timed calls per target.
+        only: Optional collection of target names to run.
+        log: Progress callback.
+
+    Returns:
+        dict: {'meta': {...}, 'results': {'<clients>': {target: stats}}}
+    """
+    previous = get_datastore()
+    results = {}
+    # Sessions of the benchmark users live in the local cache, not the database.
+    with override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cache'):
+        try:
+            for num_clients in scales:
+                store = MemoryDataStore()
+                set_datastore(store)
+                started = time.perf_counter()
+                owner_ids = seed_synthetic_data(store, num_clients, num_distributors)
+                log(f"Seeded {num_clients} clients across {num_distributors} distributors "
+                    f"in {time.perf_counter() - started:.1f}s")
+
+                scale_results = results[str(num_clients)] = {}
+                for name, func in benchmark_targets(owner_ids).items():
+                    if only and name not in only:
+                        continue
+                    scale_results[name] = measure(func, iterations)
+                    log(f"  {name}: {scale_results[name]}")
+        finally:
+            set_datastore(previous)
+            reset_caches()
+
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'iterations': iterations,
+            'distributors': num_distributors,
+            'client_replica': bool(getattr(settings, 'CLIENT_REPLICA_ENABLED', False)),
+        },
+        'results': results,
+    }
+
+
+def compare_to_baseline(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Lists the targets whose p50 latency regressed by more than `tolerance`
+    (a fraction) against a saved baseline, as (scale, target, baseline_ms, now_ms).
+    Targets or scales missing from the baseline are skipped.
+    """
+    regressions = []
+    for scale, targets in report['results'].items():
+        for name, stats in targets.items():
+            before = baseline.get('results', {}).get(scale, {}).get(name)
+            if before and stats['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+                regressions.append((scale, name, before['p50_ms'], stats['p50_ms']))
+    return regressions
+
+
+def load_baseline(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_baseline(report, path):
+    with open(path, 'w') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
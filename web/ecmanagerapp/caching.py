@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Small process-wide read-through cache with a time-to-live per entry.
+
+    Loads are single-flight per key: concurrent misses for the same key wait
+    for the first loader instead of all hitting Firestore, while other keys
+    load independently. Values are shared between callers and must be
+    treated as read-only.
+    """
+
+    def __init__(self, ttl):
+        # `ttl` is a number of seconds or a callable returning one, so it can
+        # follow Django settings (and override_settings in tests).
+        self._ttl = ttl
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._key_locks = {}
+        # Keys with a background refresh in flight, and a counter bumped by
+        # every invalidation/update so a load or refresh that started before
+        # one cannot overwrite its result.
+        self._refreshing = set()
+        self._version = 0
+        # key -> asyncio.Task of the async load in flight (aget_or_load)
+        self._async_loads = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ttl(self):
+        return self._ttl() if callable(self._ttl) else self._ttl
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value for `key`, calling `loader()` when missing or
+        expired. A value loaded across an invalidation or update is returned
+        but not cached, as it may predate the change.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have loaded it while we waited.
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > time.monotonic():
+                    self.hits += 1
+                    return entry[1]
+                self.misses += 1
+                version = self._version
+
+            value = loader()
+            with self._lock:
+                if version == self._version:
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    async def aget_or_load(self, key, loader):
+        """
+        get_or_load() for async code: `loader` is a coroutine function. Misses
+        are single-flight per key among the coroutines of one event loop;
+        nothing blocks the loop while the value loads.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            task = self._async_loads.get(key)
+            if task is None or task.done() or task.get_loop() is not asyncio.get_running_loop():
+                self.misses += 1
+                task = asyncio.ensure_future(self._aload(key, loader, self._version))
+                self._async_loads[key] = task
+
+        # shield(): a cancelled caller must not cancel the load others wait for.
+        return await asyncio.shield(task)
+
+    async def _aload(self, key, loader, version):
+        try:
+            value = await loader()
+            with self._lock:
+                if version == self._version:
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+        finally:
+            with self._lock:
+                if self._async_loads.get(key) is asyncio.current_task():
+                    del self._async_loads[key]
+
+    def get_or_refresh(self, key, loader, executor):
+        """
+        Like get_or_load(), but an expired entry is still returned right away
+        while a single background refresh runs `loader()` on `executor`
+        (stale-while-revalidate), in a copy of the caller's context. Only a
+        missing entry is loaded inline.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                if entry[0] <= time.monotonic() and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    executor.submit(contextvars.copy_context().run, self._refresh, key, loader, self._version)
+                return entry[1]
+
+        return self.get_or_load(key, loader)
+
+    def _refresh(self, key, loader, version):
+        try:
+            value = loader()
+            with self._lock:
+                if version == self._version:
+                    self._entries[key] = (time.monotonic() + self.ttl, value)
+        except Exception as e:
+            # Keep serving the stale value; the next read retries.
+            print(f"Cache refresh of '{key}' failed: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def update(self, key, func):
+        """
+        Replaces a cached value with `func(value)` without changing its expiry,
+        for applying a known change instead of reloading. No-op when missing.
+        `func` must return a new object rather than modify the shared one.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._version += 1
+                self._entries[key] = (entry[0], func(entry[1]))
+
+    def invalidate(self, key=None):
+        """Drops one entry, or every entry when no key is given."""
+        with self._lock:
+            self._version += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
@@ -1,32 +1,66 @@
+import asyncio
 import datetime
+from dataclasses import dataclass
+
 import pytz
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from firebase_admin import firestore
 import firebase_admin.exceptions
 import sys
 
-# Initialize Firestore client (assuming Firebase is already initialized via settings)
-db = firestore.client()
+from .concurrency import run_parallel
+from .datastore import acount_documents, count_documents, get_datastore
+from .distributor_data_utility import aget_distributor_map, get_distributor_map
+from .kpi_state_utility import kpi_state_aggregate, refresh_kpi_state
+from .monthly_aggregate_utility import aget_monthly_aggregate, current_month_range, get_monthly_aggregate
+from .replica import get_client_replica
+
+
+@dataclass(slots=True)
+class ClientRecord:
+    """
+    One client lead as shown on the dashboards. Uses __slots__ instead of a
+    per-document dict; templates read it with the same attribute names as the
+    Firestore fields (client.fullName, client.dateLogged, ...).
+    """
+    id: str
+    fullName: str = ''
+    contact1: str = None
+    contact2: str = None
+    initialNotes: str = ''
+    ownerId: str = None
+    dateLogged: datetime.datetime = None
+    distributor_name: str = None
+    date_logged_formatted: str = None
+
+    @classmethod
+    def from_document(cls, doc_id, data, **extra):
+        """
+        Builds a record from a (possibly projected) document dict; `extra`
+        sets computed fields or fills in ones that were not selected.
+        """
+        fields = {
+            'fullName': data.get('fullName', ''),
+            'contact1': data.get('contact1'),
+            'contact2': data.get('contact2'),
+            'initialNotes': data.get('initialNotes', ''),
+            'ownerId': data.get('ownerId'),
+            'dateLogged': data.get('dateLogged'),
+        }
+        fields.update(extra)
+        return cls(id=doc_id, **fields)
 
 
 def get_client_data():
     """
     Fetches all client data from Firestore, joins with distributor names,
     calculates monthly and total KPIs, and returns a dictionary of results.
+    'clients' is a list of ClientRecord.
     """
 
-    # Define Firestore paths using the secured app ID structure
-    # NOTE: settings.FIREBASE_WEB_APP_ID must be configured correctly in settings.py
-    # If using Canvas, replace settings.FIREBASE_WEB_APP_ID with the actual global variable access if needed,
-    # but for a standard Django project, using settings is correct.
-    try:
-        app_id = settings.FIREBASE_WEB_APP_ID
-    except AttributeError:
-        # Fallback if the setting is missing (for local testing flexibility)
-        app_id = 'default-app-id'
-
-    CLIENTS_PATH = f'artifacts/{app_id}/public/data/clients'
-    DISTRIBUTORS_PATH = f'artifacts/{app_id}/public/data/distributors'
+    # Clients and distributors live under the secured app ID structure
+    # (/artifacts/{appId}/public/data/...); the repositories resolve the paths.
+    store = get_datastore()
 
     # 1. Initialize result structure
     results = {
@@ -34,18 +68,20 @@ def get_client_data():
         'kpi_total_clients': 0,
         'kpi_clients_month': 0,
         'kpi_top_distributor': 'N/A',
+        'num_clients': 0,
     }
 
     try:
-        # 2. Fetch Distributors (UID -> Name Map for Joining)
-        distributor_map = {}
-        distributors_snapshot = db.collection(DISTRIBUTORS_PATH).get()
-        for doc in distributors_snapshot:
-            data = doc.to_dict()
-            distributor_map[doc.id] = data.get('full_name', 'N/A')
-
-        # 3. Fetch All Clients and Initialize Counters
-        clients_snapshot = db.collection(CLIENTS_PATH).get()
+        # 2. Fetch Distributors (UID -> Name Map for Joining, cached)
+        distributor_map = get_distributor_map()
+
+        # 3. Fetch All Clients (from the live replica when it is warm)
+        replica = get_client_replica()
+        if replica is not None:
+            clients_snapshot = replica.all_clients()
+        else:
+            query = store.clients.collection().select(store.clients.DISPLAY_FIELDS)
+            clients_snapshot = [(doc.id, doc.to_dict()) for doc in query.stream()]
         clients_data = []
 
         # Define local timezone and the current time
@@ -54,61 +90,219 @@ def get_client_data():
         now_utc = datetime.datetime.now(datetime.timezone.utc)
         now_local = now_utc.astimezone(local_tz)
 
-        current_month_clients_count = 0
-        monthly_counts = {}
+        for doc_id, client in clients_snapshot:
+            owner_id = client.get('ownerId', 'Unknown')
 
-        for doc in clients_snapshot:
-            client = doc.to_dict()
-            client['id'] = doc.id
+            clients_data.append(ClientRecord.from_document(
+                doc_id, client,
+                distributor_name=distributor_map.get(owner_id, owner_id),
+                # Date Handling and Formatting
+                date_logged_formatted=format_date_logged(client.get('dateLogged'), local_tz, now_local),
+            ))
 
-            owner_id = client.get('ownerId', 'Unknown')
-            client['distributor_name'] = distributor_map.get(owner_id, owner_id)
+        # 4. KPIs come from count() aggregations and the monthly aggregate
+        results.update(get_client_kpis())
+
+        # 5. Compile Final Results
+        results['clients'] = clients_data
+
+        return results
+
+    except firebase_admin.exceptions.FirebaseError as e:
+        print(f"Firebase Client Data Error: {e}", file=sys.stderr)
+        # Return base results with an error indicator
+        results['kpi_top_distributor'] = 'Data Error'
+        return results
+
+    except Exception as e:
+        print(f"General Client Data Error: {e}", file=sys.stderr)
+        results['kpi_top_distributor'] = 'System Error'
+        return results
 
-            # Date Handling and Formatting
-            log_timestamp = client.get('dateLogged')
-            log_date = now_local  # Default date
 
-            if log_timestamp:
-                # 1. Set the naive Firestore timestamp to UTC
-                utc_date = log_timestamp.replace(tzinfo=datetime.timezone.utc)
-                # 2. Convert the UTC date to the local timezone
-                log_date = utc_date.astimezone(local_tz)
+def format_date_logged(log_timestamp, local_tz, default):
+    """Formats a Firestore dateLogged timestamp (UTC) in the local timezone for display."""
+    log_date = default
 
-            client['date_logged_formatted'] = log_date.strftime('%b %d, %Y %I:%M %p %Z')
+    if log_timestamp:
+        # 1. Set the naive Firestore timestamp to UTC
+        utc_date = log_timestamp.replace(tzinfo=datetime.timezone.utc)
+        # 2. Convert the UTC date to the local timezone
+        log_date = utc_date.astimezone(local_tz)
 
-            # KPI Calculation (Monthly Counts and Leaderboard Tally)
-            if log_date.month == now_local.month and log_date.year == now_local.year:
-                current_month_clients_count += 1
-                monthly_counts[owner_id] = monthly_counts.get(owner_id, 0) + 1
+    return log_date.strftime('%b %d, %Y %I:%M %p %Z')
 
-            clients_data.append(client)
 
-        # 4. Calculate Top Distributor KPI
-        top_distributor_id = max(monthly_counts, key=monthly_counts.get, default=None)
+def get_client_page(page_size, owner_id=None, descending=True, cursor=None, offset=0):
+    """
+    Fetches a single page of clients ordered by dateLogged, joined with
+    distributor names, for the server-side paginated client list.
 
-        if top_distributor_id:
-            max_clients = monthly_counts[top_distributor_id]
-            name = distributor_map.get(top_distributor_id, 'Unknown')
-            # Use safe formatting for the template
-            top_distributor_kpi = name
-            num_clients = max_clients
+    Args:
+        page_size (int): Number of clients to return.
+        owner_id (str): Only return clients logged by this distributor.
+        descending (bool): Newest first when True.
+        cursor (str): ID of the last client of the previous page.
+        offset (int): Clients to skip when no cursor is available.
 
-        # 5. Compile Final Results
-        results['clients'] = clients_data
-        results['kpi_total_clients'] = len(clients_data)
-        results['kpi_clients_month'] = current_month_clients_count
-        results['num_clients'] = num_clients
-        results['kpi_top_distributor'] = top_distributor_kpi
+    Returns:
+        dict: {'clients': [...], 'total': int, 'filtered': int,
+               'next_cursor': str or None}, where 'total' counts every client
+               and 'filtered' those of the owner filter.
+    """
+    store = get_datastore()
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+    now_local = datetime.datetime.now(local_tz)
+
+    distributor_map = get_distributor_map()
+    query = store.clients.page(page_size, owner_id=owner_id, descending=descending, cursor=cursor, offset=offset) \
+        .select(store.clients.DISPLAY_FIELDS)
+
+    clients = []
+    last_doc_id = None
+    for doc in query.stream():
+        client = doc.to_dict()
+        owner = client.get('ownerId', 'Unknown')
+        clients.append({
+            'id': doc.id,
+            'fullName': client.get('fullName', ''),
+            'contact1': client.get('contact1'),
+            'contact2': client.get('contact2'),
+            'initialNotes': client.get('initialNotes', ''),
+            'distributor_name': distributor_map.get(owner, owner),
+            'date_logged_formatted': format_date_logged(client.get('dateLogged'), local_tz, now_local),
+        })
+        last_doc_id = doc.id
+
+    if owner_id:
+        total, filtered = run_parallel(
+            lambda: count_documents(store.clients.collection()),
+            lambda: count_documents(store.clients.owned_by(owner_id)),
+        )
+    else:
+        total = filtered = count_documents(store.clients.collection())
+
+    return {
+        'clients': clients,
+        'total': total,
+        'filtered': filtered,
+        # A short page means there is nothing after it.
+        'next_cursor': last_doc_id if len(clients) == page_size else None,
+    }
 
+
+def _empty_client_kpis():
+    return {
+        'kpi_total_clients': 0,
+        'kpi_clients_month': 0,
+        'kpi_top_distributor': 'N/A',
+        'num_clients': 0,
+    }
+
+
+def _fill_client_kpis(results, total, month_total, aggregate, distributor_map):
+    results['kpi_total_clients'] = total
+    results['kpi_clients_month'] = month_total
+
+    top_performers = aggregate.top(1)
+    if top_performers:
+        top_distributor_id, max_clients = top_performers[0]
+        results['kpi_top_distributor'] = distributor_map.get(top_distributor_id, 'Unknown')
+        results['num_clients'] = max_clients
+    return results
+
+
+def _incremental_kpis_enabled():
+    # settings.CLIENT_KPI_SOURCE: 'incremental' folds new leads into the
+    # persisted KPI state (see kpi_state_utility); 'count' issues the count()
+    # aggregations on every load.
+    return getattr(settings, 'CLIENT_KPI_SOURCE', 'incremental') == 'incremental'
+
+
+def get_client_kpis():
+    """
+    Calculates the admin KPIs (total clients, clients this month and the month's
+    top distributor) without downloading the client collection: the persisted
+    KPI state is brought up to date with the leads logged since its watermark,
+    or, with CLIENT_KPI_SOURCE = 'count', the total and monthly counts are
+    count() aggregations issued in parallel and the top distributor comes from
+    the monthly aggregate.
+    """
+    results = _empty_client_kpis()
+
+    try:
+        clients = get_datastore().clients
+        period, start_utc, end_utc = current_month_range()
+
+        distributor_map = get_distributor_map()
+        replica = get_client_replica()
+        if replica is not None:
+            total, month_total = replica.count(), replica.count_in_period(period)
+            aggregate = get_monthly_aggregate()
+        elif _incremental_kpis_enabled():
+            state = refresh_kpi_state()
+            aggregate = kpi_state_aggregate(state)
+            total, month_total = state['total'], aggregate.total
+        else:
+            total, month_total = run_parallel(
+                lambda: count_documents(clients.collection()),
+                lambda: count_documents(clients.logged_between(start_utc, end_utc)),
+            )
+            aggregate = get_monthly_aggregate()
+
+        return _fill_client_kpis(results, total, month_total, aggregate, distributor_map)
+
+    except firebase_admin.exceptions.FirebaseError as e:
+        print(f"Firebase Client KPI Error: {e}", file=sys.stderr)
+        results['kpi_top_distributor'] = 'Data Error'
         return results
 
+    except Exception as e:
+        print(f"General Client KPI Error: {e}", file=sys.stderr)
+        results['kpi_top_distributor'] = 'System Error'
+        return results
+
+
+async def aget_client_kpis():
+    """
+    Async get_client_kpis(): the two count() aggregations, the distributor
+    names and the monthly aggregate are awaited concurrently on the async
+    Firestore client. The incremental KPI state is refreshed on a worker
+    thread (its transaction uses the sync client) alongside the names.
+    """
+    results = _empty_client_kpis()
+
+    try:
+        clients = get_datastore().aio.clients
+        period, start_utc, end_utc = current_month_range()
+
+        replica = get_client_replica()
+        if replica is not None:
+            total, month_total = replica.count(), replica.count_in_period(period)
+            distributor_map, aggregate = await asyncio.gather(aget_distributor_map(), aget_monthly_aggregate())
+        elif _incremental_kpis_enabled():
+            distributor_map, state = await asyncio.gather(
+                aget_distributor_map(),
+                sync_to_async(refresh_kpi_state, thread_sensitive=False)(),
+            )
+            aggregate = kpi_state_aggregate(state)
+            total, month_total = state['total'], aggregate.total
+        else:
+            total, month_total, distributor_map, aggregate = await asyncio.gather(
+                acount_documents(clients.collection()),
+                acount_documents(clients.logged_between(start_utc, end_utc)),
+                aget_distributor_map(),
+                aget_monthly_aggregate(),
+            )
+
+        return _fill_client_kpis(results, total, month_total, aggregate, distributor_map)
+
     except firebase_admin.exceptions.FirebaseError as e:
-        print(f"Firebase Client Data Error: {e}", file=sys.stderr)
-        # Return base results with an error indicator
+        print(f"Firebase Client KPI Error: {e}", file=sys.stderr)
         results['kpi_top_distributor'] = 'Data Error'
         return results
 
     except Exception as e:
-        print(f"General Client Data Error: {e}", file=sys.stderr)
+        print(f"General Client KPI Error: {e}", file=sys.stderr)
         results['kpi_top_distributor'] = 'System Error'
         return results
@@ -0,0 +1,93 @@
+import csv
+import datetime
+import json
+
+import pytz
+from django.conf import settings
+from firebase_admin import firestore
+
+from .datastore import get_datastore
+from .distributor_data_utility import get_distributor_map
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+EXPORT_FIELDS = ['id', 'fullName', 'contact1', 'contact2', 'ownerId', 'distributor_name', 'dateLogged', 'initialNotes']
+
+# Clients fetched per Firestore page while exporting.
+EXPORT_PAGE_SIZE = 1000
+
+
+class _Echo:
+    """File-like object whose write() returns the line, so csv.writer can feed a generator."""
+
+    def write(self, value):
+        return value
+
+
+def iter_client_documents(owner_id=None, start_utc=None, end_utc=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Streams client documents ordered by dateLogged, one page at a time, using
+    the last document of each page as the start_after cursor of the next.
+    Only one page is held in memory at any moment.
+    """
+    clients = get_datastore().clients
+    query = clients.owned_by(owner_id) if owner_id else clients.collection()
+    if start_utc:
+        query = query.where('dateLogged', '>=', start_utc)
+    if end_utc:
+        query = query.where('dateLogged', '<', end_utc)
+    query = query.order_by('dateLogged', direction=firestore.Query.ASCENDING).select(clients.DISPLAY_FIELDS)
+
+    last_doc = None
+    while True:
+        page_query = query.start_after(last_doc) if last_doc is not None else query
+        docs = page_query.limit(page_size).get()
+        yield from docs
+
+        if len(docs) < page_size:
+            return
+        last_doc = docs[-1]
+
+
+def iter_client_export(file_format, owner_id=None, start_utc=None, end_utc=None):
+    """
+    Yields the export file (CSV with a header row, or JSONL) chunk by chunk,
+    one chunk per Firestore page, joining distributor names on the fly.
+    """
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+    distributor_map = get_distributor_map()
+    writer = csv.writer(_Echo())
+
+    if file_format == 'csv':
+        yield writer.writerow(EXPORT_FIELDS)
+
+    lines = []
+    for doc in iter_client_documents(owner_id, start_utc, end_utc):
+        client = doc.to_dict()
+        owner = client.get('ownerId', 'Unknown')
+        log_timestamp = client.get('dateLogged')
+        if log_timestamp:
+            log_timestamp = log_timestamp.replace(tzinfo=datetime.timezone.utc).astimezone(local_tz).isoformat()
+
+        row = {
+            'id': doc.id,
+            'fullName': client.get('fullName', ''),
+            'contact1': client.get('contact1') or '',
+            'contact2': client.get('contact2') or '',
+            'ownerId': owner,
+            'distributor_name': distributor_map.get(owner, owner),
+            'dateLogged': log_timestamp or '',
+            'initialNotes': client.get('initialNotes', ''),
+        }
+
+        if file_format == 'csv':
+            lines.append(writer.writerow([row[field] for field in EXPORT_FIELDS]))
+        else:
+            lines.append(json.dumps(row) + '\n')
+
+        if len(lines) >= EXPORT_PAGE_SIZE:
+            yield ''.join(lines)
+            lines = []
+
+    if lines:
+        yield ''.join(lines)
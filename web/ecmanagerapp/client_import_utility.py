@@ -0,0 +1,187 @@
+import csv
+import datetime
+import io
+import json
+import sys
+
+from firebase_admin import firestore
+
+from .client_lead_utility import DuplicateContactError, LeadValidationError, clean_client_lead, save_client_lead
+from .datastore import MAX_BATCH_WRITES, get_datastore
+from .monthly_aggregate_utility import invalidate_monthly_aggregate, period_for
+from .monthly_counter_utility import increment_monthly_counter
+
+# A lead costs at most 3 writes (client + two contact claims), plus one counter
+# increment per chunk, so 150 leads always fit in a single 500-write batch.
+IMPORT_CHUNK_LEADS = (MAX_BATCH_WRITES - 1) // 3
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def iter_lead_records(stream, file_format):
+    """
+    Parses an uploaded CSV (header row with fullName, contact1, contact2,
+    initialNotes) or JSONL file one record at a time, without reading it whole.
+
+    Args:
+        stream: Binary file-like object.
+        file_format (str): 'csv' or 'jsonl'.
+
+    Yields:
+        tuple: (row_number, record dict or None, parse error message or None)
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+
+    if file_format == 'csv':
+        # Row 1 is the header, so data rows start at 2 (as in a spreadsheet).
+        for row_number, record in enumerate(csv.DictReader(text), start=2):
+            yield row_number, record, None
+        return
+
+    for row_number, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            yield row_number, None, 'Invalid JSON format'
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, 'Each line must be a JSON object'
+            continue
+        yield row_number, record, None
+
+
+def _save_leads_one_by_one(chunk, owner_id):
+    """Fallback when a batch could not commit: save each lead in its own transaction."""
+    results = []
+    for row_number, lead, contacts in chunk:
+        try:
+            client_ref = save_client_lead(owner_id, dict(lead, ownerId=owner_id, dateLogged=firestore.SERVER_TIMESTAMP))
+            results.append({'row': row_number, 'status': 'created', 'id': client_ref.id})
+        except DuplicateContactError as e:
+            results.append({'row': row_number, 'status': 'duplicate', 'error': f'Contact {e.contact} already registered.'})
+        except Exception as e:
+            print(f"Import Save Error (row {row_number}): {e}", file=sys.stderr)
+            results.append({'row': row_number, 'status': 'error', 'error': 'Database save failed.'})
+    return results
+
+
+def _commit_chunk(chunk, owner_id):
+    """
+    Checks a chunk of cleaned leads against the contact index with one batched
+    lookup, then writes the new ones (clients, contact claims and a single
+    counter increment) in one batch.
+    """
+    store = get_datastore()
+    db = store.db
+
+    # 1. Bulk lookup of every contact in the chunk
+    index_refs = {contact: store.contacts.document(contact) for _, _, contacts in chunk for contact in contacts}
+    contact_by_doc_id = {ref.id: contact for contact, ref in index_refs.items()}
+    claimed = {
+        contact_by_doc_id[snapshot.id]
+        for snapshot in db.get_all(list(index_refs.values()))
+        if snapshot.exists
+    }
+
+    # 2. Queue the writes for leads whose contacts are all free
+    results = []
+    pending = []
+    batch = db.batch()
+    clients = store.clients.collection()
+    # One explicit dateLogged for the chunk, so its clients are counted in the
+    # month they are stored under (see stamp_date_logged()).
+    date_logged = datetime.datetime.now(datetime.timezone.utc)
+
+    for row_number, lead, contacts in chunk:
+        taken = next((contact for contact in contacts if contact in claimed), None)
+        if taken:
+            results.append({'row': row_number, 'status': 'duplicate', 'error': f'Contact {taken} already registered.'})
+            continue
+
+        client_ref = clients.document()
+        batch.set(client_ref, dict(lead, ownerId=owner_id, dateLogged=date_logged))
+        for contact in contacts:
+            # create() makes the whole batch fail if a contact was claimed meanwhile.
+            batch.create(index_refs[contact], {
+                'clientId': client_ref.id,
+                'ownerId': owner_id,
+                'created_at': firestore.SERVER_TIMESTAMP,
+            })
+        pending.append((row_number, lead, contacts, client_ref))
+
+    if not pending:
+        return results
+
+    increment_monthly_counter(batch, owner_id, period=period_for(date_logged), amount=len(pending))
+
+    # 3. Commit, or retry lead by lead if something changed underneath us
+    try:
+        batch.commit()
+    except Exception as e:
+        print(f"Import batch failed, retrying lead by lead: {e}", file=sys.stderr)
+        return results + _save_leads_one_by_one([item[:3] for item in pending], owner_id)
+
+    return results + [
+        {'row': row_number, 'status': 'created', 'id': client_ref.id}
+        for row_number, _, _, client_ref in pending
+    ]
+
+
+def import_client_leads(records, owner_id):
+    """
+    Imports client leads for one distributor from (row_number, record, error)
+    tuples such as those produced by iter_lead_records().
+
+    Every record goes through the same validation and normalization as
+    submit_client_lead. Contacts are deduplicated within the file and against
+    existing clients (one batched lookup per chunk), and new leads are written
+    with batched writes of at most MAX_BATCH_WRITES operations.
+
+    Returns:
+        dict: {'created': int, 'duplicate': int, 'invalid': int, 'error': int,
+               'rows': [{'row': n, 'status': ..., 'id' or 'error': ...}, ...]}
+    """
+    rows = []
+    seen_contacts = set()
+    chunk = []
+
+    for row_number, record, parse_error in records:
+        if parse_error:
+            rows.append({'row': row_number, 'status': 'invalid', 'error': parse_error})
+            continue
+
+        try:
+            lead = clean_client_lead(record)
+        except LeadValidationError as e:
+            rows.append({'row': row_number, 'status': 'invalid', 'error': str(e)})
+            continue
+
+        contacts = [contact for contact in (lead['contact1'], lead['contact2']) if contact]
+        repeated = next((contact for contact in contacts if contact in seen_contacts), None)
+        if repeated:
+            rows.append({'row': row_number, 'status': 'duplicate',
+                         'error': f'Contact {repeated} appears earlier in the file.'})
+            continue
+        seen_contacts.update(contacts)
+
+        chunk.append((row_number, lead, contacts))
+        if len(chunk) >= IMPORT_CHUNK_LEADS:
+            rows.extend(_commit_chunk(chunk, owner_id))
+            chunk = []
+
+    if chunk:
+        rows.extend(_commit_chunk(chunk, owner_id))
+
+    invalidate_monthly_aggregate()
+
+    # Rows are committed per chunk, so rejected ones were reported earlier; restore file order.
+    rows.sort(key=lambda row: row['row'])
+
+    summary = {'created': 0, 'duplicate': 0, 'invalid': 0, 'error': 0}
+    for row in rows:
+        summary[row['status']] += 1
+    summary['rows'] = rows
+    return summary
@@ -0,0 +1,280 @@
+import datetime
+import itertools
+
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from .datastore import MAX_BATCH_WRITES, get_datastore
+from .monthly_aggregate_utility import period_for
+from .monthly_counter_utility import increment_monthly_counter
+
+
+class DuplicateContactError(Exception):
+    """Raised when a contact is already claimed by another client lead."""
+
+    def __init__(self, contact):
+        super().__init__(f"Contact already registered with another client: {contact}")
+        self.contact = contact
+
+
+class LeadValidationError(Exception):
+    """Raised when submitted lead data fails the server-side validation."""
+
+
+def normalize_contact(raw_value):
+    """Normalizes a phone number or email for storage and uniqueness checks (None if empty)."""
+    return str(raw_value).strip().lower() if raw_value else None
+
+
+def clean_client_lead(data):
+    """
+    Extracts, normalizes and validates the lead fields of a submitted record
+    (keys fullName, contact1, contact2, initialNotes).
+
+    Raises:
+        LeadValidationError: With the message to show to the user.
+
+    Returns:
+        dict: The cleaned fields, with contact2 set to None when not provided.
+    """
+    # Extract and clean data
+    full_name = str(data.get('fullName') or '').strip()
+    initial_notes = str(data.get('initialNotes') or '').strip()
+
+    # --- FIX: Safely normalize contact_1 (Required) ---
+    contact_1 = normalize_contact(data.get('contact1'))
+
+    # --- FIX: Safely normalize contact_2 (Optional) ---
+    contact_2 = normalize_contact(data.get('contact2'))
+
+    # Basic Server-side Data Validation
+    if not full_name or len(full_name) < 3:
+        raise LeadValidationError('Full name required.')
+
+    if not contact_1 or len(contact_1) < 5:
+        raise LeadValidationError('Primary contact required and must be valid.')
+
+    if contact_2 and contact_1 == contact_2:
+        raise LeadValidationError('Contacts cannot be identical.')
+
+    # If the optional contact_2 was just an empty string and became None, we treat it as valid.
+    if contact_2 == "":
+        contact_2 = None
+
+    return {
+        'fullName': full_name,
+        'contact1': contact_1,
+        'contact2': contact_2,
+        'initialNotes': initial_notes,
+    }
+
+
+def stamp_date_logged(client_data):
+    """
+    Returns (client_data, period): the client with an explicit dateLogged (now,
+    in UTC, in place of SERVER_TIMESTAMP or a missing one) and the 'YYYY-MM'
+    period it falls in. SERVER_TIMESTAMP is only resolved on Firestore's clock
+    at commit, so around midnight at a month's end a lead could be stored
+    under one month and counted under the other.
+    """
+    date_logged = client_data.get('dateLogged')
+    if date_logged is None or date_logged is firestore.SERVER_TIMESTAMP:
+        date_logged = datetime.datetime.now(datetime.timezone.utc)
+        client_data = dict(client_data, dateLogged=date_logged)
+    return client_data, period_for(date_logged)
+
+
+def contact_is_claimed(contact):
+    """
+    Single point lookup of a normalized contact in the contact index, or in
+    the live replica's contact index when it is warm. Either way this is only
+    a pre-check: save_client_lead() enforces uniqueness transactionally.
+    """
+    from .replica import get_client_replica
+    replica = get_client_replica()
+    if replica is not None:
+        return replica.client_for_contact(contact) is not None
+    return get_datastore().contacts.document(contact).get().exists
+
+
+async def acontact_is_claimed(contact):
+    """Async contact_is_claimed()."""
+    from .replica import get_client_replica
+    replica = get_client_replica()
+    if replica is not None:
+        return replica.client_for_contact(contact) is not None
+    return (await get_datastore().aio.contacts.document(contact).get()).exists
+
+
+def save_client_lead(owner_id, client_data):
+    """
+    Saves a client lead and claims its contacts in one Firestore transaction:
+    the client document, one contact index document per contact and the
+    owner's monthly counter increment either all commit or none do, so two
+    concurrent submissions can never register the same contact.
+
+    Raises:
+        DuplicateContactError: A contact is already in the index.
+
+    Returns:
+        The new client's DocumentReference.
+    """
+    store = get_datastore()
+    client_data, period = stamp_date_logged(client_data)
+    contacts = [c for c in (client_data.get('contact1'), client_data.get('contact2')) if c]
+    client_ref = store.clients.collection().document()
+
+    def claim_and_save(transaction):
+        # All reads must happen before the first write in a transaction.
+        index_refs = [store.contacts.document(contact) for contact in contacts]
+        for contact, index_ref in zip(contacts, index_refs):
+            if index_ref.get(transaction=transaction).exists:
+                raise DuplicateContactError(contact)
+
+        transaction.set(client_ref, client_data)
+        for index_ref in index_refs:
+            # create() fails if the document appeared meanwhile, so the claim is hard.
+            transaction.create(index_ref, {
+                'clientId': client_ref.id,
+                'ownerId': owner_id,
+                'created_at': firestore.SERVER_TIMESTAMP,
+            })
+        increment_monthly_counter(transaction, owner_id, period=period)
+
+    store.run_transaction(claim_and_save)
+    return client_ref
+
+
+async def asave_client_lead(owner_id, client_data):
+    """
+    Async save_client_lead(): the same transaction on the async client, so the
+    contact claims are awaited instead of holding a thread.
+
+    Raises:
+        DuplicateContactError: A contact is already in the index.
+
+    Returns:
+        The new client's AsyncDocumentReference.
+    """
+    store = get_datastore()
+    repositories = store.aio
+    client_data, period = stamp_date_logged(client_data)
+    contacts = [c for c in (client_data.get('contact1'), client_data.get('contact2')) if c]
+    client_ref = repositories.clients.collection().document()
+
+    async def claim_and_save(transaction):
+        index_refs = [repositories.contacts.document(contact) for contact in contacts]
+        for contact, index_ref in zip(contacts, index_refs):
+            if (await index_ref.get(transaction=transaction)).exists:
+                raise DuplicateContactError(contact)
+
+        transaction.set(client_ref, client_data)
+        for index_ref in index_refs:
+            transaction.create(index_ref, {
+                'clientId': client_ref.id,
+                'ownerId': owner_id,
+                'created_at': firestore.SERVER_TIMESTAMP,
+            })
+        increment_monthly_counter(transaction, owner_id, period=period, repositories=repositories)
+
+    await store.arun_transaction(claim_and_save)
+    return client_ref
+
+
+# Clients per contact index batch: each claims at most two contacts.
+CONTACT_INDEX_CHUNK = MAX_BATCH_WRITES // 2
+
+# Times a chunk is re-read when a live submission claims one of its contacts
+# between our read and commit
+_INDEX_CHUNK_ATTEMPTS = 3
+
+
+def _contact_conflict(contact, client_id, owner_id, claimed_by):
+    return {'contact': contact, 'clientId': client_id, 'ownerId': owner_id, 'claimedBy': claimed_by}
+
+
+def _index_chunk(store, chunk):
+    """
+    Claims the unindexed contacts of a chunk of (clientId, client) pairs with
+    create() in one batch, after reading their index entries in one call.
+
+    Raises:
+        AlreadyExists: A contact was claimed after it was read; nothing was written.
+
+    Returns:
+        tuple: (indexed, already_indexed, conflicts)
+    """
+    # Contact -> (clientId, ownerId) of the first client of the chunk that has it
+    wanted = {}
+    conflicts = []
+    for client_id, client in chunk:
+        for field in ('contact1', 'contact2'):
+            contact = normalize_contact(client.get(field))
+            if not contact:
+                continue
+            if contact in wanted and wanted[contact][0] != client_id:
+                conflicts.append(_contact_conflict(contact, client_id, client.get('ownerId'), wanted[contact][0]))
+                continue
+            wanted.setdefault(contact, (client_id, client.get('ownerId')))
+
+    refs = {contact: store.contacts.document(contact) for contact in wanted}
+    claims = {}
+    if refs:
+        claims = {snapshot.id: snapshot.to_dict() for snapshot in store.db.get_all(list(refs.values()))
+                  if snapshot.exists}
+
+    batch = store.db.batch()
+    indexed = already_indexed = 0
+    for contact, (client_id, owner_id) in wanted.items():
+        claim = claims.get(refs[contact].id)
+        if claim is None:
+            # create() fails if the contact was claimed meanwhile, so no claim is overwritten.
+            batch.create(refs[contact], {
+                'clientId': client_id,
+                'ownerId': owner_id,
+                'created_at': firestore.SERVER_TIMESTAMP,
+            })
+            indexed += 1
+        elif claim.get('clientId') == client_id:
+            already_indexed += 1
+        else:
+            conflicts.append(_contact_conflict(contact, client_id, owner_id, claim.get('clientId')))
+    if len(batch):
+        batch.commit()
+
+    return indexed, already_indexed, conflicts
+
+
+def build_contact_index():
+    """
+    Builds (or tops up) the contact index from the existing clients, a chunk
+    of CONTACT_INDEX_CHUNK clients at a time: the chunk's index entries are
+    read with one get_all() and only the missing ones are claimed, with
+    create(). Existing claims, including those of live submissions, are never
+    overwritten, so it is safe to re-run. A contact already claimed by another
+    client is reported as a conflict and left alone.
+
+    Returns:
+        dict: {'clients': int, 'indexed': int, 'already_indexed': int,
+               'conflicts': [{'contact', 'clientId', 'ownerId', 'claimedBy'}, ...]}
+    """
+    store = get_datastore()
+    result = {'clients': 0, 'indexed': 0, 'already_indexed': 0, 'conflicts': []}
+    docs = store.clients.collection().select(store.clients.CONTACT_FIELDS).stream()
+
+    while True:
+        chunk = [(doc.id, doc.to_dict()) for doc in itertools.islice(docs, CONTACT_INDEX_CHUNK)]
+        if not chunk:
+            return result
+        result['clients'] += len(chunk)
+
+        for attempt in range(_INDEX_CHUNK_ATTEMPTS):
+            try:
+                indexed, already_indexed, conflicts = _index_chunk(store, chunk)
+                break
+            except AlreadyExists:
+                if attempt == _INDEX_CHUNK_ATTEMPTS - 1:
+                    raise
+        result['indexed'] += indexed
+        result['already_indexed'] += already_indexed
+        result['conflicts'] += conflicts
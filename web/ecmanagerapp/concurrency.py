@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+
+_executor = None
+_query_executor = None
+_background_executor = None
+_refresh_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the bounded, process-wide thread pool used to fan out dashboard
+    loaders. Size comes from settings.DASHBOARD_LOADER_WORKERS (default 8).
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'DASHBOARD_LOADER_WORKERS', 8),
+                    thread_name_prefix='dashboard-loader',
+                )
+    return _executor
+
+
+def get_query_executor():
+    """
+    Returns the thread pool used to issue independent Firestore queries in
+    parallel from inside a loader (settings.QUERY_FANOUT_WORKERS, default 16).
+    It is separate from the loader pool so nested fan-out cannot deadlock it.
+    """
+    global _query_executor
+    if _query_executor is None:
+        with _executor_lock:
+            if _query_executor is None:
+                _query_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'QUERY_FANOUT_WORKERS', 16),
+                    thread_name_prefix='firestore-query',
+                )
+    return _query_executor
+
+
+def get_background_executor():
+    """
+    Returns the thread pool for background jobs that outlive the request that
+    started them (settings.BACKGROUND_JOB_WORKERS, default 2). Jobs run in a
+    fresh context, so their Firestore calls count as background work.
+    """
+    global _background_executor
+    if _background_executor is None:
+        with _executor_lock:
+            if _background_executor is None:
+                _background_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_JOB_WORKERS', 2),
+                    thread_name_prefix='background-job',
+                )
+    return _background_executor
+
+
+def get_refresh_executor():
+    """
+    Returns the single thread that runs background cache refreshes
+    (TTLCache.get_or_refresh()). Refreshes are single-flight per key and may
+    be slow, so they are kept off the loader pool, where they would take a
+    slot from the dashboard loaders that triggered them.
+    """
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cache-refresh')
+    return _refresh_executor
+
+
+def run_parallel(*calls):
+    """
+    Runs zero-argument callables concurrently and returns their results in
+    order. The first exception raised by any call is re-raised. Each call runs
+    in a copy of the caller's context, so per-request accounting follows it.
+    """
+    futures = [get_query_executor().submit(contextvars.copy_context().run, call) for call in calls]
+    return [future.result() for future in futures]
+
+
+class Loader:
+    """
+    One unit of dashboard work: `func(*args)`, with the value to use instead
+    when it fails or does not finish within `timeout` seconds.
+    """
+
+    def __init__(self, func, *args, fallback=None, timeout=None):
+        self.func = func
+        self.args = args
+        self.fallback = fallback
+        self.timeout = timeout
+
+
+def run_loaders(loaders, timeout=None):
+    """
+    Runs every loader concurrently on the shared pool and waits for them, so
+    the total latency is the slowest loader rather than the sum of all.
+
+    Args:
+        loaders (dict): name -> Loader.
+        timeout (float): default per-loader timeout in seconds, measured from
+            the moment the loaders are submitted. Defaults to
+            settings.DASHBOARD_LOADER_TIMEOUT (10 seconds).
+
+    Returns:
+        tuple: (results, failed) where results maps every name to its value
+        (or its fallback) and failed lists the names that errored or timed out.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'DASHBOARD_LOADER_TIMEOUT', 10)
+
+    executor = get_executor()
+    started = time.monotonic()
+    # Each loader runs in a copy of the request's context (see instrumentation.py).
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, loader.func, *loader.args)
+        for name, loader in loaders.items()
+    }
+
+    results = {}
+    failed = []
+    for name, future in futures.items():
+        loader = loaders[name]
+        loader_timeout = loader.timeout if loader.timeout is not None else timeout
+        remaining = max(0.0, started + loader_timeout - time.monotonic())
+        try:
+            results[name] = future.result(timeout=remaining)
+        except TimeoutError:
+            # The worker keeps running in the background; we just stop waiting.
+            print(f"Dashboard loader '{name}' timed out after {loader_timeout}s", file=sys.stderr)
+            results[name] = loader.fallback
+            failed.append(name)
+        except Exception as e:
+            print(f"Dashboard loader '{name}' failed: {e}", file=sys.stderr)
+            results[name] = loader.fallback
+            failed.append(name)
+
+    return results, failed
+
+
+async def arun_loaders(loaders, timeout=None):
+    """
+    run_loaders() for async views: every Loader.func is a coroutine function,
+    awaited concurrently on the running event loop instead of the thread pool.
+    Same arguments, fallbacks and return value.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'DASHBOARD_LOADER_TIMEOUT', 10)
+
+    async def run(name, loader):
+        loader_timeout = loader.timeout if loader.timeout is not None else timeout
+        try:
+            return await asyncio.wait_for(loader.func(*loader.args), loader_timeout), False
+        except asyncio.TimeoutError:
+            print(f"Dashboard loader '{name}' timed out after {loader_timeout}s", file=sys.stderr)
+        except Exception as e:
+            print(f"Dashboard loader '{name}' failed: {e}", file=sys.stderr)
+        return loader.fallback, True
+
+    outcomes = await asyncio.gather(*(run(name, loader) for name, loader in loaders.items()))
+
+    results = {}
+    failed = []
+    for name, (value, did_fail) in zip(loaders, outcomes):
+        results[name] = value
+        if did_fail:
+            failed.append(name)
+    return results, failed
@@ -0,0 +1,34 @@
+from asgiref.sync import async_to_sync
+from channels.generic.websocket import JsonWebsocketConsumer
+
+from .dashboard_push_utility import ADMIN_GROUP, LEADERBOARD_GROUP, employee_group
+
+
+class DashboardConsumer(JsonWebsocketConsumer):
+    """
+    WebSocket feed of a dashboard. Logged-in users (same session as the HTTP
+    views) join the leaderboard group plus either the admin group or their own
+    employee group, and receive the events sent by publish_new_leads().
+    """
+
+    def connect(self):
+        user = self.scope.get('session', {}).get('user')
+        if not user or 'uid' not in user:
+            self.close()
+            return
+
+        if user.get('role') == 'admin':
+            self.groups = [ADMIN_GROUP, LEADERBOARD_GROUP]
+        else:
+            self.groups = [employee_group(user['uid']), LEADERBOARD_GROUP]
+
+        for group in self.groups:
+            async_to_sync(self.channel_layer.group_add)(group, self.channel_name)
+        self.accept()
+
+    def disconnect(self, code):
+        for group in getattr(self, 'groups', []):
+            async_to_sync(self.channel_layer.group_discard)(group, self.channel_name)
+
+    def dashboard_event(self, event):
+        self.send_json(event['payload'])
@@ -0,0 +1,127 @@
+import datetime
+import sys
+import threading
+
+import pytz
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from .client_data_utility import format_date_logged
+from .distributor_data_utility import aget_distributor_map, get_distributor_map
+from .employee_leader_board_data_utility import aget_monthly_leaderboard, get_monthly_leaderboard
+
+# Channel layer groups joined by DashboardConsumer
+ADMIN_GROUP = 'dashboard.admins'
+LEADERBOARD_GROUP = 'dashboard.leaderboard'
+
+# Last leaderboard pushed by this process, so unchanged rankings are not re-sent.
+# The dedupe is per process: with several workers, each one pushes the ranking
+# the first time it sees it, so a dashboard may receive the same leaderboard
+# more than once. That is harmless, as the client replaces the list wholesale.
+_last_leaderboard = None
+_leaderboard_lock = threading.Lock()
+
+
+def employee_group(uid):
+    """Channel layer group of one employee's dashboards."""
+    return f'dashboard.employee.{uid}'
+
+
+def _send(group, payload):
+    async_to_sync(get_channel_layer().group_send)(group, {'type': 'dashboard.event', 'payload': payload})
+
+
+async def _asend(group, payload):
+    await get_channel_layer().group_send(group, {'type': 'dashboard.event', 'payload': payload})
+
+
+def _lead_payloads(owner_id, count, clients, distributor_name):
+    """(owner payload, admin payload) announcing newly saved leads."""
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+    logged = format_date_logged(None, local_tz, datetime.datetime.now(local_tz))
+    rows = [dict(client, date_logged_formatted=logged) for client in clients]
+    kpi_delta = {'total': count, 'month': count}
+
+    owner_payload = {'event': 'new_lead', 'clients': rows, 'kpi_delta': kpi_delta}
+    admin_payload = {
+        'event': 'new_lead',
+        'clients': [dict(row, distributor_name=distributor_name) for row in rows],
+        'kpi_delta': kpi_delta,
+    }
+    return owner_payload, admin_payload
+
+
+def _leaderboard_payload(leaderboard):
+    """Leaderboard payload, or None when the ranking and counts did not move since the last push."""
+    global _last_leaderboard
+    with _leaderboard_lock:
+        if leaderboard == _last_leaderboard:
+            return None
+        _last_leaderboard = leaderboard
+
+    top = leaderboard[0] if leaderboard else {'name': 'N/A', 'count': 0}
+    return {
+        'event': 'leaderboard',
+        'html': render_to_string('leaderboard_list.html', {'leaderboard_list': leaderboard}),
+        'top_distributor': top['name'],
+        'top_distributor_count': top['count'],
+    }
+
+
+def _push_new_leads(owner_id, count, clients):
+    # 1. The owner's dashboards: new rows plus their own KPI deltas
+    # 2. Admin dashboards: the same rows with the distributor's name
+    distributor_name = get_distributor_map().get(owner_id, owner_id)
+    owner_payload, admin_payload = _lead_payloads(owner_id, count, clients, distributor_name)
+    _send(employee_group(owner_id), owner_payload)
+    _send(ADMIN_GROUP, admin_payload)
+
+    # 3. Everyone: the leaderboard, only when the ranking or counts moved.
+    # The monthly aggregate was invalidated by the write path, so this is one counter read.
+    leaderboard_payload = _leaderboard_payload(get_monthly_leaderboard())
+    if leaderboard_payload is not None:
+        _send(LEADERBOARD_GROUP, leaderboard_payload)
+
+
+def publish_new_leads(owner_id, count=1, clients=()):
+    """
+    Pushes newly saved leads to the connected dashboards over the channel
+    layer: the rows and KPI deltas to the owner and to admins, and the monthly
+    leaderboard to everyone when it changed since this process last pushed it.
+    A push failure is logged and never fails the save.
+
+    This runs on the request thread rather than the worker pool: under ASGI,
+    async_to_sync then hands the sends to the server's event loop, which the
+    in-memory channel layer requires.
+
+    Args:
+        owner_id (str): UID of the distributor who logged the leads.
+        count (int): Number of leads saved.
+        clients (iterable): Display fields (id, fullName, contact1) of the
+            saved leads; may be empty for bulk imports.
+    """
+    if get_channel_layer() is None:
+        return
+    try:
+        _push_new_leads(owner_id, count, list(clients))
+    except Exception as e:
+        print(f"Dashboard Push Error: {e}", file=sys.stderr)
+
+
+async def apublish_new_leads(owner_id, count=1, clients=()):
+    """publish_new_leads() for async views: the sends are awaited on the running loop."""
+    if get_channel_layer() is None:
+        return
+    try:
+        distributor_name = (await aget_distributor_map()).get(owner_id, owner_id)
+        owner_payload, admin_payload = _lead_payloads(owner_id, count, list(clients), distributor_name)
+        await _asend(employee_group(owner_id), owner_payload)
+        await _asend(ADMIN_GROUP, admin_payload)
+
+        leaderboard_payload = _leaderboard_payload(await aget_monthly_leaderboard())
+        if leaderboard_payload is not None:
+            await _asend(LEADERBOARD_GROUP, leaderboard_payload)
+    except Exception as e:
+        print(f"Dashboard Push Error: {e}", file=sys.stderr)
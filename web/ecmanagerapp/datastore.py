@@ -0,0 +1,520 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+
+from django.conf import settings
+
+from .instrumentation import instrumented, record_rpc
+
+
+def get_app_id():
+    """
+    Returns the Firebase web app ID used to build the public data paths.
+    Falls back to 'default-app-id' when the setting is missing (local runs).
+    """
+    return getattr(settings, 'FIREBASE_WEB_APP_ID', None) or 'default-app-id'
+
+
+_firebase_lock = threading.Lock()
+
+
+def get_firebase_app():
+    """
+    Returns the default Firebase Admin app, initializing it on first use
+    (thread-safe) from settings.FIREBASE_CREDENTIALS_FILE, or from Application
+    Default Credentials when that file does not exist.
+    """
+    import firebase_admin
+    from firebase_admin import credentials
+
+    with _firebase_lock:
+        try:
+            return firebase_admin.get_app()
+        except ValueError:
+            pass
+        path = getattr(settings, 'FIREBASE_CREDENTIALS_FILE', None)
+        if path and os.path.exists(path):
+            return firebase_admin.initialize_app(credentials.Certificate(path))
+        return firebase_admin.initialize_app()
+
+
+# Firestore allows at most 500 writes per batch or transaction.
+MAX_BATCH_WRITES = 500
+
+
+def count_documents(query, transaction=None):
+    """
+    Counts the documents matching a query with a server-side count()
+    aggregation, billed per 1000 index entries instead of per document.
+    Pass `transaction` to count as part of a transaction's reads.
+    """
+    return int(query.count().get(transaction=transaction)[0][0].value)
+
+
+async def acount_documents(query):
+    """count_documents() for a query built on the async client (store.aio)."""
+    return int((await query.count().get())[0][0].value)
+
+
+class ClientRepository:
+    """
+    Access to the public 'clients' collection
+    (/artifacts/{appId}/public/data/clients).
+
+    Read paths pass one of the *_FIELDS lists to query.select() so Firestore
+    only returns (and we only deserialize) the fields they use.
+    """
+
+    # Every field of a client document, for full listings and exports
+    DISPLAY_FIELDS = ['ownerId', 'fullName', 'contact1', 'contact2', 'initialNotes', 'dateLogged']
+    # What the employee dashboard table shows
+    LIST_FIELDS = ['fullName', 'contact1', 'dateLogged']
+    # What the per-distributor tallies need
+    OWNER_FIELDS = ['ownerId']
+    # What the contact index is built from
+    CONTACT_FIELDS = ['ownerId', 'contact1', 'contact2']
+
+    def __init__(self, store):
+        self.store = store
+
+    @property
+    def path(self):
+        return f'artifacts/{get_app_id()}/public/data/clients'
+
+    def collection(self):
+        return self.store.db.collection(self.path)
+
+    def owned_by(self, owner_id):
+        """Query for every client logged by the given distributor UID."""
+        return self.collection().where('ownerId', '==', owner_id)
+
+    def logged_between(self, start_utc, end_utc, owner_id=None):
+        """
+        Query for clients whose dateLogged falls in [start_utc, end_utc),
+        optionally only those of one owner (needs an ownerId+dateLogged index).
+        """
+        query = self.owned_by(owner_id) if owner_id else self.collection()
+        return query \
+            .where('dateLogged', '>=', start_utc) \
+            .where('dateLogged', '<', end_utc)
+
+    def logged_since(self, start_utc):
+        """Query for clients whose dateLogged is start_utc or later."""
+        return self.collection().where('dateLogged', '>=', start_utc)
+
+    def page(self, page_size, owner_id=None, descending=True, cursor=None, offset=0):
+        """
+        Query for one page of clients ordered by dateLogged. `cursor` is the ID
+        of the last client of the previous page; without one, `offset` documents
+        are skipped instead (billed as reads, so only used for random jumps).
+        Filtering by owner and ordering by date needs a composite index
+        (ownerId ASC, dateLogged DESC/ASC) in Firestore.
+        """
+        from firebase_admin import firestore
+
+        query = self.owned_by(owner_id) if owner_id else self.collection()
+        direction = firestore.Query.DESCENDING if descending else firestore.Query.ASCENDING
+        query = query.order_by('dateLogged', direction=direction)
+
+        if cursor:
+            # start_after only needs the ordering field of the cursor document.
+            snapshot = self.collection().document(cursor).get(field_paths=['dateLogged'])
+            if snapshot.exists:
+                return query.start_after(snapshot).limit(page_size)
+        if offset:
+            query = query.offset(offset)
+        return query.limit(page_size)
+
+    def add(self, client_data):
+        """Adds a client document and returns (update_time, doc_ref)."""
+        return self.collection().add(client_data)
+
+
+class DistributorRepository:
+    """
+    Access to the public 'distributors' collection, keyed by Firebase Auth UID
+    (/artifacts/{appId}/public/data/distributors).
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @property
+    def path(self):
+        return f'artifacts/{get_app_id()}/public/data/distributors'
+
+    def collection(self):
+        return self.store.db.collection(self.path)
+
+    def document(self, uid):
+        return self.collection().document(uid)
+
+    def get(self, uid):
+        return self.document(uid).get()
+
+    def set(self, uid, data):
+        return self.document(uid).set(data)
+
+    def delete(self, uid):
+        return self.document(uid).delete()
+
+    def all(self):
+        return self.collection().get()
+
+
+class MonthlyCounterRepository:
+    """
+    Pre-aggregated client counts per month and distributor, maintained at write
+    time. Each (month, ownerId) pair is split over several shard documents
+    (/artifacts/{appId}/public/data/monthly_counters/{YYYY-MM}/shards/{ownerId}_{n})
+    so busy distributors do not contend on a single document.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def shards(self, period):
+        return self.store.db.collection(
+            f'artifacts/{get_app_id()}/public/data/monthly_counters/{period}/shards')
+
+    def shard(self, period, owner_id, shard_index):
+        return self.shards(period).document(f'{owner_id}_{shard_index}')
+
+
+class RollupRepository:
+    """
+    Client counts of closed periods, one document per period holding every
+    distributor's count
+    (/artifacts/{appId}/public/data/rollups/{day|week|month}/periods/{key}).
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def periods(self, granularity):
+        return self.store.db.collection(f'artifacts/{get_app_id()}/public/data/rollups/{granularity}/periods')
+
+    def document(self, granularity, key):
+        return self.periods(granularity).document(key)
+
+
+class KpiStateRepository:
+    """
+    Persisted running aggregates of the admin KPIs and the dateLogged
+    watermark they were folded up to
+    (/artifacts/{appId}/public/data/kpi_state/{name}).
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def document(self, name):
+        return self.store.db.collection(f'artifacts/{get_app_id()}/public/data/kpi_state').document(name)
+
+
+class ContactIndexRepository:
+    """
+    Uniqueness index of client contacts: one document per normalized phone
+    number or email, keyed by the value itself
+    (/artifacts/{appId}/public/data/client_contacts/{contact}).
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def collection(self):
+        return self.store.db.collection(f'artifacts/{get_app_id()}/public/data/client_contacts')
+
+    def document(self, contact):
+        # Document IDs cannot contain '/', so escape it (and '%', to stay reversible).
+        return self.collection().document(contact.replace('%', '%25').replace('/', '%2F'))
+
+
+class ArchivedClientRepository:
+    """
+    Clients taken out of circulation when their distributor was deleted
+    (/artifacts/{appId}/public/data/archived_clients/{clientId}). Documents
+    keep every client field plus archivedAt and archivedFrom.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def collection(self):
+        return self.store.db.collection(f'artifacts/{get_app_id()}/public/data/archived_clients')
+
+    def document(self, client_id):
+        return self.collection().document(client_id)
+
+
+class DeletionJobRepository:
+    """
+    Progress of employee deletions and the cascade over their clients
+    (/artifacts/{appId}/public/data/employee_deletions/{jobId}).
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def collection(self):
+        return self.store.db.collection(f'artifacts/{get_app_id()}/public/data/employee_deletions')
+
+    def document(self, job_id=None):
+        return self.collection().document(job_id)
+
+
+class UserRepository:
+    """Access to Firebase Authentication user records."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def iterate_all(self):
+        return self.store.auth.list_users().iterate_all()
+
+    def create(self, email, password, display_name=None):
+        return self.store.auth.create_user(email=email, password=password, display_name=display_name)
+
+    def delete(self, uid):
+        return self.store.auth.delete_user(uid)
+
+    def delete_many(self, uids):
+        """Deletes up to 1000 users in one call; returns an auth.DeleteUsersResult."""
+        return self.store.auth.delete_users(uids)
+
+    def verify_id_token(self, id_token):
+        return self.store.auth.verify_id_token(id_token)
+
+
+class _Repositories:
+
+    def _build_repositories(self):
+        self.clients = ClientRepository(self)
+        self.distributors = DistributorRepository(self)
+        self.monthly_counters = MonthlyCounterRepository(self)
+        self.rollups = RollupRepository(self)
+        self.kpi_state = KpiStateRepository(self)
+        self.contacts = ContactIndexRepository(self)
+        self.archived_clients = ArchivedClientRepository(self)
+        self.deletion_jobs = DeletionJobRepository(self)
+        self.users = UserRepository(self)
+
+
+class AsyncRepositories(_Repositories):
+    """
+    The repositories of a DataStore built on its async Firestore client
+    (store.aio): queries and references come from google.cloud.firestore's
+    AsyncClient, so get()/commit() are awaited and stream() is iterated with
+    `async for`. Auth has no async API; `users` calls stay blocking.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._build_repositories()
+
+    @property
+    def db(self):
+        return self.store.async_db
+
+    @property
+    def auth(self):
+        return self.store.auth
+
+
+class DataStore(_Repositories):
+    """
+    Interface for the app's data access. Subclasses provide `_db_client()` (a
+    Firestore compatible client), `_async_db_client()` (its AsyncClient
+    counterpart) and `_auth_module()` (a firebase_admin.auth compatible
+    object); `db`, `async_db` and `auth` hand them out wrapped for per-request
+    RPC accounting (see instrumentation.py). Views and utilities only talk to
+    the repositories built on top of them, `store.aio` for async code.
+    """
+
+    def __init__(self):
+        self._build_repositories()
+        self.aio = AsyncRepositories(self)
+
+    def _db_client(self):
+        raise NotImplementedError
+
+    def _async_db_client(self):
+        raise NotImplementedError
+
+    def _auth_module(self):
+        raise NotImplementedError
+
+    @property
+    def db(self):
+        return instrumented(self._db_client(), 'firestore')
+
+    @property
+    def async_db(self):
+        return instrumented(self._async_db_client(), 'firestore')
+
+    @property
+    def auth(self):
+        return instrumented(self._auth_module(), 'auth')
+
+    def run_transaction(self, func, read_only=False):
+        """
+        Calls `func(transaction)` inside a Firestore transaction and commits it.
+        Reads must go through the transaction (ref.get(transaction=...)) and
+        writes through transaction.set/create/update/delete. A `read_only`
+        transaction takes no locks, so it never holds up writers, and reads
+        one consistent snapshot; it rejects writes.
+        """
+        raise NotImplementedError
+
+    async def arun_transaction(self, func):
+        """
+        Async run_transaction(): awaits `func(transaction)`, a coroutine
+        function, inside a transaction of the async client. Reads go through
+        the transaction (await ref.get(transaction=...)); transaction.get() is
+        an async iterator, not an awaitable. Writes are queued as usual.
+        """
+        raise NotImplementedError
+
+
+class FirebaseDataStore(DataStore):
+    """Production datastore backed by Cloud Firestore and Firebase Auth."""
+
+    def __init__(self):
+        super().__init__()
+        self._db = None
+        self._auth = None
+        self._lock = threading.Lock()
+        # gRPC async channels belong to the event loop they were opened on,
+        # so each loop (normally one per worker) gets its own AsyncClient.
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def _db_client(self):
+        # One client (and gRPC channel) per process, created on first use so
+        # importing the app does not initialize Firebase or open a connection.
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    from firebase_admin import firestore
+                    self._db = firestore.client(app=get_firebase_app())
+        return self._db
+
+    def _async_db_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from google.cloud import firestore as cloud_firestore
+            app = get_firebase_app()
+            client = cloud_firestore.AsyncClient(credentials=app.credential.get_credential(), project=app.project_id)
+            self._async_clients[loop] = client
+        return client
+
+    def _auth_module(self):
+        if self._auth is None:
+            from firebase_admin import auth
+            get_firebase_app()
+            self._auth = auth
+        return self._auth
+
+    def run_transaction(self, func, read_only=False):
+        from firebase_admin import firestore
+
+        started = time.perf_counter()
+        try:
+            # Retried automatically on contention; an exception from func rolls back.
+            return firestore.transactional(lambda transaction: func(instrumented(transaction, 'firestore')))(
+                self._db_client().transaction(read_only=read_only))
+        finally:
+            # Begin/commit round trips (and retries); reads inside are recorded on their own.
+            record_rpc('firestore', 'transaction', time.perf_counter() - started)
+
+    async def arun_transaction(self, func):
+        from google.cloud.firestore_v1.async_transaction import async_transactional
+
+        started = time.perf_counter()
+        try:
+            return await async_transactional(lambda transaction: func(instrumented(transaction, 'firestore')))(
+                self._async_db_client().transaction())
+        finally:
+            record_rpc('firestore', 'transaction', time.perf_counter() - started)
+
+
+class MemoryDataStore(DataStore):
+    """
+    Local stand-in backed by in-memory Firestore and Auth implementations.
+    Used for profiling and tests; data only lives as long as the process.
+    """
+
+    def __init__(self):
+        super().__init__()
+        from .memory_store import MemoryAsyncFirestoreClient, MemoryAuth, MemoryFirestoreClient
+        self._db = MemoryFirestoreClient()
+        self._async_db = MemoryAsyncFirestoreClient(self._db)
+        self._auth = MemoryAuth()
+
+    def _db_client(self):
+        return self._db
+
+    def _async_db_client(self):
+        return self._async_db
+
+    def _auth_module(self):
+        return self._auth
+
+    def run_transaction(self, func, read_only=False):
+        from .memory_store import MemoryTransaction
+        # Holding the store lock serializes transactions, like Firestore's locking.
+        with self._db._lock:
+            transaction = MemoryTransaction(self._db, read_only=read_only)
+            result = func(instrumented(transaction, 'firestore'))
+            started = time.perf_counter()
+            try:
+                transaction.commit()
+            finally:
+                record_rpc('firestore', 'transaction', time.perf_counter() - started)
+        return result
+
+    async def arun_transaction(self, func):
+        from .memory_store import MemoryAsyncTransaction, MemoryTransaction
+        # In-memory calls never suspend, so holding the (thread) lock across
+        # the awaits still keeps other transactions out.
+        with self._db._lock:
+            transaction = MemoryAsyncTransaction(MemoryTransaction(self._db))
+            result = await func(instrumented(transaction, 'firestore'))
+            started = time.perf_counter()
+            try:
+                await transaction.commit()
+            finally:
+                record_rpc('firestore', 'transaction', time.perf_counter() - started)
+        return result
+
+
+DATASTORE_BACKENDS = {
+    'firebase': FirebaseDataStore,
+    'memory': MemoryDataStore,
+}
+
+_datastore = None
+
+
+def get_datastore():
+    """
+    Returns the process-wide datastore, building it on first use from
+    settings.ECMANAGER_DATASTORE ('firebase' by default, or 'memory').
+    """
+    global _datastore
+    if _datastore is None:
+        backend = getattr(settings, 'ECMANAGER_DATASTORE', 'firebase')
+        _datastore = DATASTORE_BACKENDS[backend]()
+    return _datastore
+
+
+def set_datastore(store):
+    """Replaces the process-wide datastore (e.g. with a seeded MemoryDataStore)."""
+    global _datastore
+    _datastore = store
+
+    # A live replica listens to the previous store; it restarts on next use.
+    from .replica import reset_client_replica
+    reset_client_replica()
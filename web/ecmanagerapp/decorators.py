@@ -1,6 +1,21 @@
+import math
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect
 
+from .throttling import (
+    aacquire_slot, aconsume, acquire_slot, arelease_slot, client_ip, consume, record_throttled, release_slot,
+)
+
 def firebase_login_required(view_func):
+    if iscoroutinefunction(view_func):
+        async def wrapper(request, *args, **kwargs):
+            if await request.session.aget("user") is None:
+                return redirect("login_form")
+            return await view_func(request, *args, **kwargs)
+        return markcoroutinefunction(wrapper)
+
     def wrapper(request, *args, **kwargs):
         if "user" not in request.session:
             return redirect("login_form")
@@ -9,9 +24,104 @@ def firebase_login_required(view_func):
 
 
 def admin_required(view_func):
+    if iscoroutinefunction(view_func):
+        async def wrapper(request, *args, **kwargs):
+            user = await request.session.aget("user")
+            if not user or user.get("role") != "admin":
+                return redirect("employee_dashboard")
+            return await view_func(request, *args, **kwargs)
+        return markcoroutinefunction(wrapper)
+
     def wrapper(request, *args, **kwargs):
         user = request.session.get("user")
         if not user or user.get("role") != "admin":
             return redirect("employee_dashboard")
         return view_func(request, *args, **kwargs)
     return wrapper
+
+
+def _rejected(request, status, message, retry_after):
+    # Pages get plain text, API callers (fetch, DataTables) JSON.
+    if 'text/html' in request.headers.get('Accept', ''):
+        response = HttpResponse(message, status=status, content_type='text/plain; charset=utf-8')
+    else:
+        response = JsonResponse({'error': message}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def _too_many_requests(request, scope, retry_after):
+    record_throttled(scope, 'rate')
+    return _rejected(request, 429, "Too many requests. Please wait a moment and try again.", retry_after)
+
+
+def _identity(request, user, key):
+    # 'user' buckets fall back to the client IP for anonymous requests.
+    if key == 'user' and user and user.get('uid'):
+        return f"user:{user['uid']}"
+    return f"ip:{client_ip(request)}"
+
+
+def rate_limited(scope, key='user', methods=None):
+    """
+    Token-bucket rate limit per user (or per client IP with key='ip') using
+    settings.RATE_LIMITS[scope]; over the limit the view answers 429 with a
+    Retry-After header. `methods` limits only those HTTP methods (e.g. the
+    POST of a form, not the page itself).
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            async def wrapper(request, *args, **kwargs):
+                if methods is None or request.method in methods:
+                    user = await request.session.aget("user") if key == 'user' else None
+                    retry_after = await aconsume(scope, _identity(request, user, key))
+                    if retry_after:
+                        return _too_many_requests(request, scope, retry_after)
+                return await view_func(request, *args, **kwargs)
+            return markcoroutinefunction(wrapper)
+
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                user = request.session.get("user") if key == 'user' else None
+                retry_after = consume(scope, _identity(request, user, key))
+                if retry_after:
+                    return _too_many_requests(request, scope, retry_after)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _busy(request, scope):
+    record_throttled(scope, 'concurrency')
+    return _rejected(request, 503, "The server is busy. Please try again shortly.", 1)
+
+
+def concurrency_limited(scope):
+    """
+    Admission control: at most settings.CONCURRENCY_LIMITS[scope] requests
+    of the view run at once across all workers. Extra requests queue for up
+    to settings.CONCURRENCY_QUEUE_TIMEOUT seconds (0 rejects them at once),
+    then get a 503 with Retry-After.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            async def wrapper(request, *args, **kwargs):
+                slot = await aacquire_slot(scope)
+                if slot is False:
+                    return _busy(request, scope)
+                try:
+                    return await view_func(request, *args, **kwargs)
+                finally:
+                    await arelease_slot(slot)
+            return markcoroutinefunction(wrapper)
+
+        def wrapper(request, *args, **kwargs):
+            slot = acquire_slot(scope)
+            if slot is False:
+                return _busy(request, scope)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                release_slot(slot)
+        return wrapper
+    return decorator
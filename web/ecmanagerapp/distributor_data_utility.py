@@ -1,47 +1,148 @@
 import datetime
 import pytz
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from firebase_admin import auth, initialize_app  # Assuming 'auth' is imported globally
 
+from .caching import TTLCache
+from .concurrency import get_refresh_executor
+from .datastore import get_datastore
+from .replica import get_client_replica
 
-def get_distributor_data():
+
+# Process-wide cache of the distributors collection (UID -> full name).
+# TTL comes from settings.DISTRIBUTOR_MAP_CACHE_TTL (seconds, default 300).
+_distributor_map_cache = TTLCache(lambda: getattr(settings, 'DISTRIBUTOR_MAP_CACHE_TTL', 300))
+
+
+# Mirror of the Firebase Auth user list (UID -> row) behind get_distributor_data().
+# Refreshed in the background once older than settings.AUTH_USERS_CACHE_TTL
+# (seconds, default 300).
+_distributor_data_cache = TTLCache(lambda: getattr(settings, 'AUTH_USERS_CACHE_TTL', 300))
+
+
+def _distributor_map_from(docs):
+    distributor_map = {}
+    for doc in docs:
+        data = doc.to_dict()
+        distributor_map[doc.id] = data.get('full_name') or f"ID: {doc.id}"
+    return distributor_map
+
+
+def _load_distributor_map():
+    return _distributor_map_from(get_datastore().distributors.all())
+
+
+async def _aload_distributor_map():
+    return _distributor_map_from(await get_datastore().aio.distributors.all())
+
+
+def get_distributor_map():
     """
-    Fetches all distributor records from Firebase Auth, calculates their local
-    last login time, and returns the data as a list of dictionaries.
+    Returns the distributor UID -> full name map used to join client leads
+    with their owner. Served from a TTL cache so dashboards read the
+    distributors collection at most once per TTL instead of once per call.
+
+    The returned dictionary is shared; callers must not modify it. When the
+    live replica is warm, the map comes from it instead.
     """
-    distributors = []
+    replica = get_client_replica()
+    if replica is not None:
+        return replica.distributor_map()
+    return _distributor_map_cache.get_or_load('distributors', _load_distributor_map)
+
+
+async def aget_distributor_map():
+    """Async get_distributor_map(), reading through the async Firestore client."""
+    replica = get_client_replica()
+    if replica is not None:
+        return replica.distributor_map()
+    return await _distributor_map_cache.aget_or_load('distributors', _aload_distributor_map)
+
+
+def invalidate_distributor_map():
+    """Forces the next get_distributor_map() call to re-read Firestore."""
+    _distributor_map_cache.invalidate()
+
 
+def distributor_map_cache_stats():
+    """Returns the cache hit/miss counters, e.g. {'hits': 10, 'misses': 1, 'size': 1}."""
+    return _distributor_map_cache.stats()
+
+
+def _distributor_row(user_record, local_tz):
+    # 1. Initialize last_login_time to "Never"
+    last_login_time = "Never"
+
+    # Access the last sign-in timestamp from user_metadata (in milliseconds)
+    last_sign_in_ms = user_record.user_metadata.last_sign_in_timestamp
+
+    # 2. Check if the user has ever signed in (timestamp is not None)
+    if last_sign_in_ms:
+        # Firebase timestamps are in milliseconds; convert to seconds
+        last_sign_in_seconds = last_sign_in_ms / 1000.0
+
+        # Convert UTC timestamp to a timezone-aware datetime object (UTC is standard)
+        utc_dt = datetime.datetime.fromtimestamp(last_sign_in_seconds, tz=datetime.timezone.utc)
+
+        # Convert the UTC datetime to the local timezone
+        local_dt = utc_dt.astimezone(local_tz)
+
+        # 3. Format the Python datetime object into the desired clean string
+        last_login_time = local_dt.strftime('%b %d, %Y %I:%M %p %Z')
+
+    return {
+        "uid": user_record.uid,
+        "email": user_record.email,
+        "full_name": user_record.display_name or user_record.email,
+        "last_login": last_login_time,
+    }
+
+
+def _load_distributor_data():
     # Define the local timezone object based on Django settings (e.g., Africa/Kampala)
     local_tz = pytz.timezone(settings.TIME_ZONE)
 
-    # Iterate through all user records from Firebase Auth
-    for user_record in auth.list_users().iterate_all():
+    # Iterate through all user records from Firebase Auth (1000 users per page)
+    return {
+        user_record.uid: _distributor_row(user_record, local_tz)
+        for user_record in get_datastore().users.iterate_all()
+    }
 
-        # 1. Initialize last_login_time to "Never"
-        last_login_time = "Never"
 
-        # Access the last sign-in timestamp from user_metadata (in milliseconds)
-        last_sign_in_ms = user_record.user_metadata.last_sign_in_timestamp
+def get_distributor_data():
+    """
+    Returns every Firebase Auth user with their local last login time, as a
+    list of dictionaries (uid, email, full_name, last_login).
+
+    Served from a per-process mirror of the user list. The full Auth
+    enumeration only runs on the first call; once the mirror is older than
+    settings.AUTH_USERS_CACHE_TTL it is still served while one background
+    refresh re-reads Auth, so last-login times lag by at most about one TTL.
+    Registrations and deletions are applied to the mirror directly.
+    """
+    users = _distributor_data_cache.get_or_refresh('users', _load_distributor_data, get_refresh_executor())
+    return [dict(row) for row in users.values()]
+
+
+async def aget_distributor_data():
+    """
+    Async get_distributor_data(). Firebase Auth has no async API, so the
+    (normally cached) lookup runs on a worker thread.
+    """
+    return await sync_to_async(get_distributor_data, thread_sensitive=False)()
 
-        # 2. Check if the user has ever signed in (timestamp is not None)
-        if last_sign_in_ms:
-            # Firebase timestamps are in milliseconds; convert to seconds
-            last_sign_in_seconds = last_sign_in_ms / 1000.0
 
-            # Convert UTC timestamp to a timezone-aware datetime object (UTC is standard)
-            utc_dt = datetime.datetime.fromtimestamp(last_sign_in_seconds, tz=datetime.timezone.utc)
+def remember_distributor(user_record):
+    """Adds (or updates) one Auth user in the mirror, e.g. right after registration."""
+    row = _distributor_row(user_record, pytz.timezone(settings.TIME_ZONE))
+    _distributor_data_cache.update('users', lambda users: {**users, row['uid']: row})
 
-            # Convert the UTC datetime to the local timezone
-            local_dt = utc_dt.astimezone(local_tz)
 
-            # 3. Format the Python datetime object into the desired clean string
-            last_login_time = local_dt.strftime('%b %d, %Y %I:%M %p %Z')
+def forget_distributor(uid):
+    """Removes a deleted Auth user from the mirror."""
+    _distributor_data_cache.update('users', lambda users: {k: v for k, v in users.items() if k != uid})
 
-        distributors.append({
-            "uid": user_record.uid,
-            "email": user_record.email,
-            "full_name": user_record.display_name or user_record.email,
-            "last_login": last_login_time,
-        })
 
-    return distributors
+def invalidate_distributor_data():
+    """Forces the next get_distributor_data() call to re-enumerate Firebase Auth."""
+    _distributor_data_cache.invalidate()
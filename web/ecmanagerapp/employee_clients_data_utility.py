@@ -1,24 +1,20 @@
+import asyncio
 import datetime
 import pytz
 from django.conf import settings
-from firebase_admin import firestore
 import firebase_admin.exceptions
 import sys
 
-# Initialize Firestore client (assuming Firebase is already initialized via settings)
-db = firestore.client()
+from .client_data_utility import ClientRecord, format_date_logged
+from .concurrency import run_parallel
+from .datastore import acount_documents, count_documents, get_datastore
+from .distributor_data_utility import aget_distributor_map, get_distributor_map
+from .monthly_aggregate_utility import aget_monthly_aggregate, current_month_range, get_monthly_aggregate
+from .replica import get_client_replica
 
-app_id = settings.FIREBASE_WEB_APP_ID
-CLIENTS_PATH = f'artifacts/{app_id}/public/data/clients'
-DISTRIBUTORS_PATH = f'artifacts/{app_id}/public/data/distributors'
 
-def get_employee_clients(employee_id):
-    """
-    Fetches the current employee's client leads and calculates the
-    current month's top distributor (leaderboard) across all distributors.
-    """
-    # 1. Initialize result structure
-    results = {
+def _empty_employee_results():
+    return {
         'clients': [],
         'kpi_total_clients': 0,
         'kpi_clients_month': 0,  # Current employee's count this month
@@ -26,99 +22,128 @@ def get_employee_clients(employee_id):
         'kpi_top_distributor_count': 0,
     }
 
-    try:
-        local_tz = pytz.timezone(settings.TIME_ZONE)
-        now_local = datetime.datetime.now(local_tz)
-
-        # 2. Define Date Range for Current Month (in UTC)
-        # Start of the current month (e.g., Oct 1, 2025 00:00:00 local time)
-        start_of_month_local = now_local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-
-        # Find the first day of the next month to define the exclusive upper boundary
-        if now_local.month == 12:
-            start_of_next_month_local = start_of_month_local.replace(year=now_local.year + 1, month=1)
-        else:
-            start_of_next_month_local = start_of_month_local.replace(month=now_local.month + 1)
 
-        # Convert local datetimes to UTC to match Firestore server timestamps
-        # NOTE: We use .replace(tzinfo=None) as Firestore SDK often expects naive datetime for comparison
-        start_of_month_utc = start_of_month_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-        end_of_month_utc = start_of_next_month_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+def _client_records(employee_id, owned):
+    """ClientRecords of (doc ID, data) pairs, with the date formatted for the template."""
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+    now_local = datetime.datetime.now(local_tz)
+    return [
+        ClientRecord.from_document(
+            doc_id, client_data, ownerId=employee_id,
+            date_logged_formatted=format_date_logged(client_data.get('dateLogged'), local_tz, now_local),
+        )
+        for doc_id, client_data in owned
+    ]
 
-        # --- Task A: Fetch current employee's clients and calculate their monthly count ---
-        personal_clients = []
-        current_employee_monthly_count = 0
 
-        # Query 1: Filtered by current employee's ID
-        personal_query = db.collection(CLIENTS_PATH).where('ownerId', '==', employee_id)
-        personal_docs = personal_query.stream()
+def _fill_top_distributor(results, aggregate, distributor_map):
+    # Determine the top distributor (only owners we have names for)
+    top_performers = aggregate.top(1, distributor_map)
+    if top_performers:
+        top_distributor_id, max_clients = top_performers[0]
 
-        for doc in personal_docs:
-            client_data = doc.to_dict()
-            log_timestamp = client_data.get('dateLogged')
+        # Map the ID back to the name
+        results['kpi_top_distributor_name'] = distributor_map.get(top_distributor_id,
+                                                                  f"Unknown Distributor ({top_distributor_id[:4]}...)")
+        results['kpi_top_distributor_count'] = max_clients
+    return results
 
-            # Formatting and personal monthly count logic
-            if log_timestamp:
-                # 1. Set the naive Firestore timestamp to UTC
-                utc_date = log_timestamp.replace(tzinfo=datetime.timezone.utc)
-                # 2. Convert the UTC date to the local timezone for display
-                log_date_local = utc_date.astimezone(local_tz)
-            else:
-                log_date_local = now_local
 
-                # Format the date for the template
-            client_data['date_logged_formatted'] = log_date_local.strftime('%b %d, %Y %I:%M %p %Z')
+def get_employee_clients(employee_id):
+    """
+    Fetches the current employee's client leads (as ClientRecord, with only
+    the listed fields read) and calculates the current month's top
+    distributor (leaderboard) across all distributors.
+    """
+    # 1. Initialize result structure
+    results = _empty_employee_results()
 
-            # Check if this client belongs to the current month (for this employee's KPI)
-            if log_date_local.month == now_local.month and log_date_local.year == now_local.year:
-                current_employee_monthly_count += 1
+    store = get_datastore()
 
-            personal_clients.append(client_data)
+    try:
+        # --- Task A: Fetch current employee's clients and their KPI counts ---
+        period, start_of_month_utc, end_of_month_utc = current_month_range()
+        replica = get_client_replica()
+
+        def fetch_personal_clients():
+            # Query 1: Filtered by current employee's ID (served by the replica's owner index when warm)
+            if replica is not None:
+                return _client_records(employee_id, replica.clients_of(employee_id))
+            query = store.clients.owned_by(employee_id).select(store.clients.LIST_FIELDS)
+            return _client_records(employee_id, ((doc.id, doc.to_dict()) for doc in query.stream()))
+
+        if replica is not None:
+            personal_clients = fetch_personal_clients()
+            total_count = replica.count(employee_id)
+            monthly_count = replica.count_in_period(period, employee_id)
+        else:
+            # The list and the two count() aggregations (total and this month) run in parallel
+            personal_clients, total_count, monthly_count = run_parallel(
+                fetch_personal_clients,
+                lambda: count_documents(store.clients.owned_by(employee_id)),
+                lambda: count_documents(store.clients.logged_between(
+                    start_of_month_utc, end_of_month_utc, owner_id=employee_id)),
+            )
 
         results['clients'] = personal_clients
-        results['kpi_total_clients'] = len(personal_clients)
-        results['kpi_clients_month'] = current_employee_monthly_count
+        results['kpi_total_clients'] = total_count
+        results['kpi_clients_month'] = monthly_count
 
         # --- Task B: Calculate Top Distributor (Leaderboard) for the Current Month ---
 
-        # 1. Fetch Distributors Map (UID -> Name)
-        distributor_map = {}
-        distributors_snapshot = db.collection(DISTRIBUTORS_PATH).get()
-        for doc in distributors_snapshot:
-            data = doc.to_dict()
-            # Use doc.id (the UID) as the key
-            distributor_map[doc.id] = data.get('full_name', f"ID: {doc.id}")
+        # 1. Fetch Distributors Map (UID -> Name, cached)
+        distributor_map = get_distributor_map()
 
-        monthly_counts = {}
+        # 2. Current month's per-owner tallies, computed once and shared with the leaderboard
+        aggregate = get_monthly_aggregate()
 
-        # 2. Query 2: Filtered globally by date range (for leaderboard)
-        leaderboard_query = db.collection(CLIENTS_PATH) \
-            .where('dateLogged', '>=', start_of_month_utc) \
-            .where('dateLogged', '<', end_of_month_utc)
+        # 3. Determine the top distributor
+        return _fill_top_distributor(results, aggregate, distributor_map)
 
-        leaderboard_docs = leaderboard_query.stream()
+    except firebase_admin.exceptions.FirebaseError as e:
+        print(f"Firebase Client Data Error: {e}", file=sys.stderr)
+        results['kpi_top_distributor_name'] = 'Data Error'
+        return results
 
-        # 3. Tally client counts by ownerId
-        for doc in leaderboard_docs:
-            client_data = doc.to_dict()
-            owner_id = client_data.get('ownerId', 'Unknown')
+    except Exception as e:
+        print(f"General Client Data Error: {e}", file=sys.stderr)
+        results['kpi_top_distributor_name'] = 'System Error'
+        return results
 
-            # Tally counts for valid owner IDs
-            if owner_id in distributor_map:
-                monthly_counts[owner_id] = monthly_counts.get(owner_id, 0) + 1
 
-        # 4. Determine the top distributor
-        if monthly_counts:
-            # Get the ownerId (key) with the maximum count (value)
-            top_distributor_id = max(monthly_counts, key=monthly_counts.get)
-            max_clients = monthly_counts[top_distributor_id]
+async def aget_employee_clients(employee_id):
+    """
+    Async get_employee_clients(): the client list, both count() aggregations,
+    the distributor names and the monthly aggregate are awaited concurrently
+    on the async Firestore client.
+    """
+    results = _empty_employee_results()
 
-            # Map the ID back to the name
-            results['kpi_top_distributor_name'] = distributor_map.get(top_distributor_id,
-                                                                      f"Unknown Distributor ({top_distributor_id[:4]}...)")
-            results['kpi_top_distributor_count'] = max_clients
+    clients = get_datastore().aio.clients
 
-        return results
+    try:
+        period, start_of_month_utc, end_of_month_utc = current_month_range()
+        replica = get_client_replica()
+
+        if replica is not None:
+            results['clients'] = _client_records(employee_id, replica.clients_of(employee_id))
+            results['kpi_total_clients'] = replica.count(employee_id)
+            results['kpi_clients_month'] = replica.count_in_period(period, employee_id)
+            distributor_map, aggregate = await asyncio.gather(aget_distributor_map(), aget_monthly_aggregate())
+        else:
+            query = clients.owned_by(employee_id).select(clients.LIST_FIELDS)
+            docs, total_count, monthly_count, distributor_map, aggregate = await asyncio.gather(
+                query.get(),
+                acount_documents(clients.owned_by(employee_id)),
+                acount_documents(clients.logged_between(start_of_month_utc, end_of_month_utc, owner_id=employee_id)),
+                aget_distributor_map(),
+                aget_monthly_aggregate(),
+            )
+            results['clients'] = _client_records(employee_id, ((doc.id, doc.to_dict()) for doc in docs))
+            results['kpi_total_clients'] = total_count
+            results['kpi_clients_month'] = monthly_count
+
+        return _fill_top_distributor(results, aggregate, distributor_map)
 
     except firebase_admin.exceptions.FirebaseError as e:
         print(f"Firebase Client Data Error: {e}", file=sys.stderr)
@@ -129,5 +154,3 @@ def get_employee_clients(employee_id):
         print(f"General Client Data Error: {e}", file=sys.stderr)
         results['kpi_top_distributor_name'] = 'System Error'
         return results
-
-
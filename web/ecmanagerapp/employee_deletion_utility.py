@@ -0,0 +1,242 @@
+import sys
+import uuid
+from concurrent.futures import TimeoutError
+
+from django.conf import settings
+from firebase_admin import firestore
+
+from .concurrency import get_background_executor
+from .datastore import MAX_BATCH_WRITES, count_documents, get_datastore
+from .distributor_data_utility import forget_distributor, invalidate_distributor_map
+from .kpi_state_utility import invalidate_kpi_state
+from .login_utility import invalidate_distributor_profile
+from .monthly_aggregate_utility import invalidate_monthly_aggregate, period_for
+from .monthly_counter_utility import increment_monthly_counter
+from .period_rollup_utility import invalidate_rollups, local_date
+
+# What can happen to the clients of a deleted employee
+CASCADE_MODES = ('archive', 'reassign')
+
+# A reassigned client costs at most 5 writes (the client, two contact index
+# entries and the two counter shards of its month); one more write per page
+# records the progress, so a page always fits in a single 500-write batch.
+CASCADE_PAGE_SIZE = (MAX_BATCH_WRITES - 1) // 5
+
+# Most UIDs auth.delete_users() accepts per call
+MAX_DELETE_USERS = 1000
+
+# Jobs started by this process, for wait_for_employee_deletion()
+_futures = {}
+
+
+class EmployeeDeletionError(Exception):
+    """Raised when a deletion request is invalid (unknown mode, bad reassignment target)."""
+
+
+def _validate(uids, mode, target_id, store):
+    if not uids:
+        raise EmployeeDeletionError('At least one user ID (UID) is required for deletion.')
+    if mode not in CASCADE_MODES:
+        raise EmployeeDeletionError(f"Unknown cascade '{mode}'; use one of: {', '.join(CASCADE_MODES)}.")
+    if mode == 'reassign':
+        if not target_id:
+            raise EmployeeDeletionError('reassign_to is required to reassign the clients.')
+        if target_id in uids:
+            raise EmployeeDeletionError('Clients cannot be reassigned to an employee being deleted.')
+        if not store.distributors.get(target_id).exists:
+            raise EmployeeDeletionError(f'No distributor found for reassign_to ({target_id}).')
+
+
+def delete_auth_users(uids, store=None):
+    """
+    Deletes Firebase Auth users: one delete_user() call for a single UID,
+    auth.delete_users() in chunks of MAX_DELETE_USERS otherwise.
+
+    Returns:
+        dict: {uid: reason} for the users that could not be deleted.
+    """
+    store = store or get_datastore()
+    if len(uids) == 1:
+        store.users.delete(uids[0])
+        return {}
+
+    failures = {}
+    for start in range(0, len(uids), MAX_DELETE_USERS):
+        chunk = uids[start:start + MAX_DELETE_USERS]
+        result = store.users.delete_many(chunk)
+        for error in result.errors:
+            failures[chunk[error.index]] = error.reason
+    return failures
+
+
+def start_employee_deletion(uids, mode=None, target_id=None, requested_by=None, background=True):
+    """
+    Deletes employees right away (Auth users, then their distributor
+    documents) and cascades over their clients in a background job: each
+    client is either archived or reassigned to `target_id`. The job's progress
+    is kept in an employee_deletions document (see get_employee_deletion()).
+
+    Args:
+        uids (list): UIDs of the employees to delete.
+        mode (str): 'archive' or 'reassign' (default settings.EMPLOYEE_DELETE_CASCADE).
+        target_id (str): Distributor receiving the clients when reassigning.
+        requested_by (str): Email of the admin, stored with the job.
+        background (bool): False runs the cascade before returning (commands).
+
+    Raises:
+        EmployeeDeletionError: The request is invalid; nothing was deleted.
+        firebase_admin.exceptions.FirebaseError: Deleting the Auth user failed.
+
+    Returns:
+        dict: The job document (with its 'id').
+    """
+    store = get_datastore()
+    uids = list(dict.fromkeys(uid for uid in uids if uid))
+    mode = mode or getattr(settings, 'EMPLOYEE_DELETE_CASCADE', 'archive')
+    _validate(uids, mode, target_id, store)
+
+    # 1. Revoke access first: Auth users, in bulk when there are several
+    auth_failures = delete_auth_users(uids, store)
+    deleted = [uid for uid in uids if uid not in auth_failures]
+
+    # 2. Distributor documents and the job record, in one batch
+    job_ref = store.deletion_jobs.document(uuid.uuid4().hex)
+    job = {
+        'uids': deleted,
+        'mode': mode,
+        'targetId': target_id if mode == 'reassign' else None,
+        'status': 'queued' if deleted else 'done',
+        'total': None,
+        'processed': 0,
+        'authFailures': auth_failures,
+        'error': None,
+        'requestedBy': requested_by,
+        'createdAt': firestore.SERVER_TIMESTAMP,
+    }
+    batch = store.db.batch()
+    for uid in deleted:
+        batch.delete(store.distributors.document(uid))
+    batch.set(job_ref, job)
+    batch.commit()
+
+    invalidate_distributor_map()
+    for uid in deleted:
+        forget_distributor(uid)
+        invalidate_distributor_profile(uid)
+
+    # 3. The clients, page by page
+    if deleted:
+        if background:
+            future = get_background_executor().submit(run_employee_deletion, job_ref.id, store)
+            _futures[job_ref.id] = future
+            future.add_done_callback(lambda _: _futures.pop(job_ref.id, None))
+        else:
+            run_employee_deletion(job_ref.id, store)
+            return get_employee_deletion(job_ref.id, store)
+
+    return dict(job, id=job_ref.id, createdAt=None)
+
+
+def run_employee_deletion(job_id, store=None):
+    """
+    Runs the client cascade of a deletion job. Safe to run again after a crash:
+    every page drains the remaining clients of the deleted owners.
+    """
+    store = store or get_datastore()
+    job_ref = store.deletion_jobs.document(job_id)
+
+    try:
+        job = job_ref.get().to_dict()
+        total = sum(count_documents(store.clients.owned_by(uid)) for uid in job['uids'])
+        job_ref.update({'status': 'running', 'total': job['processed'] + total,
+                        'startedAt': firestore.SERVER_TIMESTAMP})
+
+        # Local days of the clients moved, whose leaderboard rollups are now stale
+        touched_days = set()
+        for uid in job['uids']:
+            while _cascade_page(store, job_ref, uid, job['mode'], job['targetId'], touched_days):
+                pass
+        invalidate_rollups(touched_days, store)
+
+        job_ref.update({'status': 'done', 'finishedAt': firestore.SERVER_TIMESTAMP})
+    except Exception as e:
+        print(f"Employee deletion job {job_id} failed: {e}", file=sys.stderr)
+        job_ref.update({'status': 'failed', 'error': str(e), 'finishedAt': firestore.SERVER_TIMESTAMP})
+    finally:
+        invalidate_monthly_aggregate()
+        # Removed and moved clients are behind the KPI watermark: recount them.
+        invalidate_kpi_state(store)
+
+
+def _cascade_page(store, job_ref, owner_id, mode, target_id, touched_days):
+    """
+    Archives or reassigns one page of an owner's clients in a single batch,
+    moving their monthly counts along. Processed clients no longer match the
+    owner query, so the next call reads the next page.
+
+    Returns:
+        int: Clients processed (0 once the owner has none left).
+    """
+    docs = store.clients.owned_by(owner_id).limit(CASCADE_PAGE_SIZE).get()
+    if not docs:
+        return 0
+
+    batch = store.db.batch()
+    per_period = {}
+
+    if mode == 'archive':
+        # Contacts stay claimed in the index: the client is kept, only out of circulation.
+        for doc in docs:
+            batch.set(store.archived_clients.document(doc.id), dict(
+                doc.to_dict(), archivedFrom=owner_id, archivedAt=firestore.SERVER_TIMESTAMP))
+            batch.delete(doc.reference)
+    else:
+        # Move the contact index entries that point at these clients (one batched read).
+        contacts = {}
+        for doc in docs:
+            data = doc.to_dict()
+            for field in ('contact1', 'contact2'):
+                if data.get(field):
+                    contacts[store.contacts.document(data[field]).id] = doc.id
+        index_refs = [store.contacts.collection().document(doc_id) for doc_id in contacts]
+        for snapshot in (store.db.get_all(index_refs) if index_refs else ()):
+            if snapshot.exists and snapshot.to_dict().get('clientId') == contacts[snapshot.id]:
+                batch.update(snapshot.reference, {'ownerId': target_id})
+        for doc in docs:
+            batch.update(doc.reference, {'ownerId': target_id})
+
+    for doc in docs:
+        logged = doc.to_dict().get('dateLogged')
+        if logged is not None:
+            period = period_for(logged)
+            per_period[period] = per_period.get(period, 0) + 1
+            touched_days.add(local_date(logged))
+
+    for period, count in per_period.items():
+        increment_monthly_counter(batch, owner_id, period=period, amount=-count)
+        if mode == 'reassign':
+            increment_monthly_counter(batch, target_id, period=period, amount=count)
+
+    batch.update(job_ref, {'processed': firestore.Increment(len(docs))})
+    batch.commit()
+    return len(docs)
+
+
+def get_employee_deletion(job_id, store=None):
+    """Returns a deletion job as a dict (with its 'id'), or None if there is no such job."""
+    snapshot = (store or get_datastore()).deletion_jobs.document(job_id).get()
+    if not snapshot.exists:
+        return None
+    return dict(snapshot.to_dict(), id=snapshot.id)
+
+
+def wait_for_employee_deletion(job_id, timeout=None):
+    """Blocks until a job started by this process finishes (True), or the timeout passes (False)."""
+    future = _futures.get(job_id)
+    if future is None:
+        return True
+    try:
+        future.result(timeout=timeout)
+    except TimeoutError:
+        return False
+    return True
@@ -1,17 +1,24 @@
-import datetime
-import pytz
-from django.conf import settings
-from firebase_admin import firestore
+import asyncio
+import heapq
+import operator
+
 import firebase_admin.exceptions
 import sys
-import operator
 
-# Initialize Firestore client (assuming Firebase is already initialized via settings)
-db = firestore.client()
+from .distributor_data_utility import aget_distributor_map, get_distributor_map
+from .monthly_aggregate_utility import aget_monthly_aggregate, get_monthly_aggregate
+from .period_rollup_utility import window_counts
+
 
-app_id = settings.FIREBASE_WEB_APP_ID
-CLIENTS_PATH = f'artifacts/{app_id}/public/data/clients'
-DISTRIBUTORS_PATH = f'artifacts/{app_id}/public/data/distributors'
+def _leaderboard_rows(aggregate, distributor_map, top_n):
+    # Take the top N distributors we have names for, highest count first
+    return [
+        {
+            'name': distributor_map.get(owner_id, f"Unknown ID ({owner_id[:4]}...)"),
+            'count': count
+        }
+        for owner_id, count in aggregate.top(top_n, distributor_map)
+    ]
 
 
 def get_monthly_leaderboard(top_n=3):
@@ -25,66 +32,78 @@ def get_monthly_leaderboard(top_n=3):
     Returns:
         list: A sorted list of dictionaries [{'name': '...', 'count': 10}, ...]
     """
-    leaderboard_list = []
-
     try:
-        local_tz = pytz.timezone(settings.TIME_ZONE)
-        now_local = datetime.datetime.now(local_tz)
+        # 1. Fetch Distributors Map (UID -> Name, cached)
+        distributor_map = get_distributor_map()
 
-        # 1. Define Date Range for Current Month (in UTC)
-        start_of_month_local = now_local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        # 2. Current month's per-owner tallies (shared with the top-distributor KPI)
+        aggregate = get_monthly_aggregate()
 
-        # Find the first day of the next month to define the exclusive upper boundary
-        if now_local.month == 12:
-            start_of_next_month_local = start_of_month_local.replace(year=now_local.year + 1, month=1)
-        else:
-            start_of_next_month_local = start_of_month_local.replace(month=now_local.month + 1)
+        # 3. Top N rows
+        return _leaderboard_rows(aggregate, distributor_map, top_n)
 
-        # Convert local datetimes to UTC to match Firestore server timestamps
-        start_of_month_utc = start_of_month_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-        end_of_month_utc = start_of_next_month_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    except firebase_admin.exceptions.FirebaseError as e:
+        print(f"Firebase Leaderboard Error: {e}", file=sys.stderr)
+        return []
+
+    except Exception as e:
+        print(f"General Leaderboard Error: {e}", file=sys.stderr)
+        return []
 
-        # 2. Fetch Distributors Map (UID -> Name)
-        distributor_map = {}
-        distributors_snapshot = db.collection(DISTRIBUTORS_PATH).get()
-        for doc in distributors_snapshot:
-            data = doc.to_dict()
-            distributor_map[doc.id] = data.get('full_name', f"ID: {doc.id}")
 
-        monthly_counts = {}
+async def aget_monthly_leaderboard(top_n=3):
+    """Async get_monthly_leaderboard(); the names and the tallies are read concurrently."""
+    try:
+        distributor_map, aggregate = await asyncio.gather(aget_distributor_map(), aget_monthly_aggregate())
+        return _leaderboard_rows(aggregate, distributor_map, top_n)
+
+    except firebase_admin.exceptions.FirebaseError as e:
+        print(f"Firebase Leaderboard Error: {e}", file=sys.stderr)
+        return []
 
-        # 3. Query Clients globally by date range
-        leaderboard_query = db.collection(CLIENTS_PATH) \
-            .where('dateLogged', '>=', start_of_month_utc) \
-            .where('dateLogged', '<', end_of_month_utc)
+    except Exception as e:
+        print(f"General Leaderboard Error: {e}", file=sys.stderr)
+        return []
 
-        leaderboard_docs = leaderboard_query.stream()
 
-        # 4. Tally client counts by ownerId
-        for doc in leaderboard_docs:
-            client_data = doc.to_dict()
-            owner_id = client_data.get('ownerId', 'Unknown')
+def rank_counts(counts, top_n, distributor_map):
+    """
+    Top `top_n` distributors of a {ownerId: count} tally as ranked rows,
+    highest count first. Distributors tied with the last place are all kept
+    (so more than `top_n` rows may come back) and tied rows share a rank
+    (1, 2, 2, 4); ties are listed by name. Owners missing from
+    `distributor_map` (deleted employees) and zero counts are skipped.
+    """
+    candidates = [(owner_id, count) for owner_id, count in counts.items()
+                  if count > 0 and owner_id in distributor_map]
+    if not candidates or top_n <= 0:
+        return []
 
-            # Tally counts only for distributors we have names for
-            if owner_id in distributor_map:
-                monthly_counts[owner_id] = monthly_counts.get(owner_id, 0) + 1
+    # O(n log top_n) instead of sorting every distributor
+    cutoff = heapq.nlargest(top_n, candidates, key=operator.itemgetter(1))[-1][1]
+    rows = sorted(
+        ({'name': distributor_map[owner_id], 'count': count} for owner_id, count in candidates if count >= cutoff),
+        key=lambda row: (-row['count'], row['name']),
+    )
 
-        # 5. Sort and Determine the top N distributors
-        if monthly_counts:
-            # Convert the dictionary to a list of (ownerId, count) tuples, sorted descending by count
-            sorted_counts = sorted(monthly_counts.items(), key=operator.itemgetter(1), reverse=True)
+    for position, row in enumerate(rows):
+        tied = position and row['count'] == rows[position - 1]['count']
+        row['rank'] = rows[position - 1]['rank'] if tied else position + 1
+    return rows
 
-            # Take the top N entries
-            top_performers = sorted_counts[:top_n]
 
-            # Format the final list
-            for owner_id, count in top_performers:
-                leaderboard_list.append({
-                    'name': distributor_map.get(owner_id, f"Unknown ID ({owner_id[:4]}...)"),
-                    'count': count
-                })
+def get_leaderboard(start_date, end_date, top_n=3):
+    """
+    Leaderboard of any window of local days [start_date, end_date), e.g. last
+    quarter, built from the day/week/month rollups (see
+    period_rollup_utility.window_counts); only the still-open period is
+    counted from the raw clients.
 
-        return leaderboard_list
+    Returns:
+        list: [{'rank': 1, 'name': '...', 'count': 10}, ...] (ties included).
+    """
+    try:
+        return rank_counts(window_counts(start_date, end_date), top_n, get_distributor_map())
 
     except firebase_admin.exceptions.FirebaseError as e:
         print(f"Firebase Leaderboard Error: {e}", file=sys.stderr)
@@ -93,6 +112,3 @@ def get_monthly_leaderboard(top_n=3):
     except Exception as e:
         print(f"General Leaderboard Error: {e}", file=sys.stderr)
         return []
-
-
-
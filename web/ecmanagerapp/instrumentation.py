@@ -0,0 +1,339 @@
+import contextlib
+import contextvars
+import datetime
+import inspect
+import threading
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+# View label used for calls made outside of a request (commands, listeners, refreshes).
+BACKGROUND_VIEW = 'background'
+
+
+# Firestore calls that read documents (as opposed to writes and commits)
+READ_METHODS = frozenset(['get', 'stream', 'get_all'])
+
+
+class RequestStats:
+    """
+    Firestore/Auth usage of one request, shared by the threads it fans out to.
+    Stats started inside another collection (e.g. a request made within
+    collect_request_stats()) also count towards the enclosing one.
+    """
+
+    def __init__(self, parent=None):
+        self._lock = threading.Lock()
+        self.parent = parent
+        self.rpcs = {}          # (service, method) -> count
+        self.durations = {}     # service -> seconds
+        self.documents = 0
+        self.bytes = 0
+        self.collection_reads = {}      # collection -> read calls
+        self.collection_documents = {}  # collection -> documents read
+
+    def add(self, service, method, duration, documents=0, size=0, collection=None):
+        with self._lock:
+            self.rpcs[(service, method)] = self.rpcs.get((service, method), 0) + 1
+            self.durations[service] = self.durations.get(service, 0.0) + duration
+            self.documents += documents
+            self.bytes += size
+            if collection and method in READ_METHODS:
+                self.collection_reads[collection] = self.collection_reads.get(collection, 0) + 1
+                self.collection_documents[collection] = self.collection_documents.get(collection, 0) + documents
+        if self.parent is not None:
+            self.parent.add(service, method, duration, documents, size, collection)
+
+    @property
+    def rpc_count(self):
+        return sum(self.rpcs.values())
+
+    def count_for(self, service):
+        return sum(count for (rpc_service, _), count in self.rpcs.items() if rpc_service == service)
+
+    def flush(self, view):
+        """Adds this request's totals to the process-wide counters under `view`."""
+        with self._lock:
+            for (service, method), count in self.rpcs.items():
+                metrics.rpcs_total.inc((view, service, method), count)
+            if self.documents:
+                metrics.documents_read_total.inc((view,), self.documents)
+                metrics.document_bytes_read_total.inc((view,), self.bytes)
+
+
+_current_stats = contextvars.ContextVar('ecmanager_request_stats', default=None)
+
+
+def start_request_stats():
+    """Starts collecting for the current request; returns (stats, token for end_request_stats)."""
+    stats = RequestStats(parent=_current_stats.get())
+    return stats, _current_stats.set(stats)
+
+
+def end_request_stats(token):
+    _current_stats.reset(token)
+
+
+def current_request_stats():
+    return _current_stats.get()
+
+
+@contextlib.contextmanager
+def collect_request_stats():
+    """
+    Collects the Firestore/Auth calls made inside the block (and in the
+    threads it fans out to) into a RequestStats, e.g. for read budgets:
+
+        with collect_request_stats() as stats:
+            get_client_kpis()
+        print(stats.collection_reads)
+    """
+    stats, token = start_request_stats()
+    try:
+        yield stats
+    finally:
+        end_request_stats(token)
+
+
+def record_rpc(service, method, duration, documents=0, size=0, collection=None):
+    """Records one Firestore/Auth call against the current request (or as background work)."""
+    metrics.rpc_duration_seconds.observe(duration, (service, method))
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(service, method, duration, documents, size, collection)
+        return
+
+    metrics.rpcs_total.inc((BACKGROUND_VIEW, service, method))
+    if documents:
+        metrics.documents_read_total.inc((BACKGROUND_VIEW,), documents)
+        metrics.document_bytes_read_total.inc((BACKGROUND_VIEW,), size)
+
+
+# --- Document size estimate (Firestore storage size rules) ---
+
+def _value_size(value):
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime.datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode('utf-8')) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_value_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(len(str(key)) + 1 + _value_size(item) for key, item in value.items())
+    return 16
+
+
+def document_size(snapshot):
+    """Approximate stored size of a document snapshot in bytes (0 if it does not exist)."""
+    if not getattr(snapshot, 'exists', False):
+        return 0
+    return len(snapshot.id) + 1 + 32 + _value_size(snapshot.to_dict() or {})
+
+
+# --- Client wrappers ---
+
+_builder_types = None
+
+
+def _firestore_builder_types():
+    """Firestore objects whose calls may be RPCs: queries, references, batches and aggregations."""
+    global _builder_types
+    if _builder_types is None:
+        from google.cloud.firestore_v1.base_aggregation import BaseAggregationQuery
+        from google.cloud.firestore_v1.base_batch import BaseWriteBatch
+        from google.cloud.firestore_v1.base_collection import BaseCollectionReference
+        from google.cloud.firestore_v1.base_document import BaseDocumentReference
+        from google.cloud.firestore_v1.base_query import BaseQuery
+
+        from .memory_store import (
+            MemoryAggregationQuery, MemoryAsyncAggregationQuery, MemoryAsyncDocumentReference,
+            MemoryAsyncQuery, MemoryAsyncWriteBatch, MemoryDocumentReference, MemoryQuery, MemoryWriteBatch,
+        )
+        # The Firestore base classes cover both the sync and the async flavours.
+        _builder_types = (
+            (BaseWriteBatch, MemoryWriteBatch, MemoryAsyncWriteBatch),
+            (BaseQuery, BaseCollectionReference, BaseDocumentReference, BaseAggregationQuery,
+             MemoryQuery, MemoryDocumentReference, MemoryAggregationQuery,
+             MemoryAsyncQuery, MemoryAsyncDocumentReference, MemoryAsyncAggregationQuery),
+        )
+    return _builder_types
+
+
+# Calls that reach the server. Batches and transactions only do so on commit
+# (and transactional reads); everything else only builds the request.
+_FIRESTORE_RPCS = frozenset(['get', 'stream', 'set', 'update', 'delete', 'create', 'add', 'get_all'])
+_BATCH_RPCS = frozenset(['commit', 'get'])
+
+
+def collection_of(target):
+    """
+    Collection a Firestore reference, query or count() aggregation reads from,
+    relative to the public data root (e.g. 'clients' or
+    'monthly_counters/2025-10/shards'); None for batches and transactions.
+    """
+    # Aggregations wrap a query and queries know their collection
+    # (attribute names of the Firestore SDK, then of memory_store).
+    target = getattr(target, '_nested_query', None) or getattr(target, '_query', None) or target
+    target = getattr(target, '_parent', None) or getattr(target, '_collection', None) or target
+
+    path = getattr(target, '_path', None)
+    path = '/'.join(path) if isinstance(path, tuple) else getattr(target, 'path', None)
+    if not isinstance(path, str):
+        return None
+
+    segments = path.split('/')
+    if len(segments) % 2 == 0:
+        segments = segments[:-1]  # document path: drop the document ID
+    if segments[:1] == ['artifacts'] and segments[2:4] == ['public', 'data']:
+        segments = segments[4:]
+    return '/'.join(segments)
+
+
+def _call_collection(target, args):
+    """Collection a call reads from: the target's, or that of the reference(s) passed to it
+    (transaction.get(ref), client.get_all([refs]))."""
+    collection = collection_of(target)
+    if collection is None and args:
+        first = args[0]
+        if isinstance(first, list):
+            first = first[0] if first else None
+        if first is not None:
+            collection = collection_of(first)
+    return collection
+
+
+def _unwrap(value):
+    if isinstance(value, InstrumentedProxy):
+        return value._target
+    if isinstance(value, list):
+        return [_unwrap(item) for item in value]
+    return value
+
+
+def _read_stats(result):
+    """(documents read, bytes) of a Firestore call result that is already materialized."""
+    if isinstance(result, list):
+        if result and isinstance(result[0], list):
+            # count() aggregation: billed as one read per batch of index entries
+            return 1, 0
+        return len(result), sum(document_size(doc) for doc in result)
+    if hasattr(result, 'exists') and hasattr(result, 'to_dict'):
+        return 1, document_size(result)
+    return 0, 0
+
+
+class InstrumentedProxy:
+    """
+    Transparent wrapper around the Firestore client (sync or async) or
+    firebase_admin.auth that times every server call and counts the documents
+    it returns. Query builders, references and batches it hands out are
+    wrapped too, so whole call chains (collection().where().stream()) are
+    accounted for.
+    """
+
+    def __init__(self, target, service):
+        self._target = target
+        self._service = service
+
+    def __repr__(self):
+        return f'<InstrumentedProxy {self._service} {self._target!r}>'
+
+    def __len__(self):
+        # Number of queued writes of a batch (dunder methods bypass __getattr__).
+        return len(self._target)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr) or inspect.isclass(attr) or name.startswith('_'):
+            return attr
+
+        def call(*args, **kwargs):
+            args = [_unwrap(arg) for arg in args]
+            kwargs = {key: _unwrap(value) for key, value in kwargs.items()}
+            if not self._is_rpc(name):
+                return self._wrap(attr(*args, **kwargs))
+            return self._timed(name, attr, args, kwargs)
+
+        return call
+
+    def _is_rpc(self, name):
+        if self._service != 'firestore':
+            return True
+        batch_types, _ = _firestore_builder_types()
+        if isinstance(self._target, batch_types):
+            return name in _BATCH_RPCS
+        return name in _FIRESTORE_RPCS
+
+    def _wrap(self, result):
+        if self._service == 'firestore':
+            batch_types, builder_types = _firestore_builder_types()
+            if isinstance(result, batch_types + builder_types):
+                return InstrumentedProxy(result, self._service)
+        return result
+
+    def _timed(self, name, attr, args, kwargs):
+        collection = _call_collection(self._target, args) if self._service == 'firestore' else None
+        started = time.perf_counter()
+        try:
+            result = attr(*args, **kwargs)
+        except Exception:
+            record_rpc(self._service, name, time.perf_counter() - started, collection=collection)
+            raise
+
+        if inspect.isawaitable(result):
+            # AsyncClient: the call happens when the caller awaits it.
+            return self._timed_awaitable(name, result, collection)
+        if hasattr(result, '__anext__'):
+            return self._timed_async_stream(name, result, started, collection)
+        if hasattr(result, '__next__'):
+            # Generators and Firestore's StreamGenerator
+            return self._timed_stream(name, result, started, collection)
+
+        documents, size = _read_stats(result) if self._service == 'firestore' else (0, 0)
+        record_rpc(self._service, name, time.perf_counter() - started, documents, size, collection)
+        return result
+
+    def _timed_stream(self, name, results, started, collection):
+        # Streams are lazy: the call is recorded once the caller stops iterating.
+        documents = size = 0
+        try:
+            for doc in results:
+                documents += 1
+                size += document_size(doc)
+                yield doc
+        finally:
+            record_rpc(self._service, name, time.perf_counter() - started, documents, size, collection)
+
+    async def _timed_awaitable(self, name, awaitable, collection):
+        started = time.perf_counter()
+        try:
+            result = await awaitable
+        except Exception:
+            record_rpc(self._service, name, time.perf_counter() - started, collection=collection)
+            raise
+        documents, size = _read_stats(result) if self._service == 'firestore' else (0, 0)
+        record_rpc(self._service, name, time.perf_counter() - started, documents, size, collection)
+        return result
+
+    async def _timed_async_stream(self, name, results, started, collection):
+        documents = size = 0
+        try:
+            async for doc in results:
+                documents += 1
+                size += document_size(doc)
+                yield doc
+        finally:
+            record_rpc(self._service, name, time.perf_counter() - started, documents, size, collection)
+
+
+def instrumented(target, service):
+    """Wraps a Firestore client or the auth module when settings.FIRESTORE_INSTRUMENTATION is on."""
+    if not getattr(settings, 'FIRESTORE_INSTRUMENTATION', True):
+        return target
+    return InstrumentedProxy(target, service)
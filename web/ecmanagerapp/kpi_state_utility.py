@@ -0,0 +1,185 @@
+import datetime
+
+from django.conf import settings
+from firebase_admin import firestore
+
+from .datastore import count_documents, get_datastore
+from .monthly_aggregate_utility import MonthlyAggregate, month_range, period_for, scan_monthly_counts
+from .monthly_counter_utility import read_monthly_counts
+
+# Document of the admin KPI state under kpi_state/
+KPI_STATE_ID = 'clients'
+
+# What folding a lead needs
+_WATERMARK_FIELDS = ['ownerId', 'dateLogged']
+
+
+def _overlap():
+    # settings.KPI_WATERMARK_OVERLAP: seconds re-read behind the watermark, so
+    # leads committed slightly out of dateLogged order are not missed.
+    return datetime.timedelta(seconds=getattr(settings, 'KPI_WATERMARK_OVERLAP', 60))
+
+
+def _reconcile_interval():
+    return datetime.timedelta(seconds=getattr(settings, 'KPI_RECONCILE_INTERVAL', 3600))
+
+
+def _aware(timestamp):
+    # Firestore compares naive datetimes as UTC.
+    if timestamp is not None and timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp
+
+
+def _month_counts(period, transaction):
+    """{ownerId: count} of a month, read in the transaction (counters or a scan, as configured)."""
+    if getattr(settings, 'MONTHLY_AGGREGATE_SOURCE', 'counters') == 'counters':
+        month_counts = read_monthly_counts(period, transaction=transaction)
+        if month_counts is not None:
+            return month_counts
+    return scan_monthly_counts(*month_range(period), transaction=transaction)
+
+
+def _tail(store, watermark, transaction=None):
+    """(id, ownerId, dateLogged) of the clients logged at or after `watermark` minus the overlap."""
+    query = store.clients.logged_since(watermark - _overlap()).select(_WATERMARK_FIELDS)
+    tail = []
+    for doc in query.stream(transaction=transaction):
+        data = doc.to_dict()
+        if data.get('dateLogged') is not None:
+            tail.append((doc.id, data.get('ownerId', 'Unknown'), _aware(data['dateLogged'])))
+    return tail
+
+
+def _reconciled_state(store, now_utc, transaction):
+    """
+    Recomputes the state from scratch: a count() of every client, the current
+    month's per-distributor counts, and the clients inside the overlap
+    window, all read in one (read-only) transaction so they agree with each
+    other.
+    """
+    period = period_for(now_utc)
+    month_counts = _month_counts(period, transaction)
+    total = count_documents(store.clients.collection(), transaction=transaction)
+    tail = _tail(store, now_utc, transaction)
+
+    return {
+        'total': total,
+        'period': period,
+        'monthCounts': month_counts,
+        'watermark': now_utc,
+        # Already counted above; the next refresh must not fold them again.
+        'recentIds': [doc_id for doc_id, _, _ in tail],
+        'reconciledAt': now_utc,
+    }
+
+
+def _fold(state, tail):
+    """
+    Adds the tail's clients that are not counted yet to the running totals
+    and moves the watermark to the newest dateLogged seen.
+
+    Returns:
+        int: Clients folded in.
+    """
+    seen = set(state['recentIds'])
+    state['monthCounts'] = dict(state['monthCounts'])
+    folded = 0
+    for doc_id, owner_id, logged in tail:
+        if doc_id in seen:
+            continue
+        folded += 1
+        state['total'] += 1
+        if period_for(logged) == state['period']:
+            state['monthCounts'][owner_id] = state['monthCounts'].get(owner_id, 0) + 1
+
+    watermark = max([state['watermark']] + [logged for _, _, logged in tail])
+    state['watermark'] = watermark
+    # Everything logged before watermark - overlap is never re-read.
+    state['recentIds'] = [doc_id for doc_id, _, logged in tail if logged >= watermark - _overlap()]
+    return folded
+
+
+def _fold_position(state):
+    # How far the state has folded: its watermark and the IDs counted at it.
+    if state is None:
+        return None
+    return _aware(state['watermark']), sorted(state['recentIds'])
+
+
+def _compare_and_set(store, state_ref, base, state):
+    """
+    Stores `state`, computed from `base`, unless another refresh moved the
+    stored state on meanwhile. The transaction only reads the state document.
+
+    Returns:
+        dict: The stored state (`state`, or the one that got there first), or
+              None if the state was invalidated meanwhile.
+    """
+    def swap(transaction):
+        snapshot = state_ref.get(transaction=transaction)
+        current = snapshot.to_dict() if snapshot.exists else None
+        if _fold_position(current) != _fold_position(base):
+            return current
+        transaction.set(state_ref, dict(state, updatedAt=firestore.SERVER_TIMESTAMP))
+        return state
+
+    stored = store.run_transaction(swap)
+    if stored is not None:
+        stored = dict(stored, watermark=_aware(stored['watermark']), reconciledAt=_aware(stored['reconciledAt']))
+    return stored
+
+
+def refresh_kpi_state(reconcile=False):
+    """
+    Brings the persisted admin KPI state up to date and returns it.
+
+    Each refresh only reads the clients logged after the state's dateLogged
+    watermark (plus a short overlap, deduplicated by ID) and folds them into
+    the running total and month counts, so its cost follows the number of new
+    leads rather than the size of the collection. The state is rebuilt from
+    count() aggregations and the monthly counters instead when it is missing,
+    a new month started, `reconcile` is set, or the last reconciliation is
+    older than settings.KPI_RECONCILE_INTERVAL; that is also what picks up
+    deleted, archived or reassigned clients.
+
+    The reads happen outside of any read-write transaction, so lead writes
+    are never held up by them. The result is then committed with a
+    compare-and-set on the watermark: if a concurrent refresh stored its state
+    first, that one is kept, so a lead is never folded twice. Nothing is
+    written when no new lead was folded in.
+
+    Returns:
+        dict: {'total', 'period', 'monthCounts', 'watermark', 'recentIds', 'reconciledAt'}
+    """
+    store = get_datastore()
+    state_ref = store.kpi_state.document(KPI_STATE_ID)
+    now_utc = datetime.datetime.now(datetime.timezone.utc)
+    snapshot = state_ref.get()
+    base = snapshot.to_dict() if snapshot.exists else None
+
+    if (reconcile or base is None or base.get('period') != period_for(now_utc)
+            or now_utc - _aware(base['reconciledAt']) >= _reconcile_interval()):
+        state = store.run_transaction(lambda transaction: _reconciled_state(store, now_utc, transaction),
+                                      read_only=True)
+    else:
+        state = dict(base, watermark=_aware(base['watermark']), reconciledAt=_aware(base['reconciledAt']))
+        if not _fold(state, _tail(store, state['watermark'])):
+            return state
+
+    stored = _compare_and_set(store, state_ref, base, state)
+    # Invalidated between our read and the commit: start over from scratch.
+    return stored if stored is not None else refresh_kpi_state()
+
+
+def kpi_state_aggregate(state):
+    """The state's month counts as a MonthlyAggregate (for the top distributor)."""
+    return MonthlyAggregate(state['period'], state['monthCounts'])
+
+
+def invalidate_kpi_state(store=None):
+    """
+    Deletes the persisted KPI state, e.g. after clients were removed or
+    reassigned in bulk; the next refresh reconciles from scratch.
+    """
+    (store or get_datastore()).kpi_state.document(KPI_STATE_ID).delete()
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .caching import TTLCache
+from .datastore import get_datastore
+
+SIGN_IN_URL = 'https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword'
+
+# Connections kept open to the Identity Toolkit per process (one per concurrent login).
+SIGN_IN_POOL_SIZE = 20
+
+
+class SignInError(Exception):
+    """Raised when the Identity Toolkit rejects a sign-in (e.g. INVALID_LOGIN_CREDENTIALS)."""
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Returns the process-wide requests.Session used for sign-in calls. Its
+    connection pool keeps TCP/TLS connections to Google alive between logins,
+    and transient failures (connection errors, 429/5xx) are retried with
+    backoff up to settings.SIGN_IN_RETRIES times.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=getattr(settings, 'SIGN_IN_RETRIES', 2),
+                    backoff_factor=0.2,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    # Signing in twice is harmless, so POST may be retried.
+                    allowed_methods=frozenset(['POST']),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SIGN_IN_POOL_SIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def sign_in_with_password(email, password):
+    """
+    Signs a user in through the Firebase Identity Toolkit REST API.
+
+    Raises:
+        SignInError: The credentials were rejected (message from Firebase).
+        requests.RequestException: Google could not be reached in time.
+
+    Returns:
+        dict: The sign-in response, including 'idToken' and 'localId'.
+    """
+    response = get_http_session().post(
+        SIGN_IN_URL,
+        params={'key': settings.FIREBASE_WEB_API_KEY},
+        json={'email': email, 'password': password, 'returnSecureToken': True},
+        timeout=(getattr(settings, 'SIGN_IN_CONNECT_TIMEOUT', 3.05), getattr(settings, 'SIGN_IN_READ_TIMEOUT', 10)),
+    )
+    data = response.json()
+
+    if 'idToken' not in data:
+        raise SignInError(data.get('error', {}).get('message', f'HTTP {response.status_code}'))
+    return data
+
+
+# Statuses worth another sign-in attempt (same as the requests Retry above)
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# httpx clients are bound to the event loop that opened their connections.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    """
+    Returns the httpx.AsyncClient used for sign-in calls from async views,
+    one per event loop, keeping up to SIGN_IN_POOL_SIZE connections to Google
+    alive between logins.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=SIGN_IN_POOL_SIZE, max_keepalive_connections=SIGN_IN_POOL_SIZE),
+            timeout=httpx.Timeout(
+                getattr(settings, 'SIGN_IN_READ_TIMEOUT', 10),
+                connect=getattr(settings, 'SIGN_IN_CONNECT_TIMEOUT', 3.05),
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def asign_in_with_password(email, password):
+    """
+    Async sign_in_with_password() over httpx, with the same retries on
+    connection errors and 429/5xx responses (settings.SIGN_IN_RETRIES).
+
+    Raises:
+        SignInError: The credentials were rejected (message from Firebase).
+        httpx.HTTPError: Google could not be reached in time.
+
+    Returns:
+        dict: The sign-in response, including 'idToken' and 'localId'.
+    """
+    client = get_async_http_client()
+    retries = getattr(settings, 'SIGN_IN_RETRIES', 2)
+
+    for attempt in range(retries + 1):
+        try:
+            response = await client.post(
+                SIGN_IN_URL,
+                params={'key': settings.FIREBASE_WEB_API_KEY},
+                json={'email': email, 'password': password, 'returnSecureToken': True},
+            )
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                break
+        await asyncio.sleep(0.2 * (2 ** attempt))
+
+    data = response.json()
+
+    if 'idToken' not in data:
+        raise SignInError(data.get('error', {}).get('message', f'HTTP {response.status_code}'))
+    return data
+
+
+# Distributor profile (email, role, ...) per UID, read at every login.
+# Kept for settings.ROLE_CACHE_TTL seconds (default 60) and dropped when the
+# employee is deleted.
+_profile_cache = TTLCache(lambda: getattr(settings, 'ROLE_CACHE_TTL', 60))
+
+
+def get_distributor_profile(uid):
+    """Returns the distributor document of a user as a dict (cached), or None if missing."""
+    def load():
+        snapshot = get_datastore().distributors.get(uid)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    profile = _profile_cache.get_or_load(uid, load)
+    if profile is None:
+        # Do not remember misses; the document may be created any moment.
+        _profile_cache.invalidate(uid)
+    return profile
+
+
+async def aget_distributor_profile(uid):
+    """Async get_distributor_profile(), sharing its cache."""
+    async def load():
+        snapshot = await get_datastore().aio.distributors.get(uid)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    profile = await _profile_cache.aget_or_load(uid, load)
+    if profile is None:
+        _profile_cache.invalidate(uid)
+    return profile
+
+
+def invalidate_distributor_profile(uid=None):
+    """Drops the cached profile of one user (or of everyone)."""
+    _profile_cache.invalidate(uid)
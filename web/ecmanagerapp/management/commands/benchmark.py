@@ -0,0 +1,77 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecmanagerapp.benchmark_utility import (
+    DEFAULT_SCALES, DEFAULT_TOLERANCE, compare_to_baseline, load_baseline, run_benchmarks, save_baseline,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the dashboard data utilities and views against the in-memory "
+        "datastore seeded at realistic scale, reporting p50/p99 latency, throughput "
+        "and peak memory, and compares them with a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--clients', type=int, nargs='+', default=list(DEFAULT_SCALES), metavar='N',
+            help="Client counts to seed, e.g. --clients 10000 100000 1000000 (default: 10000 100000).",
+        )
+        parser.add_argument(
+            '--distributors', type=int, default=300,
+            help="Distributors the clients are spread across (default: 300).",
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help="Timed runs per target (default: 20).",
+        )
+        parser.add_argument(
+            '--only', action='append', metavar='TARGET',
+            help="Only run this target (e.g. get_client_data, view:admin_dashboard); may be repeated.",
+        )
+        parser.add_argument(
+            '--baseline', default='benchmarks/baseline.json',
+            help="Baseline JSON file to compare with (default: benchmarks/baseline.json).",
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help="Write the results to the baseline file instead of comparing.",
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+            help="Allowed p50 slowdown over the baseline as a fraction (default: 0.25).",
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError("--iterations must be at least 1.")
+
+        report = run_benchmarks(
+            scales=options['clients'],
+            num_distributors=options['distributors'],
+            iterations=options['iterations'],
+            only=options['only'],
+            log=self.stdout.write,
+        )
+        path = options['baseline']
+
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            save_baseline(report, path)
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {path}."))
+            return
+
+        if not os.path.exists(path):
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {path}; run with --save-baseline to create one."))
+            return
+
+        regressions = compare_to_baseline(report, load_baseline(path), options['tolerance'])
+        for scale, name, before, now in regressions:
+            self.stdout.write(self.style.ERROR(
+                f"{scale} clients, {name}: p50 {now:.1f} ms vs {before:.1f} ms baseline"))
+        if regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed beyond {options['tolerance']:.0%}.")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
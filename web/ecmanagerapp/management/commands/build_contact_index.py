@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from ecmanagerapp.client_lead_utility import build_contact_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the client contact uniqueness index from the existing clients. "
+        "Run once before relying on transactional contact claims; safe to re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--show', type=int, default=20, metavar='N',
+            help="Conflicts to list (default: 20; 0 lists none).",
+        )
+
+    def handle(self, *args, **options):
+        result = build_contact_index()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {result['indexed']} contacts from {result['clients']} clients "
+            f"({result['already_indexed']} were already indexed)."))
+
+        conflicts = result['conflicts']
+        if conflicts:
+            self.stdout.write(self.style.WARNING(
+                f"{len(conflicts)} contacts belong to a client other than the one that claims them:"))
+            for conflict in conflicts[:options['show']]:
+                self.stdout.write(
+                    f"  {conflict['contact']}: client {conflict['clientId']} (owner {conflict['ownerId']}), "
+                    f"claimed by {conflict['claimedBy']}")
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ecmanagerapp.employee_deletion_utility import (
+    EmployeeDeletionError, get_employee_deletion, run_employee_deletion, start_employee_deletion,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes employees (Auth users and distributor documents) and archives or "
+        "reassigns their clients in the foreground. --resume finishes a deletion "
+        "job that was interrupted, e.g. by a worker restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('uids', nargs='*', metavar='UID', help="Employees to delete.")
+        parser.add_argument(
+            '--reassign-to', metavar='UID',
+            help="Hand the clients to this distributor instead of archiving them.",
+        )
+        parser.add_argument('--resume', metavar='JOB_ID', help="Re-run the client cascade of an existing job.")
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            if get_employee_deletion(options['resume']) is None:
+                raise CommandError(f"No deletion job {options['resume']}.")
+            run_employee_deletion(options['resume'])
+            job = get_employee_deletion(options['resume'])
+        else:
+            mode = 'reassign' if options['reassign_to'] else 'archive'
+            try:
+                job = start_employee_deletion(options['uids'], mode=mode, target_id=options['reassign_to'],
+                                              background=False)
+            except EmployeeDeletionError as e:
+                raise CommandError(str(e))
+
+        for uid, reason in job['authFailures'].items():
+            self.stdout.write(self.style.WARNING(f"{uid}: not deleted from Auth ({reason})"))
+        if job['status'] == 'failed':
+            raise CommandError(f"Job {job['id']} failed after {job['processed']} clients: {job['error']}")
+        outcome = 'reassigned' if job['mode'] == 'reassign' else 'archived'
+        self.stdout.write(self.style.SUCCESS(
+            f"Job {job['id']}: {len(job['uids'])} employees deleted, {job['processed']} clients {outcome}."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ecmanagerapp.client_import_utility import IMPORT_FORMATS, import_client_leads, iter_lead_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk imports client leads for one distributor from a CSV (header: fullName, "
+        "contact1, contact2, initialNotes) or JSONL file, using batched writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file to import.")
+        parser.add_argument('--owner', required=True, help="UID of the distributor the leads belong to.")
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help="File format (default: taken from the file extension).")
+        parser.add_argument('--show-rejected', action='store_true',
+                            help="Print every row that was not imported.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError("Unsupported file format. Use --format csv or --format jsonl.")
+
+        try:
+            with open(path, 'rb') as stream:
+                result = import_client_leads(iter_lead_records(stream, file_format), options['owner'])
+        except OSError as e:
+            raise CommandError(f"Could not open {path}: {e}")
+
+        if options['show_rejected']:
+            for row in result['rows']:
+                if row['status'] != 'created':
+                    self.stdout.write(f"row {row['row']}: {row['status']} - {row['error']}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']}, duplicates {result['duplicate']}, "
+            f"invalid {result['invalid']}, errors {result['error']}."))
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ecmanagerapp.monthly_aggregate_utility import period_for
+from ecmanagerapp.monthly_counter_utility import rebuild_monthly_counters
+
+
+def _previous_periods(count):
+    """Returns the last `count` 'YYYY-MM' periods, current month first."""
+    year, month = (int(part) for part in period_for().split('-'))
+    periods = []
+    for _ in range(count):
+        periods.append(f'{year:04d}-{month:02d}')
+        year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return periods
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills or repairs the sharded monthly client counters from the raw "
+        "clients collection (one period at a time) and marks the months complete, "
+        "so the dashboards read them instead of scanning. Run it with lead "
+        "writes quiesced."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--period', action='append', dest='periods', metavar='YYYY-MM',
+            help="Month to rebuild; may be given several times.",
+        )
+        parser.add_argument(
+            '--months', type=int, default=1,
+            help="Rebuild the last N months including the current one (default: 1).",
+        )
+
+    def handle(self, *args, **options):
+        periods = options['periods'] or _previous_periods(options['months'])
+
+        for period in periods:
+            try:
+                counts = rebuild_monthly_counters(period)
+            except ValueError:
+                raise CommandError(f"Invalid period '{period}', expected YYYY-MM.")
+            self.stdout.write(self.style.SUCCESS(
+                f"{period}: {sum(counts.values())} clients across {len(counts)} distributors"))
@@ -0,0 +1,34 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecmanagerapp.period_rollup_utility import close_periods, local_today, roll_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Writes the day/week/month client count rollups read by the window "
+        "leaderboards. Run daily shortly after midnight: it rolls up yesterday and "
+        "the week/month that just closed. --since backfills every closed period "
+        "from that day on with one scan of their clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', metavar='YYYY-MM-DD', help="Backfill from this local date.")
+
+    def handle(self, *args, **options):
+        today = local_today()
+        if not options['since']:
+            closed = close_periods(today)
+            self.stdout.write(self.style.SUCCESS(f"Rolled up {', '.join(sorted(closed))}."))
+            return
+
+        try:
+            since = datetime.date.fromisoformat(options['since'])
+        except ValueError:
+            raise CommandError(f"Invalid date '{options['since']}', expected YYYY-MM-DD.")
+
+        per_day = roll_up(since, today, today)
+        clients = sum(sum(counts.values()) for counts in per_day.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {len(per_day)} days from {since}, with their weeks and months: {clients} clients."))
@@ -0,0 +1,768 @@
+import copy
+import datetime
+import itertools
+import random
+import threading
+import uuid
+
+from firebase_admin import auth as firebase_auth
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists, NotFound
+from google.cloud.firestore_v1.aggregation import AggregationResult
+from google.cloud.firestore_v1.watch import ChangeType, DocumentChange
+
+from .monthly_aggregate_utility import period_for
+from .monthly_counter_utility import COMPLETE_MARKER_ID
+
+
+# Firestore compares naive datetimes as UTC, so we do the same when filtering.
+def _comparable(value):
+    if isinstance(value, datetime.datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def _matches(data, field_path, op_string, value):
+    """
+    Evaluates a single Firestore-style filter against a document dictionary.
+    Documents that do not have the field never match (same as Firestore).
+    """
+    if field_path not in data:
+        return False
+
+    field_value = _comparable(data[field_path])
+    value = _comparable(value)
+
+    try:
+        if op_string == '==':
+            return field_value == value
+        if op_string == '!=':
+            return field_value != value
+        if op_string == '<':
+            return field_value is not None and field_value < value
+        if op_string == '<=':
+            return field_value is not None and field_value <= value
+        if op_string == '>':
+            return field_value is not None and field_value > value
+        if op_string == '>=':
+            return field_value is not None and field_value >= value
+        if op_string == 'in':
+            return field_value in value
+        if op_string == 'not-in':
+            return field_value not in value
+        if op_string == 'array_contains':
+            return isinstance(field_value, list) and value in field_value
+    except TypeError:
+        # Mixed types never compare in Firestore; they simply do not match.
+        return False
+
+    raise ValueError(f"Unsupported operator for the in-memory store: {op_string}")
+
+
+def _project(data, field_paths):
+    """Copy of a document's data restricted to `field_paths` (all fields when None)."""
+    if data is None:
+        return None
+    if field_paths is None:
+        return copy.copy(data)
+    return {field: data[field] for field in field_paths if field in data}
+
+
+class MemoryDocumentSnapshot:
+    """
+    Read-only view of a stored document, mirroring the parts of
+    google.cloud.firestore.DocumentSnapshot used by the app.
+    """
+
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        if self._data is None:
+            return None
+        return copy.copy(self._data)
+
+    def get(self, field_path):
+        if self._data is None:
+            return None
+        return self._data.get(field_path)
+
+
+class MemoryDocumentReference:
+
+    def __init__(self, client, collection_path, document_id):
+        self._client = client
+        self._collection_path = collection_path
+        self.id = document_id
+
+    @property
+    def path(self):
+        return f"{self._collection_path}/{self.id}"
+
+    def collection(self, collection_id):
+        return MemoryCollectionReference(self._client, f"{self.path}/{collection_id}")
+
+    def get(self, field_paths=None, transaction=None):
+        with self._client._lock:
+            data = self._client._collection(self._collection_path).get(self.id)
+        return MemoryDocumentSnapshot(self, _project(data, field_paths))
+
+    def _before_write(self):
+        # Copy of the current data for snapshot listeners (None when nobody listens).
+        if not self._client._listeners.get(self._collection_path):
+            return None
+        return copy.copy(self._client._collection(self._collection_path).get(self.id))
+
+    def create(self, document_data):
+        with self._client._lock:
+            if self.id in self._client._collection(self._collection_path):
+                raise AlreadyExists(f"Document already exists: {self.path}")
+            return self.set(document_data)
+
+    def set(self, document_data, merge=False):
+        with self._client._lock:
+            before = self._before_write()
+            documents = self._client._collection(self._collection_path)
+            existing = documents.get(self.id) if merge else None
+            resolved = self._client._resolve(document_data, existing)
+            if existing is not None:
+                existing.update(resolved)
+            else:
+                documents[self.id] = resolved
+            self._client._notify(self, before, documents[self.id])
+        return self._client._now()
+
+    def update(self, field_updates):
+        with self._client._lock:
+            before = self._before_write()
+            documents = self._client._collection(self._collection_path)
+            if self.id not in documents:
+                raise NotFound(f"No document to update: {self.path}")
+            documents[self.id].update(self._client._resolve(field_updates, documents[self.id]))
+            self._client._notify(self, before, documents[self.id])
+        return self._client._now()
+
+    def delete(self):
+        with self._client._lock:
+            before = self._before_write()
+            self._client._collection(self._collection_path).pop(self.id, None)
+            self._client._notify(self, before, None)
+        return self._client._now()
+
+
+class MemoryQuery:
+    """
+    Immutable query over one collection. Supports the subset of the Firestore
+    query API used by the app: select(), where(), order_by(), start_after(),
+    offset(), limit(), count(), stream() and get().
+    """
+
+    def __init__(self, collection, projection=None, filters=(), orders=(), start_after=None, offset=0, limit=None):
+        self._collection = collection
+        self._projection = projection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._start_after = start_after
+        self._offset = offset
+        self._limit = limit
+
+    def _copy(self, **changes):
+        state = {
+            'projection': self._projection,
+            'filters': self._filters,
+            'orders': self._orders,
+            'start_after': self._start_after,
+            'offset': self._offset,
+            'limit': self._limit,
+        }
+        state.update(changes)
+        return MemoryQuery(self._collection, **state)
+
+    def select(self, field_paths):
+        return self._copy(projection=tuple(field_paths))
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path, direction=firestore.Query.ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def start_after(self, document_fields_or_snapshot):
+        return self._copy(start_after=document_fields_or_snapshot)
+
+    def offset(self, num_to_skip):
+        return self._copy(offset=num_to_skip)
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def count(self, alias=None):
+        return MemoryAggregationQuery(self, alias)
+
+    def _sort_key(self, doc_id, data):
+        return tuple(_comparable(data[field]) for field, _ in self._orders) + (doc_id,)
+
+    def _matching(self):
+        client = self._collection._client
+        with client._lock:
+            items = list(client._collection(self._collection.path).items())
+
+        matched = [
+            (doc_id, data) for doc_id, data in items
+            if all(_matches(data, *f) for f in self._filters)
+            # Like Firestore, ordering on a field excludes documents without it.
+            and all(field in data for field, _ in self._orders)
+        ]
+
+        if self._orders:
+            # Firestore breaks ties by document ID in the direction of the last ordering.
+            descending = self._orders[-1][1] == firestore.Query.DESCENDING
+            matched.sort(key=lambda item: self._sort_key(*item), reverse=descending)
+
+            if self._start_after is not None:
+                cursor = self._start_after
+                if isinstance(cursor, MemoryDocumentSnapshot):
+                    cursor_key = self._sort_key(cursor.id, cursor.to_dict())
+                else:
+                    cursor_key = tuple(_comparable(cursor[field]) for field, _ in self._orders)
+                width = len(cursor_key)
+                if descending:
+                    matched = [item for item in matched if self._sort_key(*item)[:width] < cursor_key]
+                else:
+                    matched = [item for item in matched if self._sort_key(*item)[:width] > cursor_key]
+
+        return matched
+
+    def stream(self, transaction=None):
+        matched = itertools.islice(self._matching(), self._offset, None)
+        if self._limit is not None:
+            matched = itertools.islice(matched, self._limit)
+
+        for doc_id, data in matched:
+            yield MemoryDocumentSnapshot(self._collection.document(doc_id), _project(data, self._projection))
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        """
+        Calls `callback(docs, changes, read_time)` with every matching document
+        as an ADDED change right away, then once per write that adds, modifies
+        or removes a matching document. Unlike Firestore, callbacks run
+        synchronously on the writing thread and `docs` is only filled on the
+        initial snapshot. Only filters are honoured (no order, cursor or limit).
+        """
+        client = self._collection._client
+        watch = MemoryWatch(self, callback)
+        with client._lock:
+            docs = [
+                MemoryDocumentSnapshot(self._collection.document(doc_id), copy.copy(data))
+                for doc_id, data in self._matching()
+            ]
+            client._listeners.setdefault(self._collection.path, []).append(watch)
+            changes = [DocumentChange(ChangeType.ADDED, doc, -1, index) for index, doc in enumerate(docs)]
+            callback(docs, changes, client._now())
+        return watch
+
+
+class MemoryWatch:
+    """Handle returned by on_snapshot(); unsubscribe() stops the notifications."""
+
+    def __init__(self, query, callback):
+        self._query = query
+        self._callback = callback
+        self.is_active = True
+
+    def _includes(self, data):
+        return data is not None and all(_matches(data, *f) for f in self._query._filters)
+
+    def _on_write(self, reference, before, after):
+        was_included, is_included = self._includes(before), self._includes(after)
+        if is_included:
+            change_type = ChangeType.MODIFIED if was_included else ChangeType.ADDED
+            document = MemoryDocumentSnapshot(reference, copy.copy(after))
+        elif was_included:
+            change_type = ChangeType.REMOVED
+            document = MemoryDocumentSnapshot(reference, copy.copy(before))
+        else:
+            return
+        self._callback([], [DocumentChange(change_type, document, -1, -1)], reference._client._now())
+
+    def unsubscribe(self):
+        self.is_active = False
+        client = self._query._collection._client
+        with client._lock:
+            watches = client._listeners.get(self._query._collection.path, [])
+            if self in watches:
+                watches.remove(self)
+
+
+class MemoryAggregationQuery:
+    """Server-side count() aggregation: returns [[AggregationResult]] without streaming documents."""
+
+    def __init__(self, query, alias=None):
+        self._query = query
+        self._alias = alias or 'field_1'
+
+    def get(self, transaction=None):
+        matched = self._query._matching()[self._query._offset:]
+        if self._query._limit is not None:
+            matched = matched[:self._query._limit]
+        return [[AggregationResult(alias=self._alias, value=len(matched))]]
+
+
+class MemoryCollectionReference(MemoryQuery):
+
+    def __init__(self, client, path):
+        self._client = client
+        self.path = path
+        self.id = path.rsplit('/', 1)[-1]
+        super().__init__(self)
+
+    def document(self, document_id=None):
+        return MemoryDocumentReference(self._client, self.path, document_id or uuid.uuid4().hex[:20])
+
+    def add(self, document_data, document_id=None):
+        doc_ref = self.document(document_id)
+        update_time = doc_ref.set(document_data)
+        return update_time, doc_ref
+
+
+class MemoryWriteBatch:
+    """
+    Collects writes and applies them atomically on commit(), like
+    google.cloud.firestore.WriteBatch (no other writer can interleave).
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def __len__(self):
+        return len(self._writes)
+
+    def _add_write(self, op, reference, args):
+        self._writes.append((op, reference, args))
+        return self
+
+    def create(self, reference, document_data):
+        return self._add_write('create', reference, (document_data,))
+
+    def set(self, reference, document_data, merge=False):
+        return self._add_write('set', reference, (document_data, merge))
+
+    def update(self, reference, field_updates):
+        return self._add_write('update', reference, (field_updates,))
+
+    def delete(self, reference):
+        return self._add_write('delete', reference, ())
+
+    def commit(self):
+        with self._client._lock:
+            # Validate everything first so a failing write leaves no partial commit.
+            # Writes apply in order, so an earlier write of the batch counts too
+            # (two creates of one document fail, as in Firestore).
+            exists = {}
+            for op, reference, args in self._writes:
+                if reference.path not in exists:
+                    exists[reference.path] = reference.get().exists
+                if op == 'update' and not exists[reference.path]:
+                    raise NotFound(f"No document to update: {reference.path}")
+                if op == 'create' and exists[reference.path]:
+                    raise AlreadyExists(f"Document already exists: {reference.path}")
+                exists[reference.path] = op != 'delete'
+            for op, reference, args in self._writes:
+                getattr(reference, op)(*args)
+        self._writes = []
+        return []
+
+
+class MemoryTransaction(MemoryWriteBatch):
+    """
+    Write batch used by MemoryDataStore.run_transaction(); reads made inside the
+    transaction function see a consistent view because the store lock is held.
+    """
+
+    def __init__(self, client, read_only=False):
+        super().__init__(client)
+        self._read_only = read_only
+
+    def _add_write(self, op, reference, args):
+        if self._read_only:
+            # Same error as google.cloud.firestore.Transaction
+            raise ValueError('Cannot perform write operation in read-only transaction.')
+        return super()._add_write(op, reference, args)
+
+    def get(self, reference):
+        return reference.get(transaction=self)
+
+
+class MemoryFirestoreClient:
+    """
+    In-memory stand-in for google.cloud.firestore.Client.
+
+    Collections are plain dictionaries keyed by their full path, so the same
+    'artifacts/{app_id}/public/data/...' paths used in production work unchanged.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._collections = {}
+        # Collection path -> [MemoryWatch] registered through on_snapshot()
+        self._listeners = {}
+
+    def _collection(self, path):
+        return self._collections.setdefault(path, {})
+
+    def _now(self):
+        return datetime.datetime.now(datetime.timezone.utc)
+
+    def _resolve(self, document_data, existing=None):
+        # Replace write sentinels and transforms with concrete values, as the server would.
+        resolved = {}
+        for key, value in document_data.items():
+            if value is firestore.SERVER_TIMESTAMP:
+                value = self._now()
+            elif value is firestore.DELETE_FIELD:
+                if existing is not None:
+                    existing.pop(key, None)
+                continue
+            elif isinstance(value, firestore.Increment):
+                value = (existing or {}).get(key, 0) + value.value
+            resolved[key] = value
+        return resolved
+
+    def _notify(self, reference, before, after):
+        for watch in list(self._listeners.get(reference._collection_path, ())):
+            watch._on_write(reference, before, after)
+
+    def batch(self):
+        return MemoryWriteBatch(self)
+
+    def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield reference.get()
+
+    def collection(self, *path):
+        return MemoryCollectionReference(self, '/'.join(path))
+
+    def document(self, *path):
+        collection_path, document_id = '/'.join(path).rsplit('/', 1)
+        return MemoryDocumentReference(self, collection_path, document_id)
+
+    def close(self):
+        pass
+
+
+# --- Async flavour (google.cloud.firestore.AsyncClient) ---
+#
+# Thin wrappers over the classes above: query building is unchanged, while the
+# calls that would reach the server (get/stream/set/commit/...) are coroutines
+# or async generators, as in the Firestore async API. The work itself is done
+# synchronously, since nothing here waits on I/O.
+
+def _sync_reference(reference):
+    return reference._reference if isinstance(reference, MemoryAsyncDocumentReference) else reference
+
+
+class MemoryAsyncDocumentReference:
+
+    def __init__(self, reference):
+        self._reference = reference
+        self.id = reference.id
+
+    @property
+    def path(self):
+        return self._reference.path
+
+    def collection(self, collection_id):
+        return MemoryAsyncCollectionReference(self._reference.collection(collection_id))
+
+    async def get(self, field_paths=None, transaction=None):
+        return self._reference.get(field_paths)
+
+    async def create(self, document_data):
+        return self._reference.create(document_data)
+
+    async def set(self, document_data, merge=False):
+        return self._reference.set(document_data, merge=merge)
+
+    async def update(self, field_updates):
+        return self._reference.update(field_updates)
+
+    async def delete(self):
+        return self._reference.delete()
+
+
+class MemoryAsyncQuery:
+
+    def __init__(self, query):
+        self._query = query
+
+    def select(self, field_paths):
+        return MemoryAsyncQuery(self._query.select(field_paths))
+
+    def where(self, field_path=None, op_string=None, value=None, *, filter=None):
+        return MemoryAsyncQuery(self._query.where(field_path, op_string, value, filter=filter))
+
+    def order_by(self, field_path, direction=firestore.Query.ASCENDING):
+        return MemoryAsyncQuery(self._query.order_by(field_path, direction=direction))
+
+    def start_after(self, document_fields_or_snapshot):
+        return MemoryAsyncQuery(self._query.start_after(document_fields_or_snapshot))
+
+    def offset(self, num_to_skip):
+        return MemoryAsyncQuery(self._query.offset(num_to_skip))
+
+    def limit(self, count):
+        return MemoryAsyncQuery(self._query.limit(count))
+
+    def count(self, alias=None):
+        return MemoryAsyncAggregationQuery(self._query.count(alias))
+
+    async def stream(self, transaction=None):
+        for snapshot in self._query.stream():
+            yield snapshot
+
+    async def get(self, transaction=None):
+        return self._query.get()
+
+
+class MemoryAsyncCollectionReference(MemoryAsyncQuery):
+
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.path = collection.path
+        self.id = collection.id
+
+    def document(self, document_id=None):
+        return MemoryAsyncDocumentReference(self._query.document(document_id))
+
+    async def add(self, document_data, document_id=None):
+        update_time, doc_ref = self._query.add(document_data, document_id)
+        return update_time, MemoryAsyncDocumentReference(doc_ref)
+
+
+class MemoryAsyncAggregationQuery:
+
+    def __init__(self, aggregation):
+        self._query = aggregation._query
+        self._aggregation = aggregation
+
+    async def get(self, transaction=None):
+        return self._aggregation.get()
+
+
+class MemoryAsyncWriteBatch:
+    """Writes are queued synchronously; only commit() is a coroutine (AsyncWriteBatch)."""
+
+    def __init__(self, batch):
+        self._batch = batch
+
+    def __len__(self):
+        return len(self._batch)
+
+    def create(self, reference, document_data):
+        self._batch.create(_sync_reference(reference), document_data)
+        return self
+
+    def set(self, reference, document_data, merge=False):
+        self._batch.set(_sync_reference(reference), document_data, merge=merge)
+        return self
+
+    def update(self, reference, field_updates):
+        self._batch.update(_sync_reference(reference), field_updates)
+        return self
+
+    def delete(self, reference):
+        self._batch.delete(_sync_reference(reference))
+        return self
+
+    async def commit(self):
+        return self._batch.commit()
+
+
+class MemoryAsyncTransaction(MemoryAsyncWriteBatch):
+    """AsyncTransaction stand-in used by MemoryDataStore.arun_transaction()."""
+
+    def get(self, ref_or_query):
+        # Like AsyncTransaction.get(), an async iterator of snapshots (even for
+        # a single reference): it cannot be awaited for one snapshot.
+        return self._snapshots(ref_or_query)
+
+    async def _snapshots(self, ref_or_query):
+        if isinstance(ref_or_query, (MemoryAsyncDocumentReference, MemoryDocumentReference)):
+            yield _sync_reference(ref_or_query).get()
+            return
+        for snapshot in await ref_or_query.get(transaction=self):
+            yield snapshot
+
+
+class MemoryAsyncFirestoreClient:
+    """In-memory stand-in for google.cloud.firestore.AsyncClient, sharing the data of a MemoryFirestoreClient."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def collection(self, *path):
+        return MemoryAsyncCollectionReference(self._client.collection(*path))
+
+    def document(self, *path):
+        return MemoryAsyncDocumentReference(self._client.document(*path))
+
+    def batch(self):
+        return MemoryAsyncWriteBatch(self._client.batch())
+
+    async def get_all(self, references, field_paths=None, transaction=None):
+        for reference in references:
+            yield _sync_reference(reference).get(field_paths)
+
+    def close(self):
+        pass
+
+
+class _UserMetadata:
+
+    def __init__(self, creation_timestamp, last_sign_in_timestamp=None):
+        self.creation_timestamp = creation_timestamp
+        self.last_sign_in_timestamp = last_sign_in_timestamp
+
+
+class MemoryUserRecord:
+    """Mirrors the attributes of firebase_admin.auth.UserRecord used by the app."""
+
+    def __init__(self, uid, email, display_name=None, last_sign_in_timestamp=None):
+        now_ms = int(datetime.datetime.now(datetime.timezone.utc).timestamp() * 1000)
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+        self.disabled = False
+        self.user_metadata = _UserMetadata(now_ms, last_sign_in_timestamp)
+
+
+class _MemoryUserPage:
+
+    def __init__(self, users):
+        self.users = users
+
+    def iterate_all(self):
+        return iter(self.users)
+
+
+class _MemoryDeleteUsersResult:
+    """Mirrors auth.DeleteUsersResult (in memory, deletions never fail)."""
+
+    def __init__(self, total):
+        self.success_count = total
+        self.failure_count = 0
+        self.errors = []
+
+
+class MemoryAuth:
+    """
+    In-memory stand-in for the firebase_admin.auth module functions we call.
+    ID tokens are simply the user's UID, which is enough for local runs.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+
+    def create_user(self, uid=None, email=None, password=None, display_name=None, **kwargs):
+        with self._lock:
+            if email and any(u.email == email for u in self._users.values()):
+                raise firebase_auth.EmailAlreadyExistsError(
+                    f"The user with the provided email already exists ({email}).", None, None)
+            user = MemoryUserRecord(uid or uuid.uuid4().hex[:28], email, display_name)
+            self._users[user.uid] = user
+        return user
+
+    def get_user(self, uid):
+        with self._lock:
+            user = self._users.get(uid)
+        if user is None:
+            raise firebase_auth.UserNotFoundError(f"No user record found for the provided user ID: {uid}.")
+        return user
+
+    def delete_user(self, uid):
+        with self._lock:
+            if self._users.pop(uid, None) is None:
+                raise firebase_auth.UserNotFoundError(f"No user record found for the provided user ID: {uid}.")
+
+    def delete_users(self, uids):
+        if len(uids) > 1000:
+            raise ValueError("`uids` parameter must have <= 1000 entries.")
+        with self._lock:
+            for uid in uids:
+                # As in Firebase, users that do not exist count as deleted.
+                self._users.pop(uid, None)
+        return _MemoryDeleteUsersResult(len(uids))
+
+    def list_users(self, page_token=None, max_results=1000):
+        with self._lock:
+            users = list(self._users.values())
+        return _MemoryUserPage(users)
+
+    def verify_id_token(self, id_token, check_revoked=False):
+        self.get_user(id_token)
+        return {'uid': id_token}
+
+
+def seed_synthetic_data(store, num_clients, num_distributors=100, months=12, seed=0):
+    """
+    Fills a datastore with synthetic distributors (Auth users plus Firestore
+    documents) and clients spread over the last `months` months.
+
+    Intended for local profiling against MemoryDataStore; returns the list of
+    distributor UIDs that were created.
+    """
+    rng = random.Random(seed)
+    now_utc = datetime.datetime.now(datetime.timezone.utc)
+
+    owner_ids = []
+    for i in range(num_distributors):
+        full_name = f"Distributor {i:04d}"
+        email = f"distributor{i:04d}@example.com"
+        user = store.users.create(email=email, password='password', display_name=full_name)
+        store.distributors.set(user.uid, {
+            'full_name': full_name,
+            'email': email,
+            'role': 'employee',
+            'created_at': now_utc,
+        })
+        owner_ids.append(user.uid)
+
+    clients = store.clients.collection()
+    monthly_counts = {}
+    for i in range(num_clients):
+        logged = now_utc - datetime.timedelta(seconds=rng.randrange(months * 30 * 24 * 3600))
+        owner_id = rng.choice(owner_ids)
+        period = period_for(logged)
+        monthly_counts[period, owner_id] = monthly_counts.get((period, owner_id), 0) + 1
+        contacts = [f"07{i:08d}", f"client{i:07d}@example.com" if i % 3 == 0 else None]
+        _, client_ref = clients.add({
+            'ownerId': owner_id,
+            'fullName': f"Client {i:07d}",
+            'contact1': contacts[0],
+            'contact2': contacts[1],
+            'initialNotes': '',
+            'dateLogged': logged,
+        })
+        for contact in filter(None, contacts):
+            store.contacts.document(contact).set({'clientId': client_ref.id, 'ownerId': owner_id})
+
+    # Same layout rebuild_monthly_counters() produces: each total on shard 0.
+    for (period, owner_id), count in monthly_counts.items():
+        store.monthly_counters.shard(period, owner_id, 0).set({'ownerId': owner_id, 'count': count})
+    for period in {period for period, _ in monthly_counts}:
+        store.monthly_counters.shards(period).document(COMPLETE_MARKER_ID).set({'rebuiltAt': now_utc})
+
+    return owner_ids
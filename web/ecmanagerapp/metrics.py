@@ -0,0 +1,124 @@
+import bisect
+import threading
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Upper bounds of the "RPCs per request" histogram buckets
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _format_labels(label_names, label_values):
+    if not label_names:
+        return ''
+    pairs = []
+    for name, value in zip(label_names, label_values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels, e.g. Counter('rpcs_total', 'help', ['view'])."""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        labels = tuple(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative histogram with labels, in the Prometheus bucket/sum/count layout."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values = {}   # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, labels=()):
+        labels = tuple(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', labels + (_format_number(bound),), cumulative))
+            samples.append((f'{self.name}_sum', labels, state[-1]))
+            samples.append((f'{self.name}_count', labels, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample_name, labels, value in metric.samples():
+                label_names = metric.label_names
+                if sample_name.endswith('_bucket'):
+                    label_names = label_names + ('le',)
+                lines.append(f'{sample_name}{_format_labels(label_names, labels)} {_format_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+rpcs_total = registry.register(Counter(
+    'ecmanager_rpcs_total', 'Firestore and Firebase Auth calls, by view.', ['view', 'service', 'method']))
+documents_read_total = registry.register(Counter(
+    'ecmanager_documents_read_total', 'Firestore documents read (billed reads), by view.', ['view']))
+document_bytes_read_total = registry.register(Counter(
+    'ecmanager_document_bytes_read_total', 'Estimated size of the Firestore documents read, by view.', ['view']))
+rpc_duration_seconds = registry.register(Histogram(
+    'ecmanager_rpc_duration_seconds', 'Latency of Firestore and Firebase Auth calls.', ['service', 'method']))
+request_duration_seconds = registry.register(Histogram(
+    'ecmanager_request_duration_seconds', 'Request latency, by view.', ['view']))
+request_rpcs = registry.register(Histogram(
+    'ecmanager_request_rpcs', 'Firestore and Auth calls made per request, by view.', ['view'], buckets=COUNT_BUCKETS))
+throttled_requests_total = registry.register(Counter(
+    'ecmanager_throttled_requests_total', 'Requests turned away by admission control, by scope and reason.',
+    ['scope', 'reason']))
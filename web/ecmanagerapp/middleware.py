@@ -0,0 +1,223 @@
+import cProfile
+import pstats
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+from .instrumentation import current_request_stats, end_request_stats, start_request_stats
+from .profiling import (
+    acquire_profile_slot, aprofiling_allowed, profiling_allowed, profiling_requested, release_profile_slot,
+    save_profile,
+)
+
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs natively in both modes: under ASGI with
+    async views it is called as a coroutine (__acall__), so Django does not
+    have to hop to a thread around it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def __acall__(self, request):
+        raise NotImplementedError
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.view_name if match else None) or 'unresolved'
+
+
+class FirestoreMetricsMiddleware(AsyncCapableMiddleware):
+    """
+    Accounts the Firestore and Firebase Auth calls made while handling each
+    request (including those made on the dashboard worker threads) and adds
+    them to the per-view metrics served at /metrics.
+
+    With settings.SERVER_TIMING_HEADER on, the totals are also returned in a
+    Server-Timing header, visible in the browser's network panel, e.g.
+    `firestore;dur=41.2;desc="6 calls, 120 docs", auth;dur=12.0, total;dur=63.5`.
+
+    Streaming responses are accounted up to the moment the response starts;
+    reads made while the body streams are counted as background work.
+    """
+
+    def handle(self, request):
+        stats, token = start_request_stats()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request_stats(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        # The stats context variable follows the request's task across awaits.
+        stats, token = start_request_stats()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request_stats(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    def _finish(self, request, response, stats, duration):
+        view = _view_name(request)
+
+        stats.flush(view)
+        metrics.request_duration_seconds.observe(duration, (view,))
+        metrics.request_rpcs.observe(stats.rpc_count, (view,))
+
+        if getattr(settings, 'SERVER_TIMING_HEADER', False):
+            firestore_ms = stats.durations.get('firestore', 0.0) * 1000
+            auth_ms = stats.durations.get('auth', 0.0) * 1000
+            response['Server-Timing'] = ', '.join([
+                f'firestore;dur={firestore_ms:.1f};desc="{stats.count_for("firestore")} calls, {stats.documents} docs"',
+                f'auth;dur={auth_ms:.1f};desc="{stats.count_for("auth")} calls"',
+                f'total;dur={duration * 1000:.1f}',
+            ])
+
+        return response
+
+
+class AsyncWhiteNoiseMiddleware(AsyncCapableMiddleware, WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that can sit in an async middleware chain. WhiteNoise
+    itself is sync-only, which would make Django run every request (and the
+    async views behind it) through a worker thread. Lookups are in-memory;
+    only serving a static file is handed to a thread.
+    """
+
+    def __init__(self, get_response=None, settings=settings):
+        WhiteNoiseMiddleware.__init__(self, get_response, settings=settings)
+        AsyncCapableMiddleware.__init__(self, get_response)
+
+    def handle(self, request):
+        return WhiteNoiseMiddleware.__call__(self, request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
+
+
+class RequestProfilerMiddleware(AsyncCapableMiddleware):
+    """
+    Profiles single requests on demand, for diagnosing slow pages in
+    production. An admin adds ?profile=1 (or an `X-Profile: 1` header) to a
+    request; the view runs under cProfile and the profile is stored for
+    download from /admins/profiles/. Its name comes back in an X-Profile-Id
+    header (or `X-Profile: skipped` when the rate limit refused it).
+
+    Needs settings.REQUEST_PROFILING_ENABLED and must come after
+    SessionMiddleware. cProfile only sees the threads it is enabled in: time
+    spent in the dashboard loader threads shows up as waiting on their
+    futures, so the Firestore totals of the request are stored alongside the
+    profile. Under ASGI the event loop and the thread that runs sync views
+    are profiled and merged; the loop's share also covers whatever else it
+    ran while the view was awaiting.
+    """
+
+    def handle(self, request):
+        if not profiling_requested(request) or not profiling_allowed(request):
+            return self.get_response(request)
+        if not acquire_profile_slot():
+            response = self.get_response(request)
+            response['X-Profile'] = 'skipped'
+            return response
+
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            name = self._save(request, response, profiler, time.perf_counter() - started,
+                              request.session.get('user', {}))
+        finally:
+            release_profile_slot()
+
+        if name:
+            response['X-Profile-Id'] = name
+        return response
+
+    async def __acall__(self, request):
+        if not profiling_requested(request) or not await aprofiling_allowed(request):
+            return await self.get_response(request)
+        if not acquire_profile_slot():
+            response = await self.get_response(request)
+            response['X-Profile'] = 'skipped'
+            return response
+
+        try:
+            profiler = cProfile.Profile()
+            started = time.perf_counter()
+            profiler.enable()
+            try:
+                # A sync view is called on a worker thread, out of sight of the
+                # loop's profiler: the rest of the chain is run from a profiled
+                # thread, which Django then calls thread-sensitive code in.
+                response, view_profiler = await sync_to_async(self._profile_thread)(request)
+            finally:
+                profiler.disable()
+            profile = pstats.Stats(profiler)
+            profile.add(view_profiler)
+            name = self._save(request, response, profile, time.perf_counter() - started,
+                              await request.session.aget('user', {}))
+        finally:
+            release_profile_slot()
+
+        if name:
+            response['X-Profile-Id'] = name
+        return response
+
+    def _profile_thread(self, request):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return async_to_sync(self.get_response)(request), profiler
+        finally:
+            profiler.disable()
+
+    def _save(self, request, response, profiler, duration, user):
+        view = _view_name(request)
+        details = {
+            'view': view,
+            'path': request.get_full_path(),
+            'method': request.method,
+            'status': response.status_code,
+            'user': (user or {}).get('email'),
+            'duration_ms': round(duration * 1000, 1),
+        }
+        stats = current_request_stats()
+        if stats is not None:
+            details['firestore_ms'] = round(stats.durations.get('firestore', 0.0) * 1000, 1)
+            details['auth_ms'] = round(stats.durations.get('auth', 0.0) * 1000, 1)
+            details['rpcs'] = stats.rpc_count
+            details['documents'] = stats.documents
+
+        return save_profile(profiler, view, details)
@@ -0,0 +1,176 @@
+import datetime
+import operator
+
+import pytz
+from django.conf import settings
+
+from .caching import TTLCache
+from .datastore import get_datastore
+
+
+def month_range(period):
+    """
+    Returns the naive UTC bounds (start_utc, end_utc) of a 'YYYY-MM' month in
+    the local timezone (settings.TIME_ZONE), for 'start <= dateLogged < end'.
+    """
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+    year, month = (int(part) for part in period.split('-'))
+
+    # Start of the month (e.g., Oct 1, 2025 00:00:00 local time)
+    start_of_month_local = local_tz.localize(datetime.datetime(year, month, 1))
+
+    # Find the first day of the next month to define the exclusive upper boundary
+    if month == 12:
+        start_of_next_month_local = local_tz.localize(datetime.datetime(year + 1, 1, 1))
+    else:
+        start_of_next_month_local = local_tz.localize(datetime.datetime(year, month + 1, 1))
+
+    # Convert local datetimes to UTC to match Firestore server timestamps
+    # NOTE: We use .replace(tzinfo=None) as Firestore SDK often expects naive datetime for comparison
+    start_of_month_utc = start_of_month_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    end_of_month_utc = start_of_next_month_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return start_of_month_utc, end_of_month_utc
+
+
+def period_for(timestamp=None):
+    """Returns the local 'YYYY-MM' period of a datetime (naive means UTC), or of now."""
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+    if timestamp is None:
+        return datetime.datetime.now(local_tz).strftime('%Y-%m')
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.astimezone(local_tz).strftime('%Y-%m')
+
+
+def current_month_range():
+    """
+    Returns the current month in the local timezone (settings.TIME_ZONE) as
+    (period, start_utc, end_utc), where period is 'YYYY-MM' and the bounds are
+    naive UTC datetimes for querying Firestore ('start <= dateLogged < end').
+    """
+    period = period_for()
+    start_of_month_utc, end_of_month_utc = month_range(period)
+    return period, start_of_month_utc, end_of_month_utc
+
+
+class MonthlyAggregate:
+    """
+    Client counts for one month, tallied by ownerId.
+
+    Attributes:
+        period (str): 'YYYY-MM' in the local timezone.
+        counts (dict): ownerId -> number of clients logged in the month.
+        total (int): number of clients logged in the month.
+    """
+
+    def __init__(self, period, counts):
+        self.period = period
+        self.counts = counts
+        self.total = sum(counts.values())
+
+    def count_for(self, owner_id):
+        return self.counts.get(owner_id, 0)
+
+    def top(self, top_n, distributor_map=None):
+        """
+        Returns up to `top_n` (ownerId, count) tuples sorted by count, highest
+        first. When `distributor_map` is given, owners missing from it
+        (e.g. deleted employees) are skipped.
+        """
+        counts = self.counts.items()
+        if distributor_map is not None:
+            counts = [(owner_id, count) for owner_id, count in counts if owner_id in distributor_map]
+        return sorted(counts, key=operator.itemgetter(1), reverse=True)[:top_n]
+
+
+# Memoized per month period; entries expire after MONTHLY_AGGREGATE_CACHE_TTL
+# seconds (default 60) and are dropped whenever a new lead is saved.
+_monthly_aggregate_cache = TTLCache(lambda: getattr(settings, 'MONTHLY_AGGREGATE_CACHE_TTL', 60))
+
+
+def _tally_owners(docs):
+    monthly_counts = {}
+    for doc in docs:
+        owner_id = doc.to_dict().get('ownerId', 'Unknown')
+        monthly_counts[owner_id] = monthly_counts.get(owner_id, 0) + 1
+    return monthly_counts
+
+
+def scan_monthly_counts(start_utc, end_utc, transaction=None):
+    """Tallies clients logged in [start_utc, end_utc) by ownerId, reading every document."""
+    # Query Clients globally by date range (ownerId only) and tally them by ownerId
+    clients = get_datastore().clients
+    query = clients.logged_between(start_utc, end_utc).select(clients.OWNER_FIELDS)
+    return _tally_owners(query.stream(transaction=transaction))
+
+
+async def ascan_monthly_counts(start_utc, end_utc):
+    """Async scan_monthly_counts(), through the async Firestore client."""
+    clients = get_datastore().aio.clients
+    return _tally_owners([
+        doc async for doc in clients.logged_between(start_utc, end_utc).select(clients.OWNER_FIELDS).stream()
+    ])
+
+
+def _counters_enabled():
+    # settings.MONTHLY_AGGREGATE_SOURCE: 'counters' reads the write-time sharded
+    # counters (O(distributors)) of the months they are complete for; 'scan'
+    # streams the month's clients (O(clients)).
+    return getattr(settings, 'MONTHLY_AGGREGATE_SOURCE', 'counters') == 'counters'
+
+
+def _compute_monthly_aggregate(period, start_utc, end_utc):
+    if _counters_enabled():
+        from .monthly_counter_utility import read_monthly_counts
+        monthly_counts = read_monthly_counts(period)
+        # Counters that were never backfilled would undercount: scan instead.
+        if monthly_counts is not None:
+            return MonthlyAggregate(period, monthly_counts)
+
+    return MonthlyAggregate(period, scan_monthly_counts(start_utc, end_utc))
+
+
+async def _acompute_monthly_aggregate(period, start_utc, end_utc):
+    if _counters_enabled():
+        from .monthly_counter_utility import aread_monthly_counts
+        monthly_counts = await aread_monthly_counts(period)
+        if monthly_counts is not None:
+            return MonthlyAggregate(period, monthly_counts)
+
+    return MonthlyAggregate(period, await ascan_monthly_counts(start_utc, end_utc))
+
+
+def get_monthly_aggregate():
+    """
+    Returns the MonthlyAggregate for the current month. It is computed once
+    and shared by the leaderboard and the top-distributor KPI, or read from
+    the live replica's month index when that is warm.
+    """
+    period, start_utc, end_utc = current_month_range()
+
+    from .replica import get_client_replica
+    replica = get_client_replica()
+    if replica is not None:
+        return MonthlyAggregate(period, replica.monthly_counts(period))
+
+    return _monthly_aggregate_cache.get_or_load(
+        period, lambda: _compute_monthly_aggregate(period, start_utc, end_utc))
+
+
+async def aget_monthly_aggregate():
+    """Async get_monthly_aggregate(), sharing its cache."""
+    period, start_utc, end_utc = current_month_range()
+
+    from .replica import get_client_replica
+    replica = get_client_replica()
+    if replica is not None:
+        return MonthlyAggregate(period, replica.monthly_counts(period))
+
+    return await _monthly_aggregate_cache.aget_or_load(
+        period, lambda: _acompute_monthly_aggregate(period, start_utc, end_utc))
+
+
+def invalidate_monthly_aggregate():
+    """Drops the memoized aggregate so the next read sees newly saved leads."""
+    _monthly_aggregate_cache.invalidate()
@@ -0,0 +1,174 @@
+import random
+
+from django.conf import settings
+from firebase_admin import firestore
+
+from .datastore import count_documents, get_datastore
+from .monthly_aggregate_utility import month_range, period_for, scan_monthly_counts
+
+
+def get_shard_count():
+    """Number of counter shards per (month, distributor); settings.MONTHLY_COUNTER_SHARDS."""
+    return getattr(settings, 'MONTHLY_COUNTER_SHARDS', 4)
+
+
+def increment_monthly_counter(batch, owner_id, period=None, amount=1, repositories=None):
+    """
+    Adds an increment (+1 by default) of the owner's counter for `period`
+    (default: the current month) to a write batch or transaction, so it commits
+    atomically with the client documents it counts. Pass the period of the
+    clients' dateLogged (see client_lead_utility.stamp_date_logged()). A random
+    shard is picked to spread write contention. Pass `repositories=store.aio`
+    for batches and transactions of the async client.
+    """
+    period = period or period_for()
+    shard_index = random.randrange(get_shard_count())
+    counters = (repositories or get_datastore()).monthly_counters
+    batch.set(counters.shard(period, owner_id, shard_index), {
+        'ownerId': owner_id,
+        'count': firestore.Increment(amount),
+    }, merge=True)
+
+
+# Document in a period's shard collection marking its counters as complete:
+# written by rebuild_monthly_counters(), and carried over to the next month
+# (counters complete at the end of a month keep counting through the next).
+COMPLETE_MARKER_ID = '_complete'
+
+
+def _sum_shards(docs):
+    """({ownerId: count}, complete) of a period's shard documents."""
+    monthly_counts = {}
+    complete = False
+    for doc in docs:
+        if doc.id == COMPLETE_MARKER_ID:
+            complete = True
+            continue
+        data = doc.to_dict()
+        owner_id = data.get('ownerId', 'Unknown')
+        monthly_counts[owner_id] = monthly_counts.get(owner_id, 0) + data.get('count', 0)
+    return monthly_counts, complete
+
+
+def previous_period(period):
+    """The 'YYYY-MM' month before `period`."""
+    year, month = (int(part) for part in period.split('-'))
+    year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+    return f'{year:04d}-{month:02d}'
+
+
+def _carry_over(counters, period, transaction):
+    """Marks `period` complete if the previous one is (re-read in the transaction, so a rebuild's marker is kept)."""
+    marker = counters.shards(period).document(COMPLETE_MARKER_ID)
+    previous_marker = counters.shards(previous_period(period)).document(COMPLETE_MARKER_ID)
+    if marker.get(transaction=transaction).exists or not previous_marker.get(transaction=transaction).exists:
+        return
+    transaction.set(marker, {'since': previous_period(period)})
+
+
+async def _acarry_over(counters, period, transaction):
+    """_carry_over() in a transaction of the async client."""
+    marker = counters.shards(period).document(COMPLETE_MARKER_ID)
+    previous_marker = counters.shards(previous_period(period)).document(COMPLETE_MARKER_ID)
+    if (await marker.get(transaction=transaction)).exists:
+        return
+    if not (await previous_marker.get(transaction=transaction)).exists:
+        return
+    transaction.set(marker, {'since': previous_period(period)})
+
+
+def read_monthly_counts(period, transaction=None):
+    """
+    Returns {ownerId: count} for a 'YYYY-MM' period by summing the counter
+    shards: one small document per shard instead of one per client. Pass
+    `transaction` to read them as part of a transaction.
+
+    Returns None when the period's counters are not known to be complete
+    (never backfilled, e.g. on a deployment that predates them); callers
+    then scan the month's clients instead.
+
+    A period whose previous one is complete is complete too. Its marker is
+    then carried over in a transaction of its own, and never within the
+    caller's: that one may be read-only, or retried.
+    """
+    store = get_datastore()
+    counters = store.monthly_counters
+    monthly_counts, complete = _sum_shards(counters.shards(period).stream(transaction=transaction))
+    if complete:
+        return monthly_counts
+
+    if not counters.shards(previous_period(period)).document(COMPLETE_MARKER_ID).get(transaction=transaction).exists:
+        return None
+    if transaction is None:
+        store.run_transaction(lambda own_transaction: _carry_over(counters, period, own_transaction))
+    return monthly_counts
+
+
+async def aread_monthly_counts(period):
+    """Async read_monthly_counts(), through the async Firestore client."""
+    store = get_datastore()
+    counters = store.aio.monthly_counters
+    monthly_counts, complete = _sum_shards(await counters.shards(period).get())
+    if complete:
+        return monthly_counts
+
+    if not (await counters.shards(previous_period(period)).document(COMPLETE_MARKER_ID).get()).exists:
+        return None
+    await store.arun_transaction(lambda transaction: _acarry_over(counters, period, transaction))
+    return monthly_counts
+
+
+def rebuild_monthly_counters(period):
+    """
+    Backfills/repairs the counters of one period from the raw clients, then
+    marks the period complete.
+
+    Each owner is recounted in its own transaction, which reads a count() of
+    the owner's clients in the month together with the owner's shards, sets
+    shard 0 to the count and deletes the other shards. An increment committing
+    meanwhile is therefore either included in the count or applied on top of
+    it, never overwritten, and a crash leaves each owner either untouched or
+    fully recounted (the period is only marked complete at the end, so it is
+    scanned until a rerun succeeds).
+
+    Run it with lead writes quiesced (submissions, imports and employee
+    deletion cascades paused): owners are recounted one at a time, so the
+    period as a whole is not rebuilt atomically.
+
+    Returns:
+        dict: The recomputed {ownerId: count} for the period.
+    """
+    store = get_datastore()
+    counters = store.monthly_counters
+    start_utc, end_utc = month_range(period)
+
+    # Owners with clients this month, plus those with shards but no clients left
+    owner_ids = set(scan_monthly_counts(start_utc, end_utc))
+    owner_ids.update(doc.to_dict().get('ownerId') for doc in counters.shards(period).stream()
+                     if doc.id != COMPLETE_MARKER_ID)
+    owner_ids.discard(None)
+
+    def recount(owner_id):
+        def write(transaction):
+            shards = list(counters.shards(period).where('ownerId', '==', owner_id).stream(transaction=transaction))
+            count = count_documents(store.clients.logged_between(start_utc, end_utc, owner_id=owner_id),
+                                    transaction=transaction)
+            kept = counters.shard(period, owner_id, 0)
+            for doc in shards:
+                if doc.id != kept.id:
+                    transaction.delete(doc.reference)
+            if count:
+                transaction.set(kept, {'ownerId': owner_id, 'count': count})
+            elif any(doc.id == kept.id for doc in shards):
+                transaction.delete(kept)
+            return count
+        return store.run_transaction(write)
+
+    monthly_counts = {}
+    for owner_id in sorted(owner_ids):
+        count = recount(owner_id)
+        if count:
+            monthly_counts[owner_id] = count
+
+    counters.shards(period).document(COMPLETE_MARKER_ID).set({'rebuiltAt': firestore.SERVER_TIMESTAMP})
+    return monthly_counts
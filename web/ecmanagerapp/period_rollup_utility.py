@@ -0,0 +1,296 @@
+import datetime
+
+import pytz
+from django.conf import settings
+from firebase_admin import firestore
+
+from .datastore import MAX_BATCH_WRITES, get_datastore
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+# --- Local calendar periods ---
+
+def local_today():
+    """Today's date in the local timezone (settings.TIME_ZONE)."""
+    return datetime.datetime.now(pytz.timezone(settings.TIME_ZONE)).date()
+
+
+def local_date(timestamp):
+    """Local date of a datetime (naive means UTC)."""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp.astimezone(pytz.timezone(settings.TIME_ZONE)).date()
+
+
+def days_range(start_date, end_date):
+    """Naive UTC bounds (start_utc, end_utc) of the local days [start_date, end_date)."""
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+
+    def midnight_utc(day):
+        local = local_tz.localize(datetime.datetime(day.year, day.month, day.day))
+        return local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    return midnight_utc(start_date), midnight_utc(end_date)
+
+
+def _next_month(day):
+    return datetime.date(day.year + 1, 1, 1) if day.month == 12 else datetime.date(day.year, day.month + 1, 1)
+
+
+def period_key(granularity, day):
+    """Key of the day/week/month containing `day`: '2025-10-07', '2025-W41' (ISO week) or '2025-10'."""
+    if granularity == 'day':
+        return day.isoformat()
+    if granularity == 'week':
+        year, week, _ = day.isocalendar()
+        return f'{year}-W{week:02d}'
+    return day.strftime('%Y-%m')
+
+
+def period_bounds(granularity, day):
+    """First day and the day after the last of the day/week/month starting at `day`."""
+    if granularity == 'day':
+        return day, day + datetime.timedelta(days=1)
+    if granularity == 'week':
+        return day, day + datetime.timedelta(days=7)
+    return day, _next_month(day)
+
+
+def plan_window(start_date, end_date, today=None):
+    """
+    Covers the closed part of [start_date, end_date) (the days before today)
+    with as few periods as possible: whole months, then whole ISO weeks, then
+    single days.
+
+    Returns:
+        list: (granularity, key, first_day, end_day) tuples in date order.
+    """
+    closed_end = min(end_date, today or local_today())
+    pieces = []
+    day = start_date
+    while day < closed_end:
+        if day.day == 1 and _next_month(day) <= closed_end:
+            granularity = 'month'
+        elif day.weekday() == 0 and day + datetime.timedelta(days=7) <= closed_end:
+            granularity = 'week'
+        else:
+            granularity = 'day'
+        first, end = period_bounds(granularity, day)
+        pieces.append((granularity, period_key(granularity, day), first, end))
+        day = end
+    return pieces
+
+
+# --- Counting ---
+
+def merge_counts(counts_list):
+    """Sums {ownerId: count} dicts."""
+    merged = {}
+    for counts in counts_list:
+        for owner_id, count in counts.items():
+            merged[owner_id] = merged.get(owner_id, 0) + count
+    return merged
+
+
+def scan_counts_by_day(start_date, end_date):
+    """
+    Tallies the clients logged on the local days [start_date, end_date) by
+    day and ownerId, reading every client document once.
+
+    Returns:
+        dict: {date: {ownerId: count}} with an entry for every day.
+    """
+    clients = get_datastore().clients
+    start_utc, end_utc = days_range(start_date, end_date)
+
+    per_day = {}
+    day = start_date
+    while day < end_date:
+        per_day[day] = {}
+        day += datetime.timedelta(days=1)
+
+    query = clients.logged_between(start_utc, end_utc).select(['ownerId', 'dateLogged'])
+    for doc in query.stream():
+        data = doc.to_dict()
+        counts = per_day.get(local_date(data['dateLogged']))
+        if counts is not None:
+            owner_id = data.get('ownerId', 'Unknown')
+            counts[owner_id] = counts.get(owner_id, 0) + 1
+    return per_day
+
+
+def roll_up(start_date, end_date, today=None):
+    """
+    Writes the rollups of the closed days in [start_date, end_date) from one
+    scan of their clients, plus those of the weeks and months lying entirely
+    inside the range (merged from the days). Existing rollups are overwritten.
+
+    Returns:
+        dict: {date: {ownerId: count}} of the rolled up days.
+    """
+    end_date = min(end_date, today or local_today())
+    if start_date >= end_date:
+        return {}
+
+    store = get_datastore()
+    per_day = scan_counts_by_day(start_date, end_date)
+
+    rollups = []
+    for granularity in GRANULARITIES:
+        day = start_date
+        while day < end_date:
+            first, end = period_bounds(granularity, day)
+            aligned = (granularity == 'day' or (granularity == 'week' and day.weekday() == 0)
+                       or (granularity == 'month' and day.day == 1))
+            if aligned and end <= end_date:
+                counts = merge_counts(per_day[d] for d in per_day if first <= d < end)
+                rollups.append((granularity, period_key(granularity, first), first, end, counts))
+                day = end
+            else:
+                day += datetime.timedelta(days=1)
+
+    db = store.db
+    batch = db.batch()
+    for granularity, key, first, end, counts in rollups:
+        batch.set(store.rollups.document(granularity, key), _rollup_data(first, end, counts))
+        if len(batch) >= MAX_BATCH_WRITES:
+            batch.commit()
+            batch = db.batch()
+    if len(batch):
+        batch.commit()
+
+    return per_day
+
+
+def _rollup_data(first, end, counts):
+    return {
+        'counts': counts,
+        'total': sum(counts.values()),
+        'start': first.isoformat(),
+        'end': end.isoformat(),
+        'rolledUpAt': firestore.SERVER_TIMESTAMP,
+    }
+
+
+def ensure_rollups(pieces, today=None):
+    """
+    Counts of closed periods given as (granularity, key, first_day, end_day)
+    tuples (see plan_window()), from their rollups. Missing weeks and months
+    are merged from their day rollups; days without one are scanned, one scan
+    per run of consecutive days, and everything computed is written back, so
+    each closed day is read from the raw clients at most once.
+
+    Returns:
+        dict: {key: {ownerId: count}} for every piece.
+    """
+    store = get_datastore()
+    db = store.db
+    if not pieces:
+        return {}
+
+    def read(refs):
+        # Day, week and month keys never collide, so the document ID identifies the period.
+        return {snapshot.id: snapshot.to_dict()['counts'] for snapshot in db.get_all(refs) if snapshot.exists}
+
+    # 1. The rollups themselves (one batched read)
+    found = read([store.rollups.document(granularity, key) for granularity, key, _, _ in pieces])
+    missing = [piece for piece in pieces if piece[1] not in found]
+    if not missing:
+        return found
+
+    # 2. The days of the missing periods, then a scan of the days still missing
+    days = sorted({first + datetime.timedelta(days=offset)
+                   for _, _, first, end in missing for offset in range((end - first).days)})
+    missing_days = {first for granularity, _, first, _ in missing if granularity == 'day'}
+    day_counts = {}
+    day_refs = [store.rollups.document('day', period_key('day', day)) for day in days if day not in missing_days]
+    for key, counts in (read(day_refs) if day_refs else {}).items():
+        day_counts[datetime.date.fromisoformat(key)] = counts
+
+    spans = []
+    for day in days:
+        if day in day_counts:
+            continue
+        if spans and spans[-1][1] == day:
+            spans[-1][1] = day + datetime.timedelta(days=1)
+        else:
+            spans.append([day, day + datetime.timedelta(days=1)])
+    for first, end in spans:
+        day_counts.update(roll_up(first, end, today))
+
+    # 3. Merge and store the missing weeks and months
+    batch = db.batch()
+    for granularity, key, first, end in missing:
+        found[key] = merge_counts(counts for day, counts in day_counts.items() if first <= day < end)
+        if granularity != 'day':
+            batch.set(store.rollups.document(granularity, key), _rollup_data(first, end, found[key]))
+            if len(batch) >= MAX_BATCH_WRITES:
+                batch.commit()
+                batch = db.batch()
+    if len(batch):
+        batch.commit()
+
+    return found
+
+
+def close_periods(today=None):
+    """
+    Writes the rollups of the periods that closed by `today`: yesterday, and
+    the week and month ending with it. Meant to run daily (see
+    `manage.py rollup_periods`); earlier gaps are filled on demand.
+
+    Returns:
+        dict: {key: {ownerId: count}} of the closed periods.
+    """
+    today = today or local_today()
+    yesterday = today - datetime.timedelta(days=1)
+    pieces = [('day', period_key('day', yesterday), yesterday, today)]
+    if today.weekday() == 0:
+        pieces.append(('week', period_key('week', yesterday), today - datetime.timedelta(days=7), today))
+    if today.day == 1:
+        pieces.append(('month', period_key('month', yesterday), yesterday.replace(day=1), today))
+    return ensure_rollups(pieces, today)
+
+
+def window_counts(start_date, end_date, today=None):
+    """
+    Client counts by ownerId for the local days [start_date, end_date).
+
+    Closed periods come from their rollups (see ensure_rollups()); only the
+    still-open part of the window (today onwards) is counted from the raw
+    clients.
+    """
+    today = today or local_today()
+    pieces = plan_window(start_date, end_date, today)
+    closed = ensure_rollups(pieces, today)
+    counts = [closed[key] for _, key, _, _ in pieces]
+
+    if end_date > today:
+        counts.append(merge_counts(scan_counts_by_day(max(start_date, today), end_date).values()))
+
+    return merge_counts(counts)
+
+
+def invalidate_rollups(days, store=None):
+    """
+    Deletes the rollups covering the given local dates (their day, week and
+    month), e.g. after clients of those days changed owner. They are rebuilt
+    by the next read or `manage.py rollup_periods`.
+    """
+    store = store or get_datastore()
+    refs = {}
+    for day in days:
+        for granularity in GRANULARITIES:
+            ref = store.rollups.document(granularity, period_key(granularity, day))
+            refs[ref.path] = ref
+
+    db = store.db
+    batch = db.batch()
+    for ref in refs.values():
+        batch.delete(ref)
+        if len(batch) >= MAX_BATCH_WRITES:
+            batch.commit()
+            batch = db.batch()
+    if len(batch):
+        batch.commit()
@@ -0,0 +1,165 @@
+import io
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+# Query flag / header that ask for a profile of the current request
+PROFILE_QUERY_FLAG = 'profile'
+PROFILE_HEADER = 'X-Profile'
+
+# Stored profile names: <timestamp>-<view>-<id>.prof
+PROFILE_NAME_RE = re.compile(r'^[0-9]{8}T[0-9]{6}-[A-Za-z0-9_.-]+-[0-9a-f]{8}\.prof$')
+
+_profile_lock = threading.Lock()
+_last_profile_at = 0.0
+
+
+def profiling_requested(request):
+    """True if the request carries ?profile=1 or an `X-Profile: 1` header."""
+    flag = request.GET.get(PROFILE_QUERY_FLAG) or request.headers.get(PROFILE_HEADER)
+    return str(flag).lower() in ('1', 'true', 'yes')
+
+
+def profiling_allowed(request):
+    """Profiling is opt-in (settings.REQUEST_PROFILING_ENABLED) and admin-only."""
+    if not getattr(settings, 'REQUEST_PROFILING_ENABLED', False):
+        return False
+    session = getattr(request, 'session', None)
+    user = session.get('user') if session is not None else None
+    return bool(user) and user.get('role') == 'admin'
+
+
+async def aprofiling_allowed(request):
+    """profiling_allowed() for async middleware (the session is loaded without blocking)."""
+    if not getattr(settings, 'REQUEST_PROFILING_ENABLED', False):
+        return False
+    session = getattr(request, 'session', None)
+    user = await session.aget('user') if session is not None else None
+    return bool(user) and user.get('role') == 'admin'
+
+
+def acquire_profile_slot():
+    """
+    Claims the right to profile one request. Only one request per process is
+    profiled at a time, and at most one every
+    settings.REQUEST_PROFILING_MIN_INTERVAL seconds (default 30), so a flag
+    left on in a browser tab cannot slow the site down. Returns False when
+    the slot is taken; release_profile_slot() must follow a True.
+    """
+    global _last_profile_at
+    if not _profile_lock.acquire(blocking=False):
+        return False
+    interval = getattr(settings, 'REQUEST_PROFILING_MIN_INTERVAL', 30)
+    if time.monotonic() - _last_profile_at < interval:
+        _profile_lock.release()
+        return False
+    _last_profile_at = time.monotonic()
+    return True
+
+
+def release_profile_slot():
+    _profile_lock.release()
+
+
+def get_profile_dir():
+    """Directory the profiles are written to (settings.REQUEST_PROFILE_DIR)."""
+    return getattr(settings, 'REQUEST_PROFILE_DIR', None) or os.path.join(settings.BASE_DIR, 'profiles')
+
+
+def _profile_path(name):
+    if not PROFILE_NAME_RE.match(name):
+        return None
+    return os.path.join(get_profile_dir(), name)
+
+
+def save_profile(profiler, view, details):
+    """
+    Writes a finished cProfile run (or pstats.Stats merging several) as
+    <timestamp>-<view>-<id>.prof (loadable with pstats or snakeviz) next to a
+    .json file holding `details`, then prunes the oldest ones beyond
+    settings.REQUEST_PROFILE_KEEP (default 20).
+
+    Returns:
+        str: The profile name, or None if it could not be written.
+    """
+    directory = get_profile_dir()
+    safe_view = re.sub(r'[^A-Za-z0-9_.-]', '_', view)
+    name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{safe_view}-{uuid.uuid4().hex[:8]}.prof"
+
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, name))
+        with open(os.path.join(directory, name[:-len('.prof')] + '.json'), 'w') as handle:
+            json.dump(details, handle)
+        _prune_profiles(getattr(settings, 'REQUEST_PROFILE_KEEP', 20))
+    except OSError as e:
+        print(f"Error saving request profile {name}: {e}", file=sys.stderr)
+        return None
+    return name
+
+
+def _prune_profiles(keep):
+    for name in [profile['name'] for profile in list_profiles()][keep:]:
+        for path in (_profile_path(name), _profile_path(name)[:-len('.prof')] + '.json'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Stored profiles, newest first, as dicts of name, size and request details."""
+    directory = get_profile_dir()
+    try:
+        names = sorted((name for name in os.listdir(directory) if PROFILE_NAME_RE.match(name)), reverse=True)
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(path[:-len('.prof')] + '.json') as handle:
+                details = json.load(handle)
+        except (OSError, ValueError):
+            details = {}
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        profiles.append({'name': name, 'size': size, **details})
+    return profiles
+
+
+def read_profile(name):
+    """Raw .prof bytes of a stored profile, or None if there is no such profile."""
+    path = _profile_path(name)
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as handle:
+            return handle.read()
+    except FileNotFoundError:
+        return None
+
+
+# Orderings offered for the text report
+PROFILE_REPORT_SORTS = ('cumulative', 'tottime', 'calls')
+
+
+def render_profile_report(name, sort='cumulative', limit=60):
+    """Plain-text pstats report of a stored profile (top `limit` functions), or None."""
+    path = _profile_path(name)
+    if path is None or not os.path.exists(path):
+        return None
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
@@ -0,0 +1,241 @@
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+from .datastore import get_datastore
+from .monthly_aggregate_utility import period_for
+
+
+class ClientReplica:
+    """
+    Per-process copy of the 'clients' and 'distributors' collections, loaded
+    once and kept current by Firestore snapshot listeners, with secondary
+    indexes for the dashboard reads:
+
+    - clients by ownerId
+    - client counts by month ('YYYY-MM' of dateLogged) and ownerId
+    - client ID by normalized contact (contact1 and contact2)
+
+    It is warm once the initial snapshot of both collections has arrived.
+    Accessors return copies, so callers may modify what they get.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._watches = []
+        self._clients_ready = threading.Event()
+        self._distributors_ready = threading.Event()
+
+        self._clients = {}          # client ID -> data
+        self._by_owner = {}         # ownerId -> {client ID}
+        self._period_counts = {}    # 'YYYY-MM' -> {ownerId: count}
+        self._by_contact = {}       # normalized contact -> client ID
+        self._distributors = {}     # UID -> full name
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Subscribes the snapshot listeners; the initial snapshots arrive asynchronously."""
+        self._watches = [
+            self.store.clients.collection().on_snapshot(self._on_clients_snapshot),
+            self.store.distributors.collection().on_snapshot(self._on_distributors_snapshot),
+        ]
+
+    def stop(self):
+        for watch in self._watches:
+            watch.unsubscribe()
+        self._watches = []
+        self._clients_ready.clear()
+        self._distributors_ready.clear()
+
+    @property
+    def is_listening(self):
+        """False once a listener stream has stopped (e.g. after an unrecoverable error)."""
+        return bool(self._watches) and all(watch.is_active for watch in self._watches)
+
+    @property
+    def is_warm(self):
+        return self._clients_ready.is_set() and self._distributors_ready.is_set() and self.is_listening
+
+    def wait_until_warm(self, timeout=None):
+        """Blocks until both initial snapshots are loaded; returns is_warm."""
+        self._clients_ready.wait(timeout)
+        self._distributors_ready.wait(timeout)
+        return self.is_warm
+
+    # --- Snapshot listeners ---
+
+    def _on_clients_snapshot(self, docs, changes, read_time):
+        try:
+            with self._lock:
+                for change in changes:
+                    doc_id = change.document.id
+                    self._remove_client(doc_id)
+                    if change.type.name != 'REMOVED':
+                        self._add_client(doc_id, change.document.to_dict())
+            self._clients_ready.set()
+        except Exception as e:
+            print(f"Client Replica Error: {e}", file=sys.stderr)
+
+    def _on_distributors_snapshot(self, docs, changes, read_time):
+        try:
+            with self._lock:
+                for change in changes:
+                    uid = change.document.id
+                    if change.type.name == 'REMOVED':
+                        self._distributors.pop(uid, None)
+                    else:
+                        data = change.document.to_dict()
+                        self._distributors[uid] = data.get('full_name') or f"ID: {uid}"
+            self._distributors_ready.set()
+        except Exception as e:
+            print(f"Distributor Replica Error: {e}", file=sys.stderr)
+
+    # --- Index maintenance (called with the lock held) ---
+
+    def _index_keys(self, data):
+        from .client_lead_utility import normalize_contact
+
+        owner_id = data.get('ownerId', 'Unknown')
+        date_logged = data.get('dateLogged')
+        period = period_for(date_logged) if date_logged else None
+        contacts = [normalize_contact(data.get(field)) for field in ('contact1', 'contact2')]
+        return owner_id, period, [contact for contact in contacts if contact]
+
+    def _add_client(self, doc_id, data):
+        self._clients[doc_id] = data
+        owner_id, period, contacts = self._index_keys(data)
+
+        self._by_owner.setdefault(owner_id, set()).add(doc_id)
+        if period:
+            counts = self._period_counts.setdefault(period, {})
+            counts[owner_id] = counts.get(owner_id, 0) + 1
+        for contact in contacts:
+            self._by_contact.setdefault(contact, doc_id)
+
+    def _remove_client(self, doc_id):
+        data = self._clients.pop(doc_id, None)
+        if data is None:
+            return
+        owner_id, period, contacts = self._index_keys(data)
+
+        self._by_owner.get(owner_id, set()).discard(doc_id)
+        if period:
+            counts = self._period_counts.get(period, {})
+            counts[owner_id] = counts.get(owner_id, 0) - 1
+            if counts[owner_id] <= 0:
+                counts.pop(owner_id)
+        for contact in contacts:
+            if self._by_contact.get(contact) == doc_id:
+                del self._by_contact[contact]
+
+    # --- Reads ---
+
+    def distributor_map(self):
+        with self._lock:
+            return dict(self._distributors)
+
+    def all_clients(self):
+        """Returns [(client ID, data)] for every client."""
+        with self._lock:
+            return [(doc_id, dict(data)) for doc_id, data in self._clients.items()]
+
+    def clients_of(self, owner_id):
+        """Returns [(client ID, data)] for one distributor, in document ID order."""
+        with self._lock:
+            return [(doc_id, dict(self._clients[doc_id])) for doc_id in sorted(self._by_owner.get(owner_id, ()))]
+
+    def count(self, owner_id=None):
+        with self._lock:
+            if owner_id is None:
+                return len(self._clients)
+            return len(self._by_owner.get(owner_id, ()))
+
+    def monthly_counts(self, period):
+        """Returns {ownerId: count} of clients logged in a 'YYYY-MM' period."""
+        with self._lock:
+            return dict(self._period_counts.get(period, {}))
+
+    def count_in_period(self, period, owner_id=None):
+        with self._lock:
+            counts = self._period_counts.get(period, {})
+            if owner_id is None:
+                return sum(counts.values())
+            return counts.get(owner_id, 0)
+
+    def client_for_contact(self, contact):
+        """Returns the ID of the client holding a normalized contact, or None."""
+        with self._lock:
+            return self._by_contact.get(contact)
+
+
+_replica = None
+_replica_lock = threading.Lock()
+# Starts since the replica was last warm, and the time.monotonic() before
+# which a replica that is not listening is not started again.
+_replica_starts = 0
+_replica_retry_at = 0.0
+
+
+def _retry_delay(starts):
+    # Doubles with every start that did not get warm, up to the maximum.
+    delay = getattr(settings, 'CLIENT_REPLICA_RETRY_DELAY', 5) * 2 ** (starts - 1)
+    return min(delay, getattr(settings, 'CLIENT_REPLICA_RETRY_MAX_DELAY', 300))
+
+
+def _needs_start():
+    return (_replica is None or not _replica.is_listening) and time.monotonic() >= _replica_retry_at
+
+
+def get_client_replica():
+    """
+    Returns the process-wide ClientReplica when settings.CLIENT_REPLICA_ENABLED
+    is on and its initial snapshots have loaded, otherwise None (callers then
+    query Firestore as usual). The listeners are started on the first call, in
+    the serving process itself, so forked workers each get their own.
+
+    A replica whose listeners failed to start or died is started again, but
+    each start is recorded first: until one gets warm, the next waits
+    settings.CLIENT_REPLICA_RETRY_DELAY seconds, doubling up to
+    CLIENT_REPLICA_RETRY_MAX_DELAY, so requests do not restart it in a loop.
+    """
+    global _replica, _replica_starts, _replica_retry_at
+    if not getattr(settings, 'CLIENT_REPLICA_ENABLED', False):
+        return None
+
+    if _needs_start():
+        with _replica_lock:
+            if _needs_start():
+                # First use, or the listeners died: (re)load from scratch.
+                if _replica is not None:
+                    _replica.stop()
+                _replica_starts += 1
+                _replica_retry_at = time.monotonic() + _retry_delay(_replica_starts)
+                replica = ClientReplica(get_datastore())
+                try:
+                    replica.start()
+                except Exception as e:
+                    print(f"Client Replica Start Error: {e}", file=sys.stderr)
+                    replica.stop()
+                _replica = replica
+
+    replica = _replica
+    if replica is None or not replica.is_warm:
+        return None
+    if _replica_starts:
+        with _replica_lock:
+            _replica_starts, _replica_retry_at = 0, 0.0
+    return replica
+
+
+def reset_client_replica():
+    """Stops the listeners and drops the replica (e.g. after set_datastore())."""
+    global _replica, _replica_starts, _replica_retry_at
+    with _replica_lock:
+        if _replica is not None:
+            _replica.stop()
+        _replica = None
+        _replica_starts, _replica_retry_at = 0, 0.0
@@ -1,3 +1,2233 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import contextvars
+import csv
+import datetime
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from firebase_admin import firestore
+from google.api_core.exceptions import AlreadyExists
+
+from . import (
+    apps, dashboard_push_utility, kpi_state_utility, monthly_aggregate_utility, monthly_counter_utility, profiling,
+)
+from .benchmark_utility import compare_to_baseline, percentile, reset_caches, run_benchmarks
+from .caching import TTLCache
+from .client_data_utility import ClientRecord, get_client_data, get_client_kpis
+from .client_export_utility import EXPORT_FIELDS, iter_client_documents
+from .client_import_utility import import_client_leads, iter_lead_records
+from .client_lead_utility import (
+    DuplicateContactError, asave_client_lead, build_contact_index, contact_is_claimed, save_client_lead,
+)
+from .concurrency import Loader, get_refresh_executor, run_loaders, run_parallel
+from .consumers import DashboardConsumer
+from .dashboard_push_utility import publish_new_leads
+from .datastore import FirebaseDataStore, MemoryDataStore, get_datastore, get_firebase_app, set_datastore
+from .distributor_data_utility import (
+    aget_distributor_data, aget_distributor_map, distributor_map_cache_stats, forget_distributor,
+    get_distributor_data, get_distributor_map, invalidate_distributor_data, invalidate_distributor_map,
+    remember_distributor,
+)
+from .employee_clients_data_utility import get_employee_clients
+from .employee_deletion_utility import (
+    CASCADE_PAGE_SIZE, EmployeeDeletionError, start_employee_deletion, wait_for_employee_deletion,
+)
+from .employee_leader_board_data_utility import get_monthly_leaderboard, rank_counts
+from .instrumentation import collect_request_stats, end_request_stats, start_request_stats
+from .kpi_state_utility import invalidate_kpi_state, refresh_kpi_state
+from .login_utility import (
+    SignInError, asign_in_with_password, get_async_http_client, get_distributor_profile, get_http_session,
+    invalidate_distributor_profile, sign_in_with_password,
+)
+from .memory_store import (
+    MemoryAggregationQuery, MemoryDocumentReference, MemoryFirestoreClient, MemoryQuery, seed_synthetic_data,
+)
+from .metrics import Histogram
+from .monthly_aggregate_utility import (
+    MonthlyAggregate, aget_monthly_aggregate, get_monthly_aggregate, invalidate_monthly_aggregate, month_range,
+    period_for, scan_monthly_counts,
+)
+from .monthly_counter_utility import (
+    COMPLETE_MARKER_ID, aread_monthly_counts, previous_period, read_monthly_counts, rebuild_monthly_counters,
+)
+from .period_rollup_utility import local_date, local_today, window_counts
+from .replica import ClientReplica, get_client_replica, reset_client_replica
+from .throttling import aacquire_slot, acquire_slot, arelease_slot, release_slot
+
+NUM_CLIENTS = 200
+NUM_DISTRIBUTORS = 5
+
+
+class ReadBudgetMixin:
+    """
+    assertNumQueries for Firestore: fails the test when the block makes more
+    Firestore/Auth calls or reads more documents than allowed.
+
+        with self.assertReadBudget(rpcs=5, collections={'distributors': 1}):
+            self.client.get('/employee/dashboard/')
+
+    `collections` caps the read calls (get/stream/get_all) per collection;
+    nested collections count under their top-level one, so the monthly counter
+    shards are budgeted as 'monthly_counters'.
+    """
+
+    @contextlib.contextmanager
+    def assertReadBudget(self, rpcs=None, documents=None, auth_calls=None, collections=None):
+        with collect_request_stats() as stats:
+            yield stats
+
+        reads = {}
+        for collection, count in stats.collection_reads.items():
+            root = collection.split('/')[0]
+            reads[root] = reads.get(root, 0) + count
+
+        failures = []
+        if rpcs is not None and stats.rpc_count > rpcs:
+            failures.append(f"{stats.rpc_count} Firestore/Auth calls, budget {rpcs}")
+        if documents is not None and stats.documents > documents:
+            failures.append(f"{stats.documents} documents read, budget {documents}")
+        if auth_calls is not None and stats.count_for('auth') > auth_calls:
+            failures.append(f"{stats.count_for('auth')} Auth calls, budget {auth_calls}")
+        for collection, budget in (collections or {}).items():
+            if reads.get(collection, 0) > budget:
+                failures.append(f"{reads[collection]} reads of '{collection}', budget {budget}")
+
+        if failures:
+            calls = ', '.join(f"{service}.{method} x{count}" for (service, method), count in sorted(stats.rpcs.items()))
+            self.fail('Read budget exceeded: ' + '; '.join(failures) + f"\nCalls: {calls}"
+                      + f"\nReads per collection: {stats.collection_reads}")
+
+
+class TTLCacheTests(TestCase):
+    """Single-flight loads and expiry of TTLCache, and the distributor map behind it."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        seed_synthetic_data(self.store, 20, NUM_DISTRIBUTORS)
+        invalidate_distributor_map()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+
+    def test_concurrent_misses_load_once(self):
+        cache = TTLCache(60)
+        calls = []
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait(2)
+            return {'value': len(calls)}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_load('key', loader))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'value': 1}] * 8)
+        self.assertEqual(cache.stats(), {'hits': 7, 'misses': 1, 'size': 1})
+
+    async def test_concurrent_async_misses_load_once(self):
+        cache = TTLCache(60)
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'value'
+
+        results = await asyncio.gather(*(cache.aget_or_load('key', loader) for _ in range(5)))
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(await cache.aget_or_load('key', loader), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_load_overlapping_an_invalidation_is_not_cached(self):
+        cache = TTLCache(60)
+        loads = iter(range(10))
+
+        def load_then_invalidate():
+            value = next(loads)
+            # A lead saved while the value was being read
+            cache.invalidate('key')
+            return value
+
+        self.assertEqual(cache.get_or_load('key', load_then_invalidate), 0)
+        self.assertEqual(cache.get_or_load('key', lambda: next(loads)), 1)
+
+    async def test_async_load_overlapping_an_invalidation_is_not_cached(self):
+        cache = TTLCache(60)
+        loads = iter(range(10))
+
+        async def load_then_invalidate():
+            value = next(loads)
+            cache.invalidate()
+            return value
+
+        async def load():
+            return next(loads)
+
+        self.assertEqual(await cache.aget_or_load('key', load_then_invalidate), 0)
+        self.assertEqual(await cache.aget_or_load('key', load), 1)
+
+    def test_refresh_runs_on_its_own_thread_in_the_callers_context(self):
+        cache = TTLCache(0)
+        caller = contextvars.ContextVar('caller')
+        caller.set('view')
+        seen = []
+
+        def loader():
+            seen.append((threading.current_thread().name, caller.get(None)))
+            return len(seen)
+
+        self.assertEqual(cache.get_or_refresh('key', loader, get_refresh_executor()), 1)
+        self.assertEqual(cache.get_or_refresh('key', loader, get_refresh_executor()), 1)
+        # A single thread: this runs once the refresh is done.
+        get_refresh_executor().submit(lambda: None).result(2)
+        self.assertEqual(seen[1][1], 'view')
+        self.assertTrue(seen[1][0].startswith('cache-refresh'))
+
+    def test_expired_and_invalidated_entries_are_reloaded(self):
+        ttl = [60]
+        cache = TTLCache(lambda: ttl[0])
+        loads = iter(range(10))
+        self.assertEqual(cache.get_or_load('key', lambda: next(loads)), 0)
+        self.assertEqual(cache.get_or_load('key', lambda: next(loads)), 0)
+        cache.invalidate('key')
+        self.assertEqual(cache.get_or_load('key', lambda: next(loads)), 1)
+
+        ttl[0] = 0
+        cache.invalidate()
+        self.assertEqual(cache.get_or_load('key', lambda: next(loads)), 2)
+        self.assertEqual(cache.get_or_load('key', lambda: next(loads)), 3)
+
+    def test_distributor_map_reads_the_collection_once_per_ttl(self):
+        distributors = self.store.distributors
+        with mock.patch.object(distributors, 'all', wraps=distributors.all) as read_all:
+            first = get_distributor_map()
+            for _ in range(3):
+                self.assertIs(get_distributor_map(), first)
+        self.assertEqual(read_all.call_count, 1)
+        self.assertEqual(len(first), NUM_DISTRIBUTORS)
+
+        distributors.document('new-uid').set({'full_name': 'New Distributor'})
+        self.assertNotIn('new-uid', get_distributor_map())
+        invalidate_distributor_map()
+        self.assertEqual(get_distributor_map()['new-uid'], 'New Distributor')
+
+    async def test_async_distributor_map_shares_the_cache(self):
+        with collect_request_stats() as stats:
+            first = await aget_distributor_map()
+            self.assertIs(get_distributor_map(), first)
+        self.assertEqual(stats.collection_reads, {'distributors': 1})
+
+
+class DashboardLoaderTests(TestCase):
+    """Concurrent dashboard loaders with per-loader timeouts and fallbacks."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        seed_synthetic_data(self.store, 20, NUM_DISTRIBUTORS)
+        invalidate_distributor_map()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+
+    def test_loaders_run_concurrently(self):
+        started = time.monotonic()
+        results, failed = run_loaders({
+            'first': Loader(time.sleep, 0.2),
+            'second': Loader(lambda: time.sleep(0.2) or 'done'),
+        })
+        self.assertLess(time.monotonic() - started, 0.35)
+        self.assertEqual((results, failed), ({'first': None, 'second': 'done'}, []))
+
+    def test_slow_loader_falls_back_after_its_timeout(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+        started = time.monotonic()
+        results, failed = run_loaders({
+            'slow': Loader(release.wait, 5, fallback='fallback', timeout=0.1),
+            'fast': Loader(lambda: 'value'),
+        }, timeout=5)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((results, failed), ({'slow': 'fallback', 'fast': 'value'}, ['slow']))
+
+    def test_failing_loader_falls_back(self):
+        def broken():
+            raise RuntimeError('Firestore unavailable')
+
+        results, failed = run_loaders({'broken': Loader(broken, fallback=[]), 'fine': Loader(len, 'abc')})
+        self.assertEqual((results, failed), ({'broken': [], 'fine': 3}, ['broken']))
+
+    @override_settings(DASHBOARD_LOADER_TIMEOUT=0.2)
+    def test_admin_dashboard_renders_what_loaded(self):
+        session = self.client.session
+        session['user'] = {'uid': 'admin-uid', 'email': 'admin@example.com', 'role': 'admin'}
+        session.save()
+
+        contexts = []
+
+        def render(request, template, context):
+            contexts.append(context)
+            return HttpResponse()
+
+        async def stalled_kpis():
+            await asyncio.sleep(5)
+
+        with mock.patch('ecmanagerapp.views.render', render), \
+                mock.patch('ecmanagerapp.views.aget_client_kpis', stalled_kpis):
+            response = self.client.get('/admins/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(contexts[0]['total_employees'], NUM_DISTRIBUTORS)
+        self.assertEqual((contexts[0]['kpi_total_clients'], contexts[0]['kpi_top_distributor']), (0, 'N/A'))
+        self.assertEqual([str(message) for message in get_messages(response.wsgi_request)],
+                         ['Some dashboard data could not be loaded. Please refresh shortly.'])
+
+
+class MonthlyAggregateTests(TestCase):
+    """One current-month tally shared by the leaderboard and the top-distributor KPI."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        now_utc = datetime.datetime.now(datetime.timezone.utc)
+        for uid, name in (('a', 'Alice'), ('b', 'Bob')):
+            self.store.distributors.set(uid, {'full_name': name})
+        # 'gone' is a deleted employee: counted, but never ranked
+        for owner_id, count in (('a', 2), ('b', 3), ('gone', 5)):
+            for _ in range(count):
+                self.store.clients.collection().add({'ownerId': owner_id, 'fullName': 'Lead', 'dateLogged': now_utc})
+        self.store.clients.collection().add({'ownerId': 'a', 'fullName': 'Old lead',
+                                             'dateLogged': now_utc - datetime.timedelta(days=62)})
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+
+    def test_top_skips_unknown_owners(self):
+        aggregate = MonthlyAggregate('2026-01', {'a': 2, 'b': 3, 'gone': 5})
+        self.assertEqual(aggregate.total, 10)
+        self.assertEqual(aggregate.top(1), [('gone', 5)])
+        self.assertEqual(aggregate.top(3, {'a': 'Alice', 'b': 'Bob'}), [('b', 3), ('a', 2)])
+
+    def test_leaderboard_and_kpi_share_one_scan(self):
+        with mock.patch('ecmanagerapp.monthly_aggregate_utility._compute_monthly_aggregate',
+                        wraps=monthly_aggregate_utility._compute_monthly_aggregate) as compute:
+            leaderboard = get_monthly_leaderboard(3)
+            kpis = get_employee_clients('a')
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(leaderboard, [{'name': 'Bob', 'count': 3}, {'name': 'Alice', 'count': 2}])
+        self.assertEqual((kpis['kpi_top_distributor_name'], kpis['kpi_top_distributor_count']), ('Bob', 3))
+        self.assertEqual(get_monthly_aggregate().counts, {'a': 2, 'b': 3, 'gone': 5})
+
+    def test_invalidation_picks_up_new_leads(self):
+        self.assertEqual(get_monthly_aggregate().count_for('a'), 2)
+        self.store.clients.collection().add({'ownerId': 'a', 'fullName': 'Lead',
+                                             'dateLogged': datetime.datetime.now(datetime.timezone.utc)})
+        self.assertEqual(get_monthly_aggregate().count_for('a'), 2)
+        invalidate_monthly_aggregate()
+        self.assertEqual(get_monthly_aggregate().count_for('a'), 3)
+
+
+@override_settings(MONTHLY_COUNTER_SHARDS=4)
+class MonthlyCounterTests(TestCase):
+    """Sharded monthly counters: increments, the backfill marker and rebuilds."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        self.period = period_for()
+        self.next_contact = 0
+        invalidate_monthly_aggregate()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_monthly_aggregate()
+
+    def add_lead(self, owner_id):
+        self.next_contact += 1
+        save_client_lead(owner_id, {'ownerId': owner_id, 'fullName': 'Lead',
+                                    'contact1': f'0766{self.next_contact:06d}',
+                                    'dateLogged': firestore.SERVER_TIMESTAMP})
+
+    def add_uncounted_client(self, owner_id):
+        # A client saved before the counters existed
+        self.store.clients.collection().add({'ownerId': owner_id, 'fullName': 'Old',
+                                             'dateLogged': datetime.datetime.now(datetime.timezone.utc)})
+
+    def test_increments_are_spread_over_shards_and_summed(self):
+        for _ in range(20):
+            self.add_lead('a')
+        self.add_lead('b')
+        rebuild_monthly_counters(self.period)
+        for _ in range(20):
+            self.add_lead('a')
+
+        shards = [doc.id for doc in self.store.monthly_counters.shards(self.period).get()]
+        self.assertGreater(len([shard for shard in shards if shard.startswith('a_')]), 1)
+        self.assertEqual(read_monthly_counts(self.period), {'a': 40, 'b': 1})
+
+    def test_submitted_lead_is_counted(self):
+        rebuild_monthly_counters(self.period)
+        session = self.client.session
+        session['user'] = {'uid': 'a', 'email': 'a@example.com', 'role': 'employee'}
+        session.save()
+        lead = {'fullName': 'New Lead', 'contact1': '0711111111'}
+        response = self.client.post('/api/submit_client_lead/', json.dumps(lead), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(read_monthly_counts(self.period), {'a': 1})
+
+    def test_months_without_backfill_are_scanned(self):
+        for _ in range(3):
+            self.add_uncounted_client('a')
+        self.add_lead('a')
+
+        # Only the new lead is in the counters, so they are not trusted yet.
+        self.assertIsNone(read_monthly_counts(self.period))
+        self.assertEqual(get_monthly_aggregate().counts, {'a': 4})
+
+    def test_rebuild_keeps_increments_made_while_it_runs(self):
+        for _ in range(3):
+            self.add_uncounted_client('a')
+        scan = monthly_counter_utility.scan_monthly_counts
+
+        def scan_then_submit(*args, **kwargs):
+            counts = scan(*args, **kwargs)
+            self.add_lead('a')
+            return counts
+
+        with mock.patch.object(monthly_counter_utility, 'scan_monthly_counts', scan_then_submit):
+            rebuild_monthly_counters(self.period)
+        self.assertEqual(read_monthly_counts(self.period), {'a': 4})
+
+    def test_backfilled_month_is_read_from_the_shards_only(self):
+        for _ in range(5):
+            self.add_uncounted_client('a')
+        rebuild_monthly_counters(self.period)
+        self.add_lead('b')
+
+        with mock.patch.object(monthly_aggregate_utility, 'scan_monthly_counts', side_effect=AssertionError('scanned')):
+            self.assertEqual(get_monthly_aggregate().counts, {'a': 5, 'b': 1})
+
+    def test_rebuild_marks_the_month_and_the_next_one_inherits_it(self):
+        for _ in range(3):
+            self.add_uncounted_client('a')
+        self.store.monthly_counters.shard(self.period, 'gone', 1).set({'ownerId': 'gone', 'count': 5})
+
+        self.assertEqual(rebuild_monthly_counters(self.period), {'a': 3})
+        self.assertEqual(read_monthly_counts(self.period), {'a': 3})
+        self.assertEqual(sorted(doc.id for doc in self.store.monthly_counters.shards(self.period).get()),
+                         [COMPLETE_MARKER_ID, 'a_0'])
+
+        earlier = previous_period(self.period)
+        self.assertIsNone(read_monthly_counts(earlier))
+        following = period_for(month_range(self.period)[1])
+        self.assertEqual(read_monthly_counts(following), {})
+
+    def test_leads_are_counted_in_the_month_they_are_stored_under(self):
+        # Firestore's clock is already in the next month, e.g. at midnight on the last day.
+        server_now = month_range(self.period)[1].replace(tzinfo=datetime.timezone.utc) + datetime.timedelta(seconds=1)
+        with mock.patch.object(MemoryFirestoreClient, '_now', return_value=server_now):
+            self.add_lead('a')
+            import_client_leads([(1, {'fullName': 'Imported', 'contact1': '0755555555'}, None)], 'b')
+
+        stored = {period_for(doc.to_dict()['dateLogged']) for doc in self.store.clients.collection().get()}
+        self.assertEqual(stored, {self.period})
+        counted = {doc.to_dict()['ownerId'] for doc in self.store.monthly_counters.shards(self.period).get()}
+        self.assertEqual(counted, {'a', 'b'})
+
+    def test_carried_over_marker_is_written_in_its_own_transaction(self):
+        rebuild_monthly_counters(previous_period(self.period))
+        self.add_lead('a')
+        marker = self.store.monthly_counters.shards(self.period).document(COMPLETE_MARKER_ID)
+
+        # Never into the caller's transaction, which may well be read-only
+        counts = self.store.run_transaction(lambda transaction: read_monthly_counts(self.period, transaction),
+                                            read_only=True)
+        self.assertEqual(counts, {'a': 1})
+        self.assertFalse(marker.get().exists)
+
+        with collect_request_stats() as stats:
+            self.assertEqual(read_monthly_counts(self.period), {'a': 1})
+        self.assertEqual(marker.get().to_dict(), {'since': previous_period(self.period)})
+        self.assertNotIn(('firestore', 'set'), stats.rpcs)
+        self.assertEqual(stats.rpcs[('firestore', 'transaction')], 1)
+
+    async def test_async_read_matches_the_sync_one(self):
+        await sync_to_async(self.add_uncounted_client)('a')
+        self.assertIsNone(await aread_monthly_counts(self.period))
+        self.assertEqual((await aget_monthly_aggregate()).counts, {'a': 1})
+
+        await sync_to_async(rebuild_monthly_counters)(self.period)
+        following = period_for(month_range(self.period)[1])
+        self.assertEqual(await aread_monthly_counts(self.period), {'a': 1})
+        with collect_request_stats() as stats:
+            self.assertEqual(await aread_monthly_counts(following), {})
+        self.assertNotIn(('firestore', 'set'), stats.rpcs)
+        self.assertEqual(stats.rpcs[('firestore', 'transaction')], 1)
+        self.assertEqual(read_monthly_counts(following), {})
+
+    def test_previous_period_wraps_the_year(self):
+        self.assertEqual(previous_period('2026-01'), '2025-12')
+        self.assertEqual(previous_period('2026-10'), '2026-09')
+
+
+@override_settings(CLIENT_REPLICA_ENABLED=False)
+class KpiStateTests(ReadBudgetMixin, TestCase):
+    """Admin KPIs folded incrementally past the dateLogged watermark."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        self.owner_ids = seed_synthetic_data(self.store, NUM_CLIENTS, NUM_DISTRIBUTORS)
+        reset_caches()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        reset_caches()
+
+    def add_leads(self, count, owner_id=None):
+        for i in range(count):
+            save_client_lead(owner_id or self.owner_ids[0], {
+                'ownerId': owner_id or self.owner_ids[0],
+                'fullName': f'Lead {i}',
+                'contact1': f'0788{i:06d}',
+                'dateLogged': firestore.SERVER_TIMESTAMP,
+            })
+
+    def counted_kpis(self):
+        with override_settings(CLIENT_KPI_SOURCE='count'):
+            reset_caches()
+            return get_client_kpis()
+
+    def test_refresh_reads_only_new_leads(self):
+        refresh_kpi_state()
+        self.add_leads(3)
+
+        # The state, the tail past its watermark, then the compare-and-set
+        with self.assertReadBudget(rpcs=4, collections={'kpi_state': 2, 'clients': 1,
+                                                        'monthly_counters': 0}) as stats:
+            state = refresh_kpi_state()
+        self.assertEqual(stats.collection_documents['clients'], 3)
+        self.assertEqual(state['total'], NUM_CLIENTS + 3)
+
+        # Leads inside the overlap are read again but never counted twice.
+        self.assertEqual(refresh_kpi_state()['total'], NUM_CLIENTS + 3)
+        self.assertEqual(get_client_kpis(), self.counted_kpis())
+
+    def test_refresh_without_new_leads_writes_nothing(self):
+        refresh_kpi_state()
+        with collect_request_stats() as stats:
+            self.assertEqual(refresh_kpi_state()['total'], NUM_CLIENTS)
+        self.assertEqual(stats.rpcs, {('firestore', 'get'): 1, ('firestore', 'stream'): 1})
+
+    def test_concurrent_refresh_keeps_the_first_commit(self):
+        refresh_kpi_state()
+        self.add_leads(3)
+        tail = kpi_state_utility._tail
+
+        def racing_tail(*args, **kwargs):
+            leads = tail(*args, **kwargs)
+            # Another lead arrives and another refresh commits it while this one folds.
+            save_client_lead(self.owner_ids[0], {'ownerId': self.owner_ids[0], 'fullName': 'Late Lead',
+                                                 'contact1': '0799000000', 'dateLogged': firestore.SERVER_TIMESTAMP})
+            with mock.patch.object(kpi_state_utility, '_tail', tail):
+                refresh_kpi_state()
+            return leads
+
+        with mock.patch.object(kpi_state_utility, '_tail', racing_tail):
+            self.assertEqual(refresh_kpi_state()['total'], NUM_CLIENTS + 4)
+        self.assertEqual(self.store.kpi_state.document('clients').get().to_dict()['total'], NUM_CLIENTS + 4)
+
+    def test_reconciliation_reads_in_a_read_only_transaction(self):
+        run_transaction = MemoryDataStore.run_transaction
+        with mock.patch.object(MemoryDataStore, 'run_transaction', autospec=True,
+                               side_effect=run_transaction) as transactions:
+            refresh_kpi_state()
+        self.assertEqual([call.kwargs.get('read_only', False) for call in transactions.call_args_list],
+                         [True, False])
+        with self.assertRaises(ValueError):
+            self.store.run_transaction(lambda transaction: transaction.delete(self.store.kpi_state.document('x')),
+                                       read_only=True)
+
+    def test_deleted_clients_are_reconciled(self):
+        refresh_kpi_state()
+        self.add_leads(2, self.owner_ids[1])
+        refresh_kpi_state()
+        start_employee_deletion([self.owner_ids[1]], mode='archive', background=False)
+
+        self.assertIsNone(self.store.kpi_state.document('clients').get().to_dict())
+        self.assertEqual(get_client_kpis(), self.counted_kpis())
+
+    def test_periodic_reconciliation(self):
+        refresh_kpi_state()
+        # A change behind the watermark is only seen by a full reconciliation.
+        self.store.clients.collection().get()[0].reference.delete()
+        self.assertEqual(refresh_kpi_state()['total'], NUM_CLIENTS)
+        with override_settings(KPI_RECONCILE_INTERVAL=0):
+            self.assertEqual(refresh_kpi_state()['total'], NUM_CLIENTS - 1)
+        invalidate_kpi_state()
+        self.assertEqual(refresh_kpi_state()['total'], NUM_CLIENTS - 1)
+
+
+class LeaderboardRollupTests(ReadBudgetMixin, TestCase):
+    """Window leaderboards built from day/week/month rollups."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        seed_synthetic_data(self.store, NUM_CLIENTS * 3, NUM_DISTRIBUTORS, months=3)
+        reset_caches()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        reset_caches()
+
+    def scanned(self, start, end):
+        counts = {}
+        for doc in self.store.clients.collection().get():
+            data = doc.to_dict()
+            if start <= local_date(data['dateLogged']) < end:
+                counts[data['ownerId']] = counts.get(data['ownerId'], 0) + 1
+        return counts
+
+    def test_window_counts_match_a_full_scan(self):
+        today = local_today()
+        for days in (1, 9, 45, 100):
+            start = today - datetime.timedelta(days=days)
+            end = today + datetime.timedelta(days=1)
+            self.assertEqual(window_counts(start, end), self.scanned(start, end))
+
+    def test_closed_periods_are_read_from_rollups(self):
+        today = local_today()
+        start, end = today - datetime.timedelta(days=80), today + datetime.timedelta(days=1)
+        window_counts(start, end)
+
+        # Second time: one batched rollup read, and only today is scanned.
+        with self.assertReadBudget(rpcs=2, collections={'rollups': 1, 'clients': 1}) as stats:
+            counts = window_counts(start, end)
+        self.assertEqual(counts, self.scanned(start, end))
+        self.assertLessEqual(stats.collection_documents.get('clients', 0),
+                             sum(self.scanned(today, end).values()))
+
+    def test_ties_share_a_rank_and_are_kept(self):
+        names = {uid: uid.upper() for uid in 'abcde'}
+        rows = rank_counts({'a': 5, 'b': 5, 'c': 3, 'd': 3, 'e': 1, 'gone': 9}, 3, names)
+        self.assertEqual([(row['rank'], row['name'], row['count']) for row in rows],
+                         [(1, 'A', 5), (1, 'B', 5), (3, 'C', 3), (3, 'D', 3)])
+
+
+class LeaderboardRollupTests(ReadBudgetMixin, TestCase):
+    """Window leaderboards built from day/week/month rollups."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        seed_synthetic_data(self.store, NUM_CLIENTS * 3, NUM_DISTRIBUTORS, months=3)
+        reset_caches()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        reset_caches()
+
+    def scanned(self, start, end):
+        counts = {}
+        for doc in self.store.clients.collection().get():
+            data = doc.to_dict()
+            if start <= local_date(data['dateLogged']) < end:
+                counts[data['ownerId']] = counts.get(data['ownerId'], 0) + 1
+        return counts
+
+    def test_window_counts_match_a_full_scan(self):
+        today = local_today()
+        for days in (1, 9, 45, 100):
+            start = today - datetime.timedelta(days=days)
+            end = today + datetime.timedelta(days=1)
+            self.assertEqual(window_counts(start, end), self.scanned(start, end))
+
+    def test_closed_periods_are_read_from_rollups(self):
+        today = local_today()
+        start, end = today - datetime.timedelta(days=80), today + datetime.timedelta(days=1)
+        window_counts(start, end)
+
+        # Second time: one batched rollup read, and only today is scanned.
+        with self.assertReadBudget(rpcs=2, collections={'rollups': 1, 'clients': 1}) as stats:
+            counts = window_counts(start, end)
+        self.assertEqual(counts, self.scanned(start, end))
+        self.assertLessEqual(stats.collection_documents.get('clients', 0),
+                             sum(self.scanned(today, end).values()))
+
+    def test_ties_share_a_rank_and_are_kept(self):
+        names = {uid: uid.upper() for uid in 'abcde'}
+        rows = rank_counts({'a': 5, 'b': 5, 'c': 3, 'd': 3, 'e': 1, 'gone': 9}, 3, names)
+        self.assertEqual([(row['rank'], row['name'], row['count']) for row in rows],
+                         [(1, 'A', 5), (1, 'B', 5), (3, 'C', 3), (3, 'D', 3)])
+
+
+@override_settings(
+    CLIENT_REPLICA_ENABLED=False,
+    RATE_LIMITS={'login': '2/m'},
+    CONCURRENCY_LIMITS={'admin_client_list': 1},
+    CONCURRENCY_QUEUE_TIMEOUT=0,
+)
+class ClientListApiTests(TestCase):
+    """The admin client table's paginated API (DataTables server-side mode)."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_map()
+        self.store.distributors.set('a', {'full_name': 'Alice Distributor'})
+        start = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        # Ten clients, one a day, alternating owners 'a' and 'b'
+        self.ids = []
+        for day in range(10):
+            _, ref = self.store.clients.collection().add({
+                'ownerId': 'ab'[day % 2], 'fullName': f'Client {day}', 'contact1': f'07000000{day:02d}',
+                'dateLogged': start + datetime.timedelta(days=day),
+            })
+            self.ids.append(ref.id)
+
+        session = self.client.session
+        session['user'] = {'uid': 'admin-uid', 'email': 'admin@example.com', 'role': 'admin'}
+        session.save()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+
+    def page(self, **params):
+        response = self.client.get('/api/clients/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_the_cursor(self):
+        first = self.page(draw=3, length=4)
+        self.assertEqual(first['draw'], 3)
+        self.assertEqual(first['recordsTotal'], 10)
+        self.assertEqual([row['id'] for row in first['data']], self.ids[:-5:-1])
+        self.assertEqual(first['data'][0]['distributor_name'], 'b')
+        self.assertEqual(first['data'][1]['distributor_name'], 'Alice Distributor')
+
+        second = self.page(length=4, start=4, cursor=first['next_cursor'])
+        self.assertEqual([row['id'] for row in second['data']], self.ids[5:1:-1])
+        last = self.page(length=4, start=8, cursor=second['next_cursor'])
+        self.assertEqual([row['id'] for row in last['data']], self.ids[1::-1])
+        self.assertIsNone(last['next_cursor'])
+
+    def test_offset_order_and_owner_filter(self):
+        oldest = self.page(length=3, start=2, **{'order[0][dir]': 'asc'})
+        self.assertEqual([row['id'] for row in oldest['data']], self.ids[2:5])
+
+        owned = self.page(owner='a', length=25)
+        self.assertEqual([row['id'] for row in owned['data']], self.ids[8::-2])
+        self.assertEqual(owned['recordsFiltered'], 5)
+        self.assertEqual(owned['recordsTotal'], 10)
+
+    def test_page_size_is_capped_and_parameters_checked(self):
+        with mock.patch('ecmanagerapp.views.CLIENT_PAGE_MAX_SIZE', 3):
+            self.assertEqual(len(self.page(length=-1)['data']), 3)
+        self.assertEqual(self.client.get('/api/clients/', {'start': 'x'}).status_code, 400)
+
+        session = self.client.session
+        session['user'] = {'uid': 'a', 'email': 'a@example.com', 'role': 'employee'}
+        session.save()
+        self.assertEqual(self.client.get('/api/clients/').status_code, 302)
+
+
+class ClientCountTests(TestCase):
+    """KPI counts from parallel count() aggregations instead of streamed clients."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+        now_utc = datetime.datetime.now(datetime.timezone.utc)
+        self.store.distributors.set('a', {'full_name': 'Alice'})
+        self.store.distributors.set('b', {'full_name': 'Bob'})
+        for owner_id, days_ago in (('a', 0), ('a', 0), ('a', 70), ('b', 0), ('b', 80), ('b', 90)):
+            self.store.clients.collection().add({'ownerId': owner_id, 'fullName': 'Lead',
+                                                 'dateLogged': now_utc - datetime.timedelta(days=days_ago)})
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+
+    @contextlib.contextmanager
+    def clients_never_streamed(self):
+        stream = MemoryQuery.stream
+        clients_path = self.store.clients.path
+
+        def guarded(query, transaction=None):
+            if query._collection.path == clients_path:
+                raise AssertionError('clients were streamed')
+            return stream(query, transaction)
+
+        with mock.patch.object(MemoryQuery, 'stream', guarded):
+            yield
+
+    @override_settings(CLIENT_KPI_SOURCE='count')
+    def test_admin_kpis_are_counted_server_side(self):
+        rebuild_monthly_counters(period_for())
+        get_distributor_map()
+        with self.clients_never_streamed():
+            kpis = get_client_kpis()
+        self.assertEqual(kpis, {'kpi_total_clients': 6, 'kpi_clients_month': 3,
+                                'kpi_top_distributor': 'Alice', 'num_clients': 2})
+
+    def test_employee_counts(self):
+        kpis = get_employee_clients('b')
+        self.assertEqual((kpis['kpi_total_clients'], kpis['kpi_clients_month'], len(kpis['clients'])), (3, 1, 3))
+        self.assertEqual((kpis['kpi_top_distributor_name'], kpis['kpi_top_distributor_count']), ('Alice', 2))
+
+    def test_run_parallel_keeps_order_and_raises(self):
+        threads = run_parallel(lambda: threading.current_thread().name, lambda: 2)
+        self.assertTrue(threads[0].startswith('firestore-query'))
+        self.assertEqual(threads[1], 2)
+
+        def broken():
+            raise RuntimeError('count failed')
+
+        with self.assertRaisesMessage(RuntimeError, 'count failed'):
+            run_parallel(lambda: 1, broken)
+
+
+class ContactIndexTests(TestCase):
+    """The contact uniqueness index: transactional claims and building it from existing clients."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_monthly_aggregate()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_monthly_aggregate()
+
+    def lead(self, contact1, contact2=None):
+        return {'ownerId': 'a', 'fullName': 'Lead', 'contact1': contact1, 'contact2': contact2,
+                'dateLogged': firestore.SERVER_TIMESTAMP}
+
+    def written(self):
+        """(clients, contact claims, counter shards) in the store."""
+        return (len(self.store.clients.collection().get()), len(self.store.contacts.collection().get()),
+                len(self.store.monthly_counters.shards(period_for()).get()))
+
+    def test_save_claims_every_contact_with_the_client(self):
+        client_ref = save_client_lead('a', self.lead('0711111111', 'a@x.com'))
+        for contact in ('0711111111', 'a@x.com'):
+            claim = self.store.contacts.document(contact).get().to_dict()
+            self.assertEqual((claim['clientId'], claim['ownerId']), (client_ref.id, 'a'))
+        self.assertEqual(self.written(), (1, 2, 1))
+
+    def test_duplicate_contact_writes_nothing(self):
+        save_client_lead('a', self.lead('0711111111'))
+        # contact1 is free, contact2 is not: neither the client nor the free claim may be written
+        with self.assertRaises(DuplicateContactError) as raised:
+            save_client_lead('a', self.lead('0722222222', '0711111111'))
+        self.assertEqual(raised.exception.contact, '0711111111')
+        self.assertFalse(self.store.contacts.document('0722222222').get().exists)
+        self.assertEqual(self.written(), (1, 1, 1))
+        self.assertEqual(sum(doc.to_dict()['count'] for doc in self.store.monthly_counters.shards(period_for()).get()), 1)
+
+    def test_concurrent_saves_of_one_contact_register_it_once(self):
+        outcomes = []
+
+        def submit():
+            try:
+                save_client_lead('a', self.lead('0711111111'))
+                outcomes.append('saved')
+            except DuplicateContactError:
+                outcomes.append('duplicate')
+
+        threads = [threading.Thread(target=submit) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(outcomes), ['duplicate'] * 5 + ['saved'])
+        self.assertEqual(self.written(), (1, 1, 1))
+
+    async def test_async_save_rejects_duplicates(self):
+        client_ref = await asave_client_lead('a', self.lead('0711111111'))
+        with self.assertRaises(DuplicateContactError):
+            await asave_client_lead('a', self.lead('a@x.com', '0711111111'))
+        claim = self.store.contacts.document('0711111111').get().to_dict()
+        self.assertEqual(claim['clientId'], client_ref.id)
+        self.assertFalse(self.store.contacts.document('a@x.com').get().exists)
+        self.assertEqual(self.written(), (1, 1, 1))
+
+    def test_batch_rejects_two_creates_of_one_document(self):
+        ref = self.store.contacts.document('0711111111')
+        batch = self.store.db.batch()
+        batch.create(ref, {'clientId': 'first'})
+        batch.create(ref, {'clientId': 'second'})
+        with self.assertRaises(AlreadyExists):
+            batch.commit()
+        self.assertFalse(ref.get().exists)
+
+    def test_build_contact_index_never_overwrites_a_claim(self):
+        _, first = self.store.clients.add({'ownerId': 'a', 'contact1': '0711111111', 'contact2': 'A@x.com'})
+        _, second = self.store.clients.add({'ownerId': 'b', 'contact1': '0722222222'})
+        _, shared = self.store.clients.add({'ownerId': 'b', 'contact1': '0711111111'})
+        # A live submission claimed this contact for another client before the build
+        self.store.contacts.document('0722222222').set({'clientId': 'live', 'ownerId': 'c'})
+
+        result = build_contact_index()
+        self.assertEqual((result['clients'], result['indexed']), (3, 2))
+        self.assertEqual(sorted((c['contact'], c['clientId'], c['claimedBy']) for c in result['conflicts']),
+                         [('0711111111', shared.id, first.id), ('0722222222', second.id, 'live')])
+        self.assertEqual(self.store.contacts.document('0722222222').get().to_dict()['clientId'], 'live')
+        self.assertEqual(self.store.contacts.document('a@x.com').get().to_dict()['clientId'], first.id)
+
+        rerun = build_contact_index()
+        self.assertEqual((rerun['indexed'], rerun['already_indexed'], len(rerun['conflicts'])), (0, 2, 2))
+
+    def test_build_contact_index_spans_chunks(self):
+        for i in range(5):
+            self.store.clients.add({'ownerId': 'a', 'contact1': f'07000000{i:02d}'})
+        self.store.clients.add({'ownerId': 'a', 'contact1': '0700000000'})
+        with mock.patch('ecmanagerapp.client_lead_utility.CONTACT_INDEX_CHUNK', 2):
+            result = build_contact_index()
+        self.assertEqual((result['clients'], result['indexed'], len(result['conflicts'])), (6, 5, 1))
+
+
+class EmployeeDeletionTests(TestCase):
+    """Client cascade of employee deletions, against the in-memory datastore."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        # More clients than one cascade page, so paging is exercised
+        self.owner_ids = seed_synthetic_data(self.store, 3 * CASCADE_PAGE_SIZE, 2, months=3)
+        self.leaver, self.keeper = self.owner_ids
+        reset_caches()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        reset_caches()
+
+    def owned(self, uid):
+        return self.store.clients.owned_by(uid).get()
+
+    @property
+    def periods(self):
+        return {period_for(doc.to_dict()['dateLogged']) for doc in self.store.clients.collection().get()}
+
+    def test_reassign_moves_clients_counters_and_contacts(self):
+        moving = len(self.owned(self.leaver))
+        keeping = len(self.owned(self.keeper))
+        periods = self.periods
+
+        job = start_employee_deletion([self.leaver], mode='reassign', target_id=self.keeper, background=False)
+
+        self.assertEqual((job['status'], job['total'], job['processed']), ('done', moving, moving))
+        self.assertEqual(self.owned(self.leaver), [])
+        self.assertEqual(len(self.owned(self.keeper)), moving + keeping)
+        self.assertEqual(sum(read_monthly_counts(p).get(self.leaver, 0) for p in periods), 0)
+        self.assertEqual(sum(read_monthly_counts(p).get(self.keeper, 0) for p in periods), moving + keeping)
+        contact = self.owned(self.keeper)[0].to_dict()['contact1']
+        self.assertEqual(self.store.contacts.document(contact).get().to_dict()['ownerId'], self.keeper)
+        self.assertFalse(self.store.distributors.get(self.leaver).exists)
+
+    def test_archive_in_background_reports_progress(self):
+        moving = len(self.owned(self.leaver))
+        session = self.client.session
+        session['user'] = {'uid': 'admin-uid', 'email': 'admin@example.com', 'role': 'admin'}
+        session.save()
+
+        response = self.client.post('/delete-employee/', {'uid': self.leaver, 'cascade': 'archive'})
+        job_id = response.json()['job']['id']
+        self.assertTrue(wait_for_employee_deletion(job_id, timeout=10))
+
+        status = self.client.get(f'/admins/employee-deletions/{job_id}').json()
+        self.assertEqual((status['status'], status['processed']), ('done', moving))
+        self.assertEqual(self.owned(self.leaver), [])
+        self.assertEqual(len(self.store.archived_clients.collection().get()), moving)
+
+    def test_bulk_delete_uses_one_auth_call(self):
+        with collect_request_stats() as stats:
+            job = start_employee_deletion(self.owner_ids, mode='archive', background=False)
+        self.assertEqual(stats.rpcs[('auth', 'delete_users')], 1)
+        self.assertNotIn(('auth', 'delete_user'), stats.rpcs)
+        self.assertEqual(job['processed'], 3 * CASCADE_PAGE_SIZE)
+        self.assertEqual(self.store.clients.collection().get(), [])
+
+    def test_only_admins_can_delete(self):
+        response = self.client.post('/delete-employee/', {'uid': self.leaver})
+        self.assertEqual(response.status_code, 302)
+
+        session = self.client.session
+        session['user'] = {'uid': self.keeper, 'email': 'employee@example.com', 'role': 'employee'}
+        session.save()
+        response = self.client.post('/delete-employee/', {'uid': self.leaver})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(self.store.distributors.get(self.leaver).exists)
+        self.assertNotEqual(self.owned(self.leaver), [])
+
+    def test_invalid_reassignment_deletes_nothing(self):
+        with self.assertRaises(EmployeeDeletionError):
+            start_employee_deletion([self.leaver], mode='reassign', target_id='nobody')
+        self.assertTrue(self.store.distributors.get(self.leaver).exists)
+
+
+class ClientImportTests(TestCase):
+    """Bulk CSV/JSONL lead imports: validation, deduplication and the batched writes."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_monthly_aggregate()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_monthly_aggregate()
+
+    def run_import(self, content, file_format='csv'):
+        return import_client_leads(iter_lead_records(io.BytesIO(content), file_format), 'a')
+
+    def counted(self):
+        return sum(doc.to_dict().get('count', 0) for doc in self.store.monthly_counters.shards(period_for()).get())
+
+    def test_csv_rows_are_validated_and_deduplicated(self):
+        save_client_lead('a', {'ownerId': 'a', 'fullName': 'Existing', 'contact1': '0700000000'})
+        result = self.run_import(
+            b'fullName,contact1,contact2\n'
+            b'Alice Lead,0711111111,alice@x.com\n'
+            b'Al,0722222222,\n'
+            b'Bob Lead, 0700000000 ,\n'
+            b'Carol Lead,ALICE@x.com,\n'
+            b'Dan Lead,0733333333,\n'
+        )
+        self.assertEqual({key: result[key] for key in ('created', 'duplicate', 'invalid', 'error')},
+                         {'created': 2, 'duplicate': 2, 'invalid': 1, 'error': 0})
+        self.assertEqual([(row['row'], row['status']) for row in result['rows']],
+                         [(2, 'created'), (3, 'invalid'), (4, 'duplicate'), (5, 'duplicate'), (6, 'created')])
+        self.assertIn('earlier in the file', result['rows'][3]['error'])
+
+        alice = self.store.clients.collection().document(result['rows'][0]['id']).get().to_dict()
+        self.assertEqual((alice['ownerId'], alice['contact2']), ('a', 'alice@x.com'))
+        self.assertTrue(self.store.contacts.document('alice@x.com').get().exists)
+        self.assertEqual(self.counted(), 3)
+
+    def test_jsonl_reports_unparsable_lines(self):
+        result = self.run_import(
+            b'{"fullName": "Alice Lead", "contact1": "0711111111"}\n'
+            b'\n'
+            b'not json\n'
+            b'["Bob Lead", "0722222222"]\n',
+            'jsonl',
+        )
+        self.assertEqual([(row['row'], row['status']) for row in result['rows']],
+                         [(1, 'created'), (3, 'invalid'), (4, 'invalid')])
+        self.assertEqual(result['rows'][1]['error'], 'Invalid JSON format')
+
+    def test_each_chunk_is_written_in_one_batch(self):
+        content = b'fullName,contact1\n' + b''.join(b'Lead %d,07110000%02d\n' % (i, i) for i in range(5))
+        batch = MemoryFirestoreClient.batch
+        batches = []
+
+        def counting_batch(db):
+            batches.append(1)
+            return batch(db)
+
+        with mock.patch('ecmanagerapp.client_import_utility.IMPORT_CHUNK_LEADS', 2), \
+                mock.patch.object(MemoryFirestoreClient, 'batch', counting_batch):
+            result = self.run_import(content)
+        self.assertEqual((result['created'], len(batches)), (5, 3))
+        self.assertEqual(len(self.store.contacts.collection().get()), 5)
+        self.assertEqual(self.counted(), 5)
+
+    def test_failed_batch_falls_back_to_lead_by_lead(self):
+        get_all = MemoryFirestoreClient.get_all
+
+        def get_all_then_claim(db, references, *args, **kwargs):
+            snapshots = list(get_all(db, references, *args, **kwargs))
+            # A live submission claims a contact between the lookup and the commit
+            self.store.contacts.document('0722222222').set({'clientId': 'live', 'ownerId': 'b'})
+            return snapshots
+
+        with mock.patch.object(MemoryFirestoreClient, 'get_all', get_all_then_claim):
+            result = self.run_import(b'fullName,contact1\nAlice Lead,0711111111\nBob Lead,0722222222\n')
+        self.assertEqual([(row['row'], row['status']) for row in result['rows']], [(2, 'created'), (3, 'duplicate')])
+        self.assertEqual(len(self.store.clients.collection().get()), 1)
+        self.assertEqual(self.store.contacts.document('0722222222').get().to_dict()['clientId'], 'live')
+        self.assertEqual(self.counted(), 1)
+
+    def test_upload_is_imported_for_the_logged_in_employee(self):
+        session = self.client.session
+        session['user'] = {'uid': 'b', 'email': 'b@example.com', 'role': 'employee'}
+        session.save()
+        upload = SimpleUploadedFile('leads.csv', b'fullName,contact1\nAlice Lead,0711111111\n')
+        response = self.client.post('/api/import_client_leads/', {'file': upload})
+        self.assertEqual((response.status_code, response.json()['created']), (201, 1))
+        self.assertEqual(self.store.contacts.document('0711111111').get().to_dict()['ownerId'], 'b')
+
+        upload = SimpleUploadedFile('leads.xlsx', b'')
+        response = self.client.post('/api/import_client_leads/', {'file': upload})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(IMPORT_MAX_FILE_SIZE=100, IMPORT_MAX_ROWS=2)
+    def test_oversized_uploads_are_rejected_before_writing(self):
+        session = self.client.session
+        session['user'] = {'uid': 'b', 'email': 'b@example.com', 'role': 'employee'}
+        session.save()
+        content = b'fullName,contact1\n' + b''.join(b'Lead %d,07110000%02d\n' % (i, i) for i in range(3))
+
+        upload = SimpleUploadedFile('leads.csv', content + b'#' * 100)
+        self.assertEqual(self.client.post('/api/import_client_leads/', {'file': upload}).status_code, 413)
+        upload = SimpleUploadedFile('leads.csv', content)
+        self.assertEqual(self.client.post('/api/import_client_leads/', {'file': upload}).status_code, 413)
+        self.assertEqual(len(self.store.clients.collection().get()), 0)
+
+        upload = SimpleUploadedFile('leads.csv', content.rsplit(b'Lead 2', 1)[0])
+        response = self.client.post('/api/import_client_leads/', {'file': upload})
+        self.assertEqual((response.status_code, response.json()['created']), (201, 2))
+
+
+class ClientExportTests(TestCase):
+    """Admin exports streamed page by page as CSV or JSONL."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_map()
+
+        self.store.distributors.set('a', {'full_name': 'Alice Distributor'})
+        # One client a day from 2026-01-01 (03:00 in Kampala), alternating owners 'a' and 'b'
+        self.ids = []
+        for day in range(10):
+            _, ref = self.store.clients.add({
+                'ownerId': 'ab'[day % 2], 'fullName': f'Client {day}', 'contact1': f'07000000{day:02d}',
+                'dateLogged': datetime.datetime(2026, 1, 1 + day, 0, 0, tzinfo=datetime.timezone.utc),
+            })
+            self.ids.append(ref.id)
+
+        session = self.client.session
+        session['user'] = {'uid': 'admin-uid', 'email': 'admin@example.com', 'role': 'admin'}
+        session.save()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+
+    def export(self, **params):
+        response = self.client.get('/api/clients/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_lists_every_client_in_order(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual([row['id'] for row in rows], self.ids)
+        self.assertEqual(list(rows[0]), EXPORT_FIELDS)
+        self.assertEqual((rows[0]['distributor_name'], rows[1]['distributor_name']), ('Alice Distributor', 'b'))
+        self.assertEqual(rows[0]['dateLogged'], '2026-01-01T03:00:00+03:00')
+
+    def test_jsonl_export_filters_by_owner_and_local_dates(self):
+        lines = self.export(format='jsonl', owner='a', **{'from': '2026-01-03', 'to': '2026-01-07'})
+        rows = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual([row['fullName'] for row in rows], ['Client 2', 'Client 4', 'Client 6'])
+
+    def test_pages_follow_the_cursor(self):
+        stream = MemoryQuery.stream
+        pages = []
+
+        def counting_stream(query, transaction=None):
+            pages.append(query)
+            return stream(query, transaction)
+
+        with mock.patch.object(MemoryQuery, 'stream', counting_stream):
+            docs = list(iter_client_documents(page_size=3))
+        self.assertEqual([doc.id for doc in docs], self.ids)
+        self.assertEqual(len(pages), 4)
+
+    def test_rejects_bad_parameters_and_non_admins(self):
+        self.assertEqual(self.client.get('/api/clients/export/', {'format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/clients/export/', {'from': '01/03/2026'}).status_code, 400)
+
+        session = self.client.session
+        session['user'] = {'uid': 'a', 'email': 'a@example.com', 'role': 'employee'}
+        session.save()
+        self.assertEqual(self.client.get('/api/clients/export/').status_code, 302)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class DashboardPushTests(TestCase):
+    """Live dashboard updates: the WebSocket consumer and what a saved lead pushes."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+        dashboard_push_utility._last_leaderboard = None
+        self.store.distributors.set('a', {'full_name': 'Alice'})
+        self.store.distributors.set('b', {'full_name': 'Bob'})
+        self.sockets = []
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+        dashboard_push_utility._last_leaderboard = None
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(DashboardConsumer.as_asgi(), '/ws/dashboard/')
+        communicator.scope['session'] = {'user': user} if user else {}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.sockets.append(communicator)
+        return communicator
+
+    def submit_lead(self, uid, lead):
+        session = self.client.session
+        session['user'] = {'uid': uid, 'email': f'{uid}@example.com', 'role': 'employee'}
+        session.save()
+        return self.client.post('/api/submit_client_lead/', json.dumps(lead), content_type='application/json')
+
+    async def disconnect(self):
+        for communicator in self.sockets:
+            await communicator.disconnect()
+
+    async def test_anonymous_sockets_are_closed(self):
+        communicator = WebsocketCommunicator(DashboardConsumer.as_asgi(), '/ws/dashboard/')
+        communicator.scope['session'] = {}
+        connected, _ = await communicator.connect()
+        self.assertFalse(connected)
+
+    async def test_submitted_lead_reaches_its_owner_and_admins(self):
+        owner = await self.connect({'uid': 'a', 'role': 'employee'})
+        other = await self.connect({'uid': 'b', 'role': 'employee'})
+        admin = await self.connect({'uid': 'admin-uid', 'role': 'admin'})
+
+        response = await sync_to_async(self.submit_lead)('a', {'fullName': 'New Lead', 'contact1': '0711111111'})
+        self.assertEqual(response.status_code, 201)
+
+        event = await owner.receive_json_from()
+        self.assertEqual((event['event'], event['kpi_delta']), ('new_lead', {'total': 1, 'month': 1}))
+        self.assertEqual((event['clients'][0]['id'], event['clients'][0]['fullName']),
+                         (response.json()['id'], 'New Lead'))
+        event = await admin.receive_json_from()
+        self.assertEqual((event['event'], event['clients'][0]['distributor_name']), ('new_lead', 'Alice'))
+
+        for communicator in (owner, other, admin):
+            event = await communicator.receive_json_from()
+            self.assertEqual((event['event'], event['top_distributor'], event['top_distributor_count']),
+                             ('leaderboard', 'Alice', 1))
+            self.assertIn('Alice', event['html'])
+            self.assertTrue(await communicator.receive_nothing())
+        await self.disconnect()
+
+    async def test_unchanged_leaderboard_is_not_pushed_again(self):
+        communicator = await self.connect({'uid': 'admin-uid', 'role': 'admin'})
+        await sync_to_async(publish_new_leads)('a', count=0)
+        self.assertEqual((await communicator.receive_json_from())['event'], 'new_lead')
+        self.assertEqual((await communicator.receive_json_from())['event'], 'leaderboard')
+
+        await sync_to_async(publish_new_leads)('a', count=0)
+        self.assertEqual((await communicator.receive_json_from())['event'], 'new_lead')
+        self.assertTrue(await communicator.receive_nothing())
+        await self.disconnect()
+
+    async def test_push_failures_never_fail_the_caller(self):
+        layer = get_channel_layer()
+        with mock.patch.object(type(layer), 'group_send', side_effect=RuntimeError('layer down')), \
+                mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            await sync_to_async(publish_new_leads)('a')
+        self.assertIn('layer down', stderr.getvalue())
+
+
+@override_settings(CLIENT_REPLICA_ENABLED=True)
+class ClientReplicaTests(TestCase):
+    """The snapshot-fed client replica and the reads served from it."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        reset_client_replica()
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+        self.store.distributors.set('a', {'full_name': 'Alice Distributor'})
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+
+    def tearDown(self):
+        reset_client_replica()
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+
+    @contextlib.contextmanager
+    def firestore_reads_forbidden(self):
+        def read(*args, **kwargs):
+            raise AssertionError('Firestore was read')
+
+        with mock.patch.object(MemoryQuery, 'stream', read), mock.patch.object(MemoryQuery, 'get', read), \
+                mock.patch.object(MemoryDocumentReference, 'get', read), \
+                mock.patch.object(MemoryAggregationQuery, 'get', read), \
+                mock.patch.object(MemoryFirestoreClient, 'get_all', read):
+            yield
+
+    def add_client(self, owner_id, contact, date_logged=None):
+        _, ref = self.store.clients.add({'ownerId': owner_id, 'fullName': 'Lead', 'contact1': contact,
+                                         'dateLogged': date_logged or self.now})
+        return ref
+
+    def test_indexes_follow_writes(self):
+        first = self.add_client('a', '0711111111')
+        replica = ClientReplica(self.store)
+        replica.start()
+        self.assertTrue(replica.wait_until_warm(1))
+
+        second = self.add_client('a', '0722222222', self.now - datetime.timedelta(days=40))
+        period = period_for(self.now)
+        self.assertEqual([doc_id for doc_id, _ in replica.clients_of('a')], sorted([first.id, second.id]))
+        self.assertEqual(replica.monthly_counts(period), {'a': 1})
+        self.assertEqual(replica.client_for_contact('0722222222'), second.id)
+
+        first.update({'ownerId': 'b'})
+        self.assertEqual(replica.monthly_counts(period), {'b': 1})
+        self.assertEqual((replica.count('a'), replica.count('b')), (1, 1))
+
+        second.delete()
+        self.assertIsNone(replica.client_for_contact('0722222222'))
+        self.assertEqual(replica.count(), 1)
+
+        replica.stop()
+        self.assertFalse(replica.is_warm)
+
+    def test_warm_replica_serves_reads_without_firestore(self):
+        self.add_client('a', '0711111111')
+        replica = get_client_replica()
+        self.assertIsNotNone(replica)
+
+        with self.firestore_reads_forbidden():
+            self.assertEqual(get_distributor_map(), {'a': 'Alice Distributor'})
+            self.assertEqual(get_monthly_aggregate().counts, {'a': 1})
+            self.assertTrue(contact_is_claimed('0711111111'))
+            self.assertFalse(contact_is_claimed('0799999999'))
+
+        # A lead saved afterwards is visible at once, without invalidating anything.
+        save_client_lead('a', {'ownerId': 'a', 'fullName': 'Lead', 'contact1': '0722222222', 'dateLogged': self.now})
+        self.assertTrue(contact_is_claimed('0722222222'))
+        self.assertEqual(get_monthly_aggregate().counts, {'a': 2})
+
+    def test_stopped_listeners_are_restarted(self):
+        replica = get_client_replica()
+        replica.stop()
+        restarted = get_client_replica()
+        self.assertIsNotNone(restarted)
+        self.assertIsNot(restarted, replica)
+
+    def test_failed_starts_are_retried_with_backoff(self):
+        clock = [1000.0]
+        with mock.patch.object(ClientReplica, 'start', side_effect=RuntimeError('unavailable')) as start, \
+                mock.patch('ecmanagerapp.replica.time.monotonic', lambda: clock[0]), \
+                override_settings(CLIENT_REPLICA_RETRY_DELAY=5, CLIENT_REPLICA_RETRY_MAX_DELAY=8):
+            for seconds in (0, 1, 4, 1, 7, 1, 8):
+                clock[0] += seconds
+                self.assertIsNone(get_client_replica())
+            # Started at 0s and 5s, then at most every 8s: at 13s and 22s
+            self.assertEqual(start.call_count, 4)
+
+        clock[0] += 8
+        with mock.patch('ecmanagerapp.replica.time.monotonic', lambda: clock[0]):
+            replica = get_client_replica()
+            self.assertIsNotNone(replica)
+            # Once warm, dead listeners are restarted right away again.
+            replica.stop()
+            self.assertIsNotNone(get_client_replica())
+
+    def test_disabled_replica_falls_back_to_firestore(self):
+        with override_settings(CLIENT_REPLICA_ENABLED=False):
+            self.assertIsNone(get_client_replica())
+            with mock.patch.object(self.store.distributors, 'all', wraps=self.store.distributors.all) as read:
+                self.assertEqual(get_distributor_map(), {'a': 'Alice Distributor'})
+            self.assertEqual(read.call_count, 1)
+
+
+class _QueuedExecutor:
+    """Holds submitted jobs until run_all(), so a test decides when a background refresh happens."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, func, *args):
+        self.jobs.append((func, args))
+
+    def run_all(self):
+        jobs, self.jobs = self.jobs, []
+        for func, args in jobs:
+            func(*args)
+
+
+class AuthUserMirrorTests(TestCase):
+    """The Firebase Auth user mirror behind get_distributor_data(), refreshed in the background."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_data()
+        self.executor = _QueuedExecutor()
+        patcher = mock.patch('ecmanagerapp.distributor_data_utility.get_refresh_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for name in ('Alice', 'Bob'):
+            self.store.users.create(email=f'{name.lower()}@example.com', password='password', display_name=name)
+
+    def tearDown(self):
+        # Finish pending refreshes: the cache is process-wide and a refresh in flight blocks new ones.
+        self.executor.run_all()
+        set_datastore(self._previous_store)
+        invalidate_distributor_data()
+
+    def names(self, rows):
+        return sorted(row['full_name'] for row in rows)
+
+    @contextlib.contextmanager
+    def auth_listings(self):
+        """Yields a list that records every enumeration of Firebase Auth made in the block."""
+        iterate_all = type(self.store.users).iterate_all
+        calls = []
+
+        def counting_iterate_all(users):
+            calls.append(1)
+            return iterate_all(users)
+
+        with mock.patch.object(type(self.store.users), 'iterate_all', counting_iterate_all):
+            yield calls
+
+    def test_auth_is_enumerated_once(self):
+        with self.auth_listings() as listings:
+            self.assertEqual(self.names(get_distributor_data()), ['Alice', 'Bob'])
+            get_distributor_data()
+        self.assertEqual(len(listings), 1)
+        self.assertEqual(self.executor.jobs, [])
+
+    @override_settings(AUTH_USERS_CACHE_TTL=0)
+    def test_expired_mirror_is_served_while_one_refresh_runs(self):
+        get_distributor_data()
+        self.store.users.create(email='carol@example.com', password='password', display_name='Carol')
+
+        with self.auth_listings() as listings:
+            self.assertEqual(self.names(get_distributor_data()), ['Alice', 'Bob'])
+            self.assertEqual(self.names(get_distributor_data()), ['Alice', 'Bob'])
+        self.assertEqual(listings, [])
+        self.assertEqual(len(self.executor.jobs), 1)
+        self.executor.run_all()
+        self.assertEqual(self.names(get_distributor_data()), ['Alice', 'Bob', 'Carol'])
+
+    @override_settings(AUTH_USERS_CACHE_TTL=0)
+    def test_failed_refresh_keeps_the_stale_mirror(self):
+        get_distributor_data()
+        with mock.patch.object(type(self.store.users), 'iterate_all', side_effect=RuntimeError('auth down')):
+            get_distributor_data()
+            self.executor.run_all()
+            self.assertEqual(self.names(get_distributor_data()), ['Alice', 'Bob'])
+            # The next expired read schedules a new attempt.
+            self.assertEqual(len(self.executor.jobs), 1)
+
+    def test_registrations_and_deletions_update_the_mirror(self):
+        rows = get_distributor_data()
+        carol = self.store.users.create(email='carol@example.com', password='password', display_name='Carol')
+        bob = next(row['uid'] for row in rows if row['full_name'] == 'Bob')
+
+        with self.auth_listings() as listings:
+            remember_distributor(carol)
+            forget_distributor(bob)
+            self.assertEqual(self.names(get_distributor_data()), ['Alice', 'Carol'])
+        self.assertEqual(listings, [])
+
+    @override_settings(AUTH_USERS_CACHE_TTL=0)
+    def test_refresh_does_not_undo_a_later_update(self):
+        get_distributor_data()
+        get_distributor_data()
+        self.assertEqual(len(self.executor.jobs), 1)
+        # Carol registers after the refresh read Auth but before it is stored
+        carol = self.store.users.create(email='carol@example.com', password='password', display_name='Carol')
+        with mock.patch.object(type(self.store.users), 'iterate_all', return_value=iter([])):
+            remember_distributor(carol)
+            self.executor.run_all()
+        self.assertIn('Carol', self.names(get_distributor_data()))
+
+    async def test_async_reads_share_the_mirror(self):
+        rows = await aget_distributor_data()
+        self.assertEqual(self.names(rows), ['Alice', 'Bob'])
+        rows[0]['full_name'] = 'Changed'
+        self.assertEqual(self.names(await aget_distributor_data()), ['Alice', 'Bob'])
+
+
+class ClientProjectionTests(TestCase):
+    """Client reads select only the fields they use and build slotted ClientRecords."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+        self.store.distributors.set('a', {'full_name': 'Alice'})
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+        _, self.ref = self.store.clients.add({
+            'ownerId': 'a', 'fullName': 'Lead', 'contact1': '0711111111', 'contact2': 'lead@x.com',
+            'initialNotes': 'Call back', 'dateLogged': self.now,
+        })
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+
+    @contextlib.contextmanager
+    def client_projections(self):
+        """Yields the field lists selected by every clients query streamed in the block."""
+        stream = MemoryQuery.stream
+        clients_path = self.store.clients.path
+        projections = []
+
+        def recording_stream(query, transaction=None):
+            if query._collection.path == clients_path:
+                projections.append(query._projection)
+            return stream(query, transaction)
+
+        with mock.patch.object(MemoryQuery, 'stream', recording_stream):
+            yield projections
+
+    def test_employee_list_reads_only_the_listed_fields(self):
+        with self.client_projections() as projections:
+            clients = get_employee_clients('a')['clients']
+        # The list, then the leaderboard's month scan (these counters were never backfilled)
+        self.assertEqual(projections, [tuple(self.store.clients.LIST_FIELDS), ('ownerId',)])
+        self.assertEqual(clients, [ClientRecord(
+            id=self.ref.id, fullName='Lead', contact1='0711111111', ownerId='a', dateLogged=self.now,
+            date_logged_formatted=clients[0].date_logged_formatted,
+        )])
+        self.assertEqual(clients[0].initialNotes, '')
+
+    def test_admin_listing_and_month_scan_are_projected(self):
+        with self.client_projections() as projections:
+            record, = get_client_data()['clients']
+            self.assertEqual(scan_monthly_counts(*month_range(period_for())), {'a': 1})
+        # Listing, the KPI state's month scan and watermark tail, then the month scan
+        self.assertEqual(projections, [tuple(self.store.clients.DISPLAY_FIELDS), ('ownerId',),
+                                       ('ownerId', 'dateLogged'), ('ownerId',)])
+        self.assertEqual((record.distributor_name, record.contact2, record.initialNotes),
+                         ('Alice', 'lead@x.com', 'Call back'))
+
+    def test_records_are_slotted(self):
+        record = ClientRecord.from_document('id-1', {'fullName': 'Lead'}, distributor_name='Alice')
+        self.assertEqual((record.id, record.fullName, record.contact1, record.distributor_name),
+                         ('id-1', 'Lead', None, 'Alice'))
+        self.assertFalse(hasattr(record, '__dict__'))
+        with self.assertRaises(AttributeError):
+            record.notAField = 1
+
+
+@override_settings(FIREBASE_WEB_API_KEY='test-key', SIGN_IN_RETRIES=2)
+class SignInTests(TestCase):
+    """Pooled, timed-out and retried Identity Toolkit sign-ins, and the cached login profile."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_profile()
+        self.requests = []
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_profile()
+
+    @contextlib.contextmanager
+    def google(self, *replies):
+        """Answers sign-ins with `replies` in turn (a status code or an exception), without waiting between retries."""
+        replies = list(replies)
+
+        def handler(request):
+            self.requests.append(request)
+            reply = replies.pop(0)
+            if isinstance(reply, Exception):
+                raise reply
+            if reply == 200:
+                return httpx.Response(200, json={'idToken': 'token', 'localId': 'uid'})
+            return httpx.Response(reply, json={'error': {'message': 'INVALID_LOGIN_CREDENTIALS'}})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        with mock.patch('ecmanagerapp.login_utility.get_async_http_client', return_value=client), \
+                mock.patch('ecmanagerapp.login_utility.asyncio.sleep', new=mock.AsyncMock()) as sleep:
+            yield sleep
+
+    async def test_transient_failures_are_retried(self):
+        with self.google(503, httpx.ConnectError('reset'), 200) as sleep:
+            data = await asign_in_with_password('a@example.com', 'password')
+        self.assertEqual(data['localId'], 'uid')
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [0.2, 0.4])
+        self.assertEqual(self.requests[0].url.params['key'], 'test-key')
+
+    async def test_rejected_credentials_are_not_retried(self):
+        with self.google(400):
+            with self.assertRaisesMessage(SignInError, 'INVALID_LOGIN_CREDENTIALS'):
+                await asign_in_with_password('a@example.com', 'wrong')
+        self.assertEqual(len(self.requests), 1)
+
+    async def test_gives_up_after_the_configured_retries(self):
+        with self.google(*[httpx.ConnectError('offline')] * 3):
+            with self.assertRaises(httpx.ConnectError):
+                await asign_in_with_password('a@example.com', 'password')
+        self.assertEqual(len(self.requests), 3)
+
+        with self.google(503, 503, 503):
+            with self.assertRaisesMessage(SignInError, 'INVALID_LOGIN_CREDENTIALS'):
+                await asign_in_with_password('a@example.com', 'password')
+
+    async def test_async_client_is_pooled_per_event_loop(self):
+        client = get_async_http_client()
+        self.assertIs(get_async_http_client(), client)
+        self.assertEqual(client.timeout.connect, 3.05)
+
+    def test_sync_session_is_shared_and_retries_posts(self):
+        session = get_http_session()
+        self.assertIs(get_http_session(), session)
+        retry = session.get_adapter('https://identitytoolkit.googleapis.com').max_retries
+        self.assertEqual(retry.total, 2)
+        self.assertIn('POST', retry.allowed_methods)
+        self.assertIn(503, retry.status_forcelist)
+
+        reply = mock.Mock(status_code=400, json=lambda: {'error': {'message': 'USER_DISABLED'}})
+        with mock.patch.object(session, 'post', return_value=reply) as post:
+            with self.assertRaisesMessage(SignInError, 'USER_DISABLED'):
+                sign_in_with_password('a@example.com', 'password')
+        self.assertEqual(post.call_args.kwargs['timeout'], (3.05, 10))
+        self.assertEqual(post.call_args.kwargs['params'], {'key': 'test-key'})
+
+    def test_profile_is_read_once_and_misses_are_not_cached(self):
+        self.store.distributors.set('uid', {'email': 'a@example.com', 'role': 'admin'})
+        with mock.patch.object(self.store.distributors, 'get', wraps=self.store.distributors.get) as read:
+            self.assertEqual(get_distributor_profile('uid')['role'], 'admin')
+            self.assertEqual(get_distributor_profile('uid')['role'], 'admin')
+        self.assertEqual(read.call_count, 1)
+
+        self.assertIsNone(get_distributor_profile('new-uid'))
+        self.store.distributors.set('new-uid', {'email': 'b@example.com', 'role': 'employee'})
+        self.assertEqual(get_distributor_profile('new-uid')['role'], 'employee')
+
+        self.store.distributors.set('uid', {'email': 'a@example.com', 'role': 'employee'})
+        invalidate_distributor_profile('uid')
+        self.assertEqual(get_distributor_profile('uid')['role'], 'employee')
+
+    def test_login_redirects_by_role_and_reports_timeouts(self):
+        user = self.store.users.create(email='a@example.com', password='password', display_name='Alice')
+        self.store.distributors.set(user.uid, {'email': 'a@example.com', 'role': 'admin'})
+        credentials = {'email': 'a@example.com', 'password': 'password'}
+
+        with mock.patch('ecmanagerapp.views.asign_in_with_password', return_value={'idToken': user.uid}):
+            response = self.client.post(reverse('login_form'), credentials)
+        self.assertRedirects(response, reverse('admin_dashboard'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['user']['role'], 'admin')
+
+        with mock.patch('ecmanagerapp.views.asign_in_with_password', side_effect=httpx.ReadTimeout('slow')):
+            response = self.client.post(reverse('login_form'), credentials)
+        self.assertRedirects(response, reverse('login_form'), fetch_redirect_response=False)
+        self.assertIn('did not respond', str(list(get_messages(response.wsgi_request))[0]))
+
+
+class FirestoreMetricsTests(TestCase):
+    """Per-view Firestore/Auth accounting: the Server-Timing header and the /metrics endpoint."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+        self.store.distributors.set('a', {'full_name': 'Alice'})
+        self.store.clients.add({'ownerId': 'a', 'fullName': 'Lead', 'contact1': '0711111111',
+                                'dateLogged': datetime.datetime.now(datetime.timezone.utc)})
+        session = self.client.session
+        session['user'] = {'uid': 'admin-uid', 'email': 'admin@example.com', 'role': 'admin'}
+        session.save()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+        invalidate_monthly_aggregate()
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_server_timing_reports_the_requests_calls(self):
+        response = self.client.get('/api/clients/')
+        timing = re.fullmatch(r'firestore;dur=[\d.]+;desc="(\d+) calls, (\d+) docs", '
+                              r'auth;dur=[\d.]+;desc="(\d+) calls", total;dur=[\d.]+', response['Server-Timing'])
+        calls, documents, auth_calls = map(int, timing.groups())
+        self.assertGreater(calls, 0)
+        self.assertGreater(documents, 0)
+        self.assertEqual(auth_calls, 0)
+
+        with override_settings(SERVER_TIMING_HEADER=False):
+            self.assertNotIn('Server-Timing', self.client.get('/api/clients/'))
+
+    def test_worker_thread_calls_count_towards_the_request(self):
+        stats, token = start_request_stats()
+        try:
+            get_client_kpis()
+        finally:
+            end_request_stats(token)
+        # Both count() aggregations run on the query pool
+        self.assertGreaterEqual(stats.rpc_count, 2)
+
+    def test_metrics_lists_calls_by_view(self):
+        self.client.get('/api/clients/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE ecmanager_rpcs_total counter', body)
+        self.assertRegex(body, r'ecmanager_rpcs_total\{view="client_list_api",service="firestore",method="\w+"\} \d+')
+        self.assertRegex(body, r'ecmanager_request_duration_seconds_count\{view="client_list_api"\} \d+')
+
+    def test_metrics_require_an_admin_session_without_a_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+
+        session = self.client.session
+        session['user'] = {'uid': 'a', 'email': 'a@example.com', 'role': 'employee'}
+        session.save()
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token_is_accepted_without_a_session(self):
+        self.client.logout()
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency_seconds', 'help', ['view'], buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            histogram.observe(value, ('say "hi"',))
+        self.assertEqual([(name, labels[-1], value) for name, labels, value in histogram.samples()], [
+            ('latency_seconds_bucket', '0.1', 1), ('latency_seconds_bucket', '1', 3),
+            ('latency_seconds_bucket', '+Inf', 4), ('latency_seconds_sum', 'say "hi"', 6.05),
+            ('latency_seconds_count', 'say "hi"', 4),
+        ])
+
+
+class RequestProfilerTests(TestCase):
+    """On-demand request profiles: who may ask for one, the rate limit, storage and downloads."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        invalidate_distributor_map()
+        self.store.clients.add({'ownerId': 'a', 'fullName': 'Lead', 'contact1': '0711111111',
+                                'dateLogged': datetime.datetime.now(datetime.timezone.utc)})
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.profile_dir = directory.name
+        settings = override_settings(REQUEST_PROFILING_ENABLED=True, REQUEST_PROFILE_DIR=self.profile_dir,
+                                     REQUEST_PROFILING_MIN_INTERVAL=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        profiling._last_profile_at = 0.0
+        self.login('admin')
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        invalidate_distributor_map()
+        profiling._last_profile_at = 0.0
+
+    def login(self, role):
+        session = self.client.session
+        session['user'] = {'uid': f'{role}-uid', 'email': f'{role}@example.com', 'role': role}
+        session.save()
+
+    def profile(self, path='/api/clients/'):
+        response = self.client.get(path, {'profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_admin_profile_is_stored_with_the_request_details(self):
+        name = self.profile()['X-Profile-Id']
+        profile, = self.client.get('/admins/profiles/').json()['profiles']
+        self.assertEqual((profile['name'], profile['view'], profile['status'], profile['user']),
+                         (name, 'client_list_api', 200, 'admin@example.com'))
+        self.assertGreater(profile['rpcs'], 0)
+
+        # The profile holds the view's own frames
+        functions = {function for _, _, function in pstats.Stats(os.path.join(self.profile_dir, name)).stats}
+        self.assertIn('client_list_api', functions)
+        self.assertIn('get_client_page', functions)
+
+    def test_only_admins_can_profile(self):
+        self.login('employee')
+        response = self.client.get('/api/clients/', {'profile': '1'}, HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+        self.assertEqual(self.client.get('/admins/profiles/').status_code, 302)
+
+        self.login('admin')
+        with override_settings(REQUEST_PROFILING_ENABLED=False):
+            self.assertNotIn('X-Profile-Id', self.profile())
+        self.assertIn('X-Profile-Id', self.client.get('/api/clients/', HTTP_X_PROFILE='1'))
+
+    @override_settings(REQUEST_PROFILING_MIN_INTERVAL=60)
+    def test_one_profile_per_interval(self):
+        self.assertIn('X-Profile-Id', self.profile())
+        response = self.profile()
+        self.assertEqual(response['X-Profile'], 'skipped')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(len(self.client.get('/admins/profiles/').json()['profiles']), 1)
+
+    @override_settings(REQUEST_PROFILE_KEEP=2)
+    def test_only_the_newest_profiles_are_kept(self):
+        names = []
+        for second in range(3):
+            with mock.patch('ecmanagerapp.profiling.time.gmtime', return_value=time.gmtime(1_700_000_000 + second)):
+                names.append(self.profile()['X-Profile-Id'])
+        stored = [profile['name'] for profile in self.client.get('/admins/profiles/').json()['profiles']]
+        self.assertEqual(stored, names[:0:-1])
+        self.assertEqual(len(os.listdir(self.profile_dir)), 4)
+
+    def test_download_and_report(self):
+        name = self.profile()['X-Profile-Id']
+        response = self.client.get(f'/admins/profiles/{name}')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="{name}"')
+        with open(os.path.join(self.profile_dir, name), 'rb') as handle:
+            self.assertEqual(response.content, handle.read())
+
+        report = self.client.get(f'/admins/profiles/{name}', {'format': 'txt', 'sort': 'tottime'})
+        self.assertIn('client_list_api', report.content.decode())
+        self.assertEqual(self.client.get(f'/admins/profiles/{name}', {'format': 'txt', 'sort': 'name'}).status_code, 400)
+
+    def test_download_only_serves_stored_profile_names(self):
+        with open(os.path.join(self.profile_dir, 'secret.prof'), 'w') as handle:
+            handle.write('not a profile')
+        for name in ('secret.prof', '..', '..%2Fsettings.py', '20260101T000000-x-0000000g.prof',
+                     '20260101T000000-x-00000000.prof'):
+            self.assertEqual(self.client.get(f'/admins/profiles/{name}').status_code, 404, name)
+            self.assertEqual(self.client.get(f'/admins/profiles/{name}', {'format': 'txt'}).status_code, 404, name)
+
+    async def test_sync_views_behind_async_middleware_are_profiled(self):
+        # Under ASGI the sync view runs on a worker thread, not the event loop's.
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get('/api/clients/', {'profile': '1'})
+        stats = pstats.Stats(os.path.join(self.profile_dir, response['X-Profile-Id']))
+        functions = {function for _, _, function in stats.stats}
+        self.assertTrue({'client_list_api', 'get_client_page'} <= functions, sorted(functions))
+
+
+class BenchmarkTests(TestCase):
+    """The benchmark suite: measurements, baselines and the regression check of the command."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+
+    def report(self, p50_ms):
+        return {'meta': {}, 'results': {'1000': {'get_client_data': {'p50_ms': p50_ms, 'p99_ms': p50_ms}}}}
+
+    def test_percentile_is_nearest_rank(self):
+        values = [float(value) for value in range(1, 101)]
+        self.assertEqual((percentile(values, 0.5), percentile(values, 0.99), percentile(values, 1)), (50, 99, 100))
+        self.assertEqual((percentile([], 0.5), percentile([7.0], 0.99)), (0.0, 7.0))
+
+    def test_runs_each_target_on_a_fresh_store(self):
+        report = run_benchmarks(scales=(300,), num_distributors=10, iterations=2,
+                                only={'get_client_data', 'get_monthly_leaderboard'}, log=lambda line: None)
+        results = report['results']['300']
+        self.assertEqual(sorted(results), ['get_client_data', 'get_monthly_leaderboard'])
+        self.assertEqual(sorted(results['get_client_data']), ['ops_per_sec', 'p50_ms', 'p99_ms', 'peak_kib'])
+        self.assertLessEqual(results['get_client_data']['p50_ms'], results['get_client_data']['p99_ms'])
+        self.assertIs(get_datastore(), self._previous_store)
+
+    def test_regressions_beyond_the_tolerance_are_reported(self):
+        baseline = self.report(10.0)
+        self.assertEqual(compare_to_baseline(self.report(12.0), baseline, tolerance=0.25), [])
+        self.assertEqual(compare_to_baseline(self.report(13.0), baseline, tolerance=0.25),
+                         [('1000', 'get_client_data', 10.0, 13.0)])
+        self.assertEqual(compare_to_baseline(self.report(13.0), {'results': {}}), [])
+
+    def test_command_saves_and_checks_the_baseline(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'benchmarks', 'baseline.json')
+        output = io.StringIO()
+
+        with mock.patch('ecmanagerapp.management.commands.benchmark.run_benchmarks', return_value=self.report(10.0)):
+            call_command('benchmark', '--baseline', path, '--save-baseline', stdout=output)
+            call_command('benchmark', '--baseline', path, stdout=output)
+        self.assertIn('No regressions', output.getvalue())
+
+        with mock.patch('ecmanagerapp.management.commands.benchmark.run_benchmarks', return_value=self.report(20.0)):
+            with self.assertRaisesMessage(CommandError, '1 benchmark(s) regressed beyond 25%'):
+                call_command('benchmark', '--baseline', path, stdout=output)
+
+
+@override_settings(
+    CLIENT_REPLICA_ENABLED=False,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    # Templates render without a collectstatic manifest
+    STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+)
+class ViewReadBudgetTests(ReadBudgetMixin, TestCase):
+    """
+    Firestore read budgets of every view in urls.py, against the in-memory
+    datastore seeded with NUM_CLIENTS clients over NUM_DISTRIBUTORS
+    distributors. Caches are emptied first, so these are cold-cache budgets.
+    """
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        self.store = MemoryDataStore()
+        set_datastore(self.store)
+        self.owner_ids = seed_synthetic_data(self.store, NUM_CLIENTS, NUM_DISTRIBUTORS)
+        self.owner_id = self.owner_ids[0]
+        self.owned = len(self.store.clients.owned_by(self.owner_id).get())
+        reset_caches()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        reset_caches()
+
+    def login(self, role, uid):
+        session = self.client.session
+        session['user'] = {'uid': uid, 'email': f'{role}@example.com', 'role': role}
+        session.save()
+
+    def test_login_and_register_pages_read_nothing(self):
+        with self.assertReadBudget(rpcs=0):
+            self.assertEqual(self.client.get('/').status_code, 200)
+            self.client.get('/register/')
+            self.client.get('/logout/')
+
+    def test_admin_dashboard(self):
+        self.login('admin', 'admin-uid')
+        refresh_kpi_state()
+        # Distributor names, Auth user list, then the KPI state and the leads past its watermark
+        with self.assertReadBudget(rpcs=5, auth_calls=1, documents=3 * NUM_DISTRIBUTORS,
+                                   collections={'distributors': 1, 'kpi_state': 1, 'clients': 1,
+                                                'monthly_counters': 0}):
+            response = self.client.get('/admins/dashboard/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_employee_dashboard(self):
+        self.login('employee', self.owner_id)
+        # Never a scan of all clients: only the employee's own, plus the leaderboard inputs
+        with self.assertReadBudget(rpcs=6, auth_calls=1, documents=self.owned + 2 * NUM_DISTRIBUTORS + 5,
+                                   collections={'distributors': 1, 'clients': 3, 'monthly_counters': 1}):
+            response = self.client.get('/employee/dashboard/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_pages_without_templates(self):
+        # distributor_list.html and admin_client_list.html are not in the tree;
+        # budget the reads these views make before rendering.
+        self.login('admin', 'admin-uid')
+        with mock.patch('ecmanagerapp.views.render', lambda *args, **kwargs: HttpResponse()):
+            with self.assertReadBudget(rpcs=1, auth_calls=1, documents=0):
+                self.client.get('/admins/dashboard/distributors')
+            reset_caches()
+            refresh_kpi_state()
+            with self.assertReadBudget(rpcs=5, auth_calls=1, documents=3 * NUM_DISTRIBUTORS,
+                                       collections={'distributors': 1, 'kpi_state': 1, 'clients': 1,
+                                                    'monthly_counters': 0}):
+                self.client.get('/admins/clients/')
+
+    def test_client_list_api_reads_one_page(self):
+        self.login('admin', 'admin-uid')
+        with self.assertReadBudget(rpcs=3, auth_calls=0, documents=10 + 1 + NUM_DISTRIBUTORS,
+                                   collections={'distributors': 1, 'clients': 2}):
+            response = self.client.get('/api/clients/', {'length': 10})
+        self.assertEqual(len(response.json()['data']), 10)
+
+    def test_export_reads_each_client_once(self):
+        self.login('admin', 'admin-uid')
+        with self.assertReadBudget(auth_calls=0, documents=NUM_CLIENTS + NUM_DISTRIBUTORS,
+                                   collections={'distributors': 1, 'clients': 1}):
+            response = self.client.get('/api/clients/export/', {'format': 'csv'})
+            b''.join(response.streaming_content)
+
+    def test_submit_client_lead(self):
+        self.login('employee', self.owner_id)
+        lead = json.dumps({'fullName': 'New Lead', 'contact1': '0799999999'})
+        # Contact claim in the transaction, then the live leaderboard push
+        with self.assertReadBudget(rpcs=4, auth_calls=0, documents=3 * NUM_DISTRIBUTORS,
+                                   collections={'client_contacts': 1, 'clients': 0}):
+            response = self.client.post('/api/submit_client_lead/', lead, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        with self.assertReadBudget(rpcs=1, documents=1, collections={'client_contacts': 1}):
+            response = self.client.post('/api/submit_client_lead/', lead, content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+
+    async def test_concurrent_submissions_claim_a_contact_once(self):
+        session = await self.async_client.asession()
+        await session.aset('user', {'uid': self.owner_id, 'email': 'employee@example.com', 'role': 'employee'})
+        await session.asave()
+        lead = json.dumps({'fullName': 'Racing Lead', 'contact1': '0788888888'})
+        responses = await asyncio.gather(*(
+            self.async_client.post('/api/submit_client_lead/', lead, content_type='application/json') for _ in range(5)))
+        self.assertEqual(sorted(response.status_code for response in responses), [201, 409, 409, 409, 409])
+
+    async def test_async_lead_save_reads_through_the_transaction(self):
+        lead = {'ownerId': self.owner_id, 'fullName': 'Async Lead', 'contact1': '0777777777',
+                'dateLogged': firestore.SERVER_TIMESTAMP}
+        await asave_client_lead(self.owner_id, dict(lead))
+        with self.assertRaises(DuplicateContactError):
+            await asave_client_lead(self.owner_id, dict(lead))
+
+        # As with AsyncTransaction, transaction.get() is an async iterator, not an awaitable.
+        index_ref = self.store.aio.contacts.document('0777777777')
+
+        async def read(transaction):
+            with self.assertRaises(TypeError):
+                await transaction.get(index_ref)
+            return [snapshot async for snapshot in transaction.get(index_ref)]
+
+        snapshots = await self.store.arun_transaction(read)
+        self.assertEqual(snapshots[0].to_dict()['ownerId'], self.owner_id)
+
+    def test_import_client_leads_checks_contacts_in_one_call(self):
+        self.login('employee', self.owner_id)
+        upload = io.BytesIO(b'fullName,contact1\nAlice Lead,0711111111\nBob Lead,0722222222\n')
+        upload.name = 'leads.csv'
+        with self.assertReadBudget(rpcs=4, auth_calls=0, documents=2 + 3 * NUM_DISTRIBUTORS,
+                                   collections={'client_contacts': 1, 'clients': 0}):
+            response = self.client.post('/api/import_client_leads/', {'file': upload})
+        self.assertEqual(response.status_code, 201)
+
+    def test_delete_employee(self):
+        self.login('admin', 'admin-uid')
+        user = self.store.users.create(email='leaver@example.com', password='password', display_name='Leaver')
+        self.store.distributors.set(user.uid, {'full_name': 'Leaver', 'email': 'leaver@example.com'})
+        with self.assertReadBudget(rpcs=3, auth_calls=1, documents=1, collections={'clients': 0}):
+            response = self.client.post('/delete-employee/', {'uid': user.uid})
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_views_require_an_admin_session(self):
+        user = self.store.users.create(email='stays@example.com', password='password', display_name='Stays')
+        for role, target in ((None, 'login_form'), ('employee', 'employee_dashboard')):
+            if role:
+                self.login(role, self.owner_id)
+            with self.assertReadBudget(rpcs=0):
+                for response in (self.client.post('/delete-employee/', {'uid': user.uid}),
+                                 self.client.get('/admins/clients/')):
+                    self.assertRedirects(response, reverse(target), fetch_redirect_response=False)
+        self.assertIn(user.uid, [account.uid for account in self.store.users.iterate_all()])
+
+    def test_metrics_and_profiles_read_nothing(self):
+        self.login('admin', 'admin-uid')
+        with self.assertReadBudget(rpcs=0):
+            self.client.get('/metrics')
+            self.client.get('/admins/profiles/')
+
+    def test_exceeded_budget_fails_with_the_calls(self):
+        with self.assertRaises(AssertionError) as raised:
+            with self.assertReadBudget(rpcs=0, collections={'distributors': 0}):
+                list(self.store.distributors.all())
+        self.assertIn("1 reads of 'distributors', budget 0", str(raised.exception))
+        self.assertIn('Calls: firestore.', str(raised.exception))
+
+
+@override_settings(
+    CLIENT_REPLICA_ENABLED=False,
+    RATE_LIMITS={'login': '2/m', 'import_leads': '1/m'},
+    CONCURRENCY_LIMITS={'admin_client_list': 1},
+    CONCURRENCY_QUEUE_TIMEOUT=0,
+)
+class ThrottlingTests(TestCase):
+    """Token-bucket rate limits and concurrency slots, kept in the local-memory cache."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        set_datastore(MemoryDataStore())
+        cache.clear()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        cache.clear()
+
+    @mock.patch('ecmanagerapp.views.asign_in_with_password', side_effect=httpx.ConnectError('offline'))
+    def test_login_attempts_are_limited_per_ip(self, sign_in):
+        credentials = {'email': 'someone@example.com', 'password': 'wrong'}
+        statuses = [self.client.post('/', credentials).status_code for _ in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(sign_in.call_count, 2)
+
+        response = self.client.post('/', credentials)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Another client still has its own bucket, and the page itself is not limited.
+        self.assertEqual(self.client.post('/', credentials, REMOTE_ADDR='10.0.0.2').status_code, 302)
+        self.assertEqual(self.client.get('/').status_code, 200)
+
+    def test_busy_view_is_rejected_with_503(self):
+        # Anonymous requests are redirected before they take a slot.
+        self.assertEqual(self.client.get('/admins/clients/').status_code, 302)
+
+        session = self.client.session
+        session['user'] = {'uid': 'admin-uid', 'email': 'admin@example.com', 'role': 'admin'}
+        session.save()
+
+        slot = acquire_slot('admin_client_list')
+        with mock.patch('ecmanagerapp.views.render', lambda *args, **kwargs: HttpResponse()):
+            self.assertEqual(self.client.get('/admins/clients/').status_code, 503)
+            release_slot(slot)
+            self.assertEqual(self.client.get('/admins/clients/').status_code, 200)
+
+    def test_imports_are_limited_per_user(self):
+        session = self.client.session
+        session['user'] = {'uid': 'b', 'email': 'b@example.com', 'role': 'employee'}
+        session.save()
+        statuses = [
+            self.client.post('/api/import_client_leads/', {
+                'file': SimpleUploadedFile('leads.csv', b'fullName,contact1\nLead %d,071100000%d\n' % (i, i)),
+            }).status_code
+            for i in range(2)
+        ]
+        self.assertEqual(statuses, [201, 429])
+
+    async def test_queued_request_gets_the_freed_slot(self):
+        slot = await aacquire_slot('admin_client_list')
+        with override_settings(CONCURRENCY_QUEUE_TIMEOUT=2):
+            asyncio.get_running_loop().call_later(0.1, lambda: asyncio.ensure_future(arelease_slot(slot)))
+            queued = await aacquire_slot('admin_client_list')
+        self.assertTrue(queued)
+        self.assertNotEqual(queued, slot)
+        await arelease_slot(queued)
+
+
+class FirebaseStartupTests(ReadBudgetMixin, TestCase):
+    """Lazy, once-per-process Firebase initialization and the optional worker warm-up."""
+
+    def setUp(self):
+        self._previous_store = get_datastore()
+        reset_caches()
+
+    def tearDown(self):
+        set_datastore(self._previous_store)
+        reset_caches()
+
+    @contextlib.contextmanager
+    def firebase_admin(self):
+        """Patches firebase_admin so get_app() fails until initialize_app() was called."""
+        apps_created = []
+
+        def get_app():
+            if not apps_created:
+                raise ValueError('The default Firebase app does not exist.')
+            return apps_created[0]
+
+        def initialize_app(*args):
+            time.sleep(0.01)
+            apps_created.append(mock.Mock(name='app', args=args))
+            return apps_created[-1]
+
+        with mock.patch('firebase_admin.get_app', side_effect=get_app), \
+                mock.patch('firebase_admin.initialize_app', side_effect=initialize_app) as initialize, \
+                mock.patch('firebase_admin.credentials.Certificate', side_effect=lambda path: ('certificate', path)):
+            yield initialize
+
+    def test_concurrent_first_calls_initialize_once(self):
+        with self.firebase_admin() as initialize, override_settings(FIREBASE_CREDENTIALS_FILE=__file__):
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(get_firebase_app())) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(initialize.call_count, 1)
+        self.assertEqual(initialize.call_args.args, (('certificate', __file__),))
+        self.assertEqual(len({id(app) for app in results}), 1)
+
+    def test_missing_key_file_uses_default_credentials(self):
+        with self.firebase_admin() as initialize, override_settings(FIREBASE_CREDENTIALS_FILE='/nonexistent.json'):
+            get_firebase_app()
+        self.assertEqual(initialize.call_args.args, ())
+
+    def test_datastore_creates_one_client_on_first_use(self):
+        with self.firebase_admin() as initialize, \
+                mock.patch('firebase_admin.firestore.client', side_effect=lambda app: mock.Mock()) as client:
+            store = FirebaseDataStore()
+            self.assertEqual(initialize.call_count, 0)
+            run_parallel(*[store._db_client] * 4)
+        self.assertEqual((initialize.call_count, client.call_count), (1, 1))
+
+    def test_warm_up_fills_the_distributor_map(self):
+        store = MemoryDataStore()
+        store.distributors.set('a', {'full_name': 'Alice Distributor'})
+        set_datastore(store)
+        with mock.patch('threading.Thread.start', autospec=True) as start:
+            apps.EcmanagerappConfig.ready(mock.Mock())
+            self.assertEqual(start.call_count, 0)
+            with override_settings(FIREBASE_WARM_UP=True):
+                apps.EcmanagerappConfig.ready(mock.Mock())
+        thread = start.call_args.args[0]
+        self.assertEqual(thread.name, 'firebase-warm-up')
+
+        thread.run()
+        self.assertEqual(distributor_map_cache_stats()['size'], 1)
+        with self.assertReadBudget(rpcs=0):
+            self.assertEqual(get_distributor_map(), {'a': 'Alice Distributor'})
+
+    def test_warm_up_errors_do_not_escape(self):
+        set_datastore(mock.Mock(distributors=mock.Mock(collection=mock.Mock(side_effect=RuntimeError('no credentials')))))
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            apps._warm_up()
+        self.assertIn('no credentials', stderr.getvalue())
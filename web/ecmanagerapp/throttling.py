@@ -0,0 +1,267 @@
+import asyncio
+import math
+import random
+import re
+import sys
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+# '10/m', '100/h', '5/30s': a bucket of N tokens refilled at N per period
+RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smhd])[a-z]*\s*$')
+_PERIOD_SECONDS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# A bucket is locked while it is read and written back, so concurrent
+# requests of one identity (across workers) cannot spend the same token.
+_LOCK_SECONDS = 2
+_LOCK_ATTEMPTS = 20
+_LOCK_WAIT = 0.005
+
+# Seconds between two attempts of a queued request to claim a slot
+_SLOT_POLL = 0.05
+
+
+def parse_rate(rate):
+    """
+    Parses a rate such as '10/m' into (capacity, period_seconds); None when
+    the rate is empty (no limit).
+
+    Raises:
+        ValueError: The rate is not 'N/period'.
+    """
+    if not rate:
+        return None
+    match = RATE_RE.match(rate)
+    if match is None:
+        raise ValueError(f"Invalid rate '{rate}'; expected e.g. '10/m' or '100/h'.")
+    capacity, multiplier, unit = match.groups()
+    return int(capacity), int(multiplier or 1) * _PERIOD_SECONDS[unit]
+
+
+def get_throttle_cache():
+    """The cache holding buckets and slots (settings.THROTTLE_CACHE, default 'default')."""
+    return caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+
+def _enabled():
+    return getattr(settings, 'RATE_LIMIT_ENABLED', True)
+
+
+def get_rate(scope):
+    """(capacity, period_seconds) of a scope from settings.RATE_LIMITS, or None."""
+    if not _enabled():
+        return None
+    return parse_rate(getattr(settings, 'RATE_LIMITS', {}).get(scope))
+
+
+def get_concurrency_limit(scope):
+    """Concurrent requests allowed for a scope (settings.CONCURRENCY_LIMITS); 0 means unlimited."""
+    if not _enabled():
+        return 0
+    return int(getattr(settings, 'CONCURRENCY_LIMITS', {}).get(scope) or 0)
+
+
+def client_ip(request):
+    """
+    The client's IP address. Behind settings.RATE_LIMIT_PROXY_COUNT trusted
+    proxies it is read from X-Forwarded-For, counting from the right, since
+    the leftmost entries are whatever the client sent.
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        hops = [hop.strip() for hop in forwarded.split(',') if hop.strip()]
+        if hops:
+            return hops[-min(proxies, len(hops))]
+    return request.META.get('REMOTE_ADDR', 'unknown')
+
+
+# --- Token bucket ---
+
+def _bucket_key(scope, identity):
+    return f'throttle:bucket:{scope}:{identity}'
+
+
+def _take(state, now, capacity, period, cost):
+    """
+    Refills a bucket for the time elapsed and takes `cost` tokens if it can.
+
+    Returns:
+        tuple: (new state, seconds to wait; 0 when the tokens were taken)
+    """
+    tokens, updated_at = state or (capacity, now)
+    tokens = min(capacity, tokens + max(0.0, now - updated_at) * capacity / period)
+    if tokens >= cost:
+        return (tokens - cost, now), 0.0
+    return (tokens, now), (cost - tokens) * period / capacity
+
+
+def consume(scope, identity, cost=1):
+    """
+    Takes `cost` tokens from the identity's bucket for `scope`.
+
+    Returns:
+        float: 0 if the request may proceed, otherwise the seconds until it
+        would. Cache errors (e.g. Redis down) let the request through.
+    """
+    rate = get_rate(scope)
+    if rate is None:
+        return 0.0
+    capacity, period = rate
+    cache = get_throttle_cache()
+    key = _bucket_key(scope, identity)
+
+    try:
+        for _ in range(_LOCK_ATTEMPTS):
+            if cache.add(f'{key}:lock', 1, timeout=_LOCK_SECONDS):
+                break
+            time.sleep(_LOCK_WAIT)
+        else:
+            print(f"Rate limit bucket {key} stayed locked; letting the request through", file=sys.stderr)
+            return 0.0
+        try:
+            state, retry_after = _take(cache.get(key), time.time(), capacity, period, cost)
+            cache.set(key, state, timeout=math.ceil(period) + 1)
+        finally:
+            cache.delete(f'{key}:lock')
+        return retry_after
+
+    except Exception as e:
+        print(f"Rate limit check failed for {scope}: {e}", file=sys.stderr)
+        return 0.0
+
+
+async def aconsume(scope, identity, cost=1):
+    """Async consume(), through the cache's async API."""
+    rate = get_rate(scope)
+    if rate is None:
+        return 0.0
+    capacity, period = rate
+    cache = get_throttle_cache()
+    key = _bucket_key(scope, identity)
+
+    try:
+        for _ in range(_LOCK_ATTEMPTS):
+            if await cache.aadd(f'{key}:lock', 1, timeout=_LOCK_SECONDS):
+                break
+            await asyncio.sleep(_LOCK_WAIT)
+        else:
+            print(f"Rate limit bucket {key} stayed locked; letting the request through", file=sys.stderr)
+            return 0.0
+        try:
+            state, retry_after = _take(await cache.aget(key), time.time(), capacity, period, cost)
+            await cache.aset(key, state, timeout=math.ceil(period) + 1)
+        finally:
+            await cache.adelete(f'{key}:lock')
+        return retry_after
+
+    except Exception as e:
+        print(f"Rate limit check failed for {scope}: {e}", file=sys.stderr)
+        return 0.0
+
+
+# --- Concurrency slots ---
+
+def _slot_keys(scope, limit):
+    # Claimed in random order, so waiting requests do not all race for slot 0.
+    keys = [f'throttle:slot:{scope}:{index}' for index in range(limit)]
+    random.shuffle(keys)
+    return keys
+
+
+def _queue_timeout():
+    return getattr(settings, 'CONCURRENCY_QUEUE_TIMEOUT', 2.0)
+
+
+def _slot_ttl():
+    # A slot held by a worker that died is freed after this many seconds.
+    return getattr(settings, 'CONCURRENCY_SLOT_TTL', 60)
+
+
+def acquire_slot(scope):
+    """
+    Claims one of the scope's settings.CONCURRENCY_LIMITS slots, shared by
+    every worker through the cache. When all are taken, waits up to
+    settings.CONCURRENCY_QUEUE_TIMEOUT seconds for one to free up.
+
+    Returns:
+        The slot to pass to release_slot() (None when the scope is unlimited
+        or the cache failed), or False if no slot freed up in time.
+    """
+    limit = get_concurrency_limit(scope)
+    if not limit:
+        return None
+    cache = get_throttle_cache()
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + _queue_timeout()
+
+    try:
+        while True:
+            for key in _slot_keys(scope, limit):
+                if cache.add(key, token, timeout=_slot_ttl()):
+                    return key, token
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(_SLOT_POLL * (0.5 + random.random()))
+
+    except Exception as e:
+        print(f"Concurrency limit check failed for {scope}: {e}", file=sys.stderr)
+        return None
+
+
+async def aacquire_slot(scope):
+    """Async acquire_slot(): queued requests wait without blocking the event loop."""
+    limit = get_concurrency_limit(scope)
+    if not limit:
+        return None
+    cache = get_throttle_cache()
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + _queue_timeout()
+
+    try:
+        while True:
+            for key in _slot_keys(scope, limit):
+                if await cache.aadd(key, token, timeout=_slot_ttl()):
+                    return key, token
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(_SLOT_POLL * (0.5 + random.random()))
+
+    except Exception as e:
+        print(f"Concurrency limit check failed for {scope}: {e}", file=sys.stderr)
+        return None
+
+
+def release_slot(slot):
+    """Frees a slot from acquire_slot(), unless it expired and was claimed by another request."""
+    if not slot:
+        return
+    key, token = slot
+    cache = get_throttle_cache()
+    try:
+        if cache.get(key) == token:
+            cache.delete(key)
+    except Exception as e:
+        print(f"Could not release concurrency slot {key}: {e}", file=sys.stderr)
+
+
+async def arelease_slot(slot):
+    """Async release_slot()."""
+    if not slot:
+        return
+    key, token = slot
+    cache = get_throttle_cache()
+    try:
+        if await cache.aget(key) == token:
+            await cache.adelete(key)
+    except Exception as e:
+        print(f"Could not release concurrency slot {key}: {e}", file=sys.stderr)
+
+
+def record_throttled(scope, reason):
+    """Counts a rejected request ('rate' or 'concurrency') for /metrics."""
+    metrics.throttled_requests_total.inc((scope, reason))
@@ -8,12 +8,22 @@ urlpatterns = [
     path('logout/', views.logout_form, name='logout_form'),
 
     path('delete-employee/', views.delete_employee, name='delete_employee'),
+    path('admins/employees/delete/', views.delete_employees, name='delete_employees'),
+    path('admins/employee-deletions/<str:job_id>', views.employee_deletion_status, name='employee_deletion_status'),
 
     path("admins/dashboard/", views.admin_dashboard, name="admin_dashboard"),
 
     path("employee/dashboard/", views.employee_dashboard, name="employee_dashboard"),
     path("admins/dashboard/distributors", views.distributor_list, name="distributor_list"),
     path("api/submit_client_lead/", views.submit_client_lead, name="submit_client_lead"),
+    path("api/import_client_leads/", views.import_client_leads_view, name="import_client_leads"),
 
     path('admins/clients/', views.admin_client_list, name='admin_client_list'),
+    path('api/clients/', views.client_list_api, name='client_list_api'),
+    path('api/clients/export/', views.export_clients, name='export_clients'),
+    path('api/leaderboard/', views.leaderboard_api, name='leaderboard_api'),
+
+    path('metrics', views.metrics, name='metrics'),
+    path('admins/profiles/', views.profile_list, name='profile_list'),
+    path('admins/profiles/<str:name>', views.download_profile, name='download_profile'),
 ]
@@ -1,25 +1,44 @@
+import csv
+import itertools
 import json
+import sys
 
 import firebase_admin
-from django.http import JsonResponse, HttpResponseBadRequest
+import httpx
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.views.decorators.http import require_POST
-from firebase_admin import auth
-from hrmanager.settings import db
 from firebase_admin import firestore
-import requests
+from google.api_core.exceptions import AlreadyExists
 from django.conf import settings
 from django.contrib.auth import logout
 
-from .decorators import firebase_login_required, admin_required
+from .client_export_utility import EXPORT_FORMATS, iter_client_export
+from .client_import_utility import IMPORT_FORMATS, import_client_leads, iter_lead_records
+from .client_lead_utility import (
+    DuplicateContactError, LeadValidationError, asave_client_lead, clean_client_lead, contact_is_claimed,
+)
+from .concurrency import Loader, arun_loaders, run_loaders
+from .dashboard_push_utility import apublish_new_leads, publish_new_leads
+from .datastore import get_datastore
+from .decorators import admin_required, concurrency_limited, firebase_login_required, rate_limited
 import datetime
 from datetime import timezone
 import pytz # Required for converting to local timezone
-from .distributor_data_utility import get_distributor_data
-from .client_data_utility import get_client_data
-from .employee_clients_data_utility import get_employee_clients
-from .employee_leader_board_data_utility import get_monthly_leaderboard
+from .distributor_data_utility import (
+    aget_distributor_data, get_distributor_data, invalidate_distributor_map, remember_distributor,
+)
+from .client_data_utility import aget_client_kpis, get_client_kpis, get_client_page
+from .employee_clients_data_utility import aget_employee_clients
+from .employee_deletion_utility import EmployeeDeletionError, get_employee_deletion, start_employee_deletion
+from .employee_leader_board_data_utility import aget_monthly_leaderboard, get_leaderboard
+from .login_utility import aget_distributor_profile, asign_in_with_password
+from .metrics import registry as metrics_registry
+from .period_rollup_utility import local_today
+from .monthly_aggregate_utility import invalidate_monthly_aggregate
+from .profiling import PROFILE_REPORT_SORTS, list_profiles, read_profile, render_profile_report
 
 def register_form(request):
     if request.method == "POST":
@@ -33,8 +52,8 @@ def register_form(request):
             return JsonResponse({"status": "error", "message": "Passwords do not match."}, status=400)
 
         try:
-            # Assume 'auth' is the initialized Firebase Auth client
-            user = auth.create_user(
+            store = get_datastore()
+            user = store.users.create(
                 email=email,
                 password=password1,
                 display_name=full_name
@@ -42,14 +61,14 @@ def register_form(request):
             # Store additional info in Firestore using the correct Public Data Path
             # Public data (for sharing with other users or collaborative apps):
             # Collection path: MUST store in /artifacts/{appId}/public/data/distributors
-            distributors_ref = db.collection(f'artifacts/{settings.FIREBASE_WEB_APP_ID}/public/data/distributors')
-
-            distributors_ref.document(user.uid).set({
+            store.distributors.set(user.uid, {
                 'full_name': full_name,
                 'email': email,
                 'role': 'employee',
                 'created_at': firestore.SERVER_TIMESTAMP
             })
+            invalidate_distributor_map()
+            remember_distributor(user)
             return JsonResponse({"status": "success", "message": "Employee registered successfully!"})
         except Exception as e:
             # Catch specific Firebase Auth exceptions here in a real app
@@ -58,36 +77,31 @@ def register_form(request):
     return JsonResponse({"status": "error", "message": "Invalid request method."}, status=405)
 
 
-def login_form(request):
+@rate_limited('login', key='ip', methods=('POST',))
+async def login_form(request):
     if request.method == "POST":
         email = request.POST["email"]
         password = request.POST["password"]
 
         try:
-            # Firebase REST API for sign-in
-            firebase_auth_url = f"https://identitytoolkit.googleapis.com/v1/accounts:signInWithPassword?key={settings.FIREBASE_WEB_API_KEY}"
-            payload = {
-                "email": email,
-                "password": password,
-                "returnSecureToken": True
-            }
-
-            response = requests.post(firebase_auth_url, json=payload)
-            data = response.json()
-
-            decoded_token = auth.verify_id_token(data['idToken'])
+            # Firebase REST API for sign-in (async, pooled connections, timeouts and retries)
+            data = await asign_in_with_password(email, password)
+
+            # Signing keys are cached by firebase_admin between verifications;
+            # it has no async API, so a cache miss is fetched on a worker thread.
+            decoded_token = await sync_to_async(get_datastore().users.verify_id_token, thread_sensitive=False)(
+                data['idToken'])
             uid = decoded_token["uid"]
 
-            # Fetch role from Firestore
-            doc_ref = db.collection(f'artifacts/{settings.FIREBASE_WEB_APP_ID}/public/data/distributors').document(uid).get()
+            # Fetch role from Firestore (cached for a short while)
+            user_data = await aget_distributor_profile(uid)
 
-            if doc_ref.exists:
-                user_data = doc_ref.to_dict()
-                request.session["user"] = {
+            if user_data is not None:
+                await request.session.aset("user", {
                     "uid": uid,
                     "email": user_data["email"],
                     "role": user_data.get("role", "employee")
-                }
+                })
                 # Redirect based on role
                 if user_data.get("role") == "admin":
                     return redirect("admin_dashboard")
@@ -97,6 +111,11 @@ def login_form(request):
                 messages.error(request, "User data not found in Firestore.")
                 return redirect("login_form")
 
+        except httpx.HTTPError as e:
+            print(f"Sign-in request failed: {e}", file=sys.stderr)
+            messages.error(request, "Login failed: the sign-in service did not respond. Please try again.")
+            return redirect("login_form")
+
         except Exception as e:
             messages.error(request, f"Login failed: {e}")
             return redirect("login_form")
@@ -111,11 +130,17 @@ def logout_form(request):
     return redirect('login_form')
 
 
+@firebase_login_required
+@admin_required
 @require_POST
 def delete_employee(request):
     """
     Handles the deletion of a user from both Firebase Auth and Firestore DB.
     Requires the user's UID to identify the records.
+
+    The employee's clients are archived (cascade=archive) or handed to another
+    distributor (cascade=reassign&reassign_to=<uid>) by a background job whose
+    progress is served at /admins/employee-deletions/<job id>.
     """
 
     # 1. Retrieve the UID from the POST request (e.g., via an AJAX call)
@@ -127,27 +152,23 @@ def delete_employee(request):
         return JsonResponse({'success': False, 'message': 'Invalid request data.'}, status=400)
 
     try:
-        # --- Step 1: Delete from Firebase Authentication ---
-        # This revokes their access and removes their authentication record.
-        auth.delete_user(employee_uid)
-
-        # --- Step 2: Delete associated document from Firestore ---
-        # The document is stored in the 'distributors' collection, keyed by the UID.
-        distributor_ref = db.collection(f'artifacts/{settings.FIREBASE_WEB_APP_ID}/public/data/distributors').document(
-            employee_uid)
-
-        # Check if the document exists before attempting deletion (optional but robust)
-        if distributor_ref.get().exists:
-            distributor_ref.delete()
-
-        # You may want to delete other related data here as well,
-        # e.g., db.collection('employee_tasks').document(employee_uid).delete()
+        # Auth user and distributor document now, the clients in the background
+        job = start_employee_deletion(
+            [employee_uid],
+            mode=request.POST.get('cascade'),
+            target_id=request.POST.get('reassign_to'),
+            requested_by=(request.session.get('user') or {}).get('email'),
+        )
 
         return JsonResponse({
             'success': True,
-            'message': f'Employee (UID: {employee_uid}) successfully deleted from Auth and Firestore.'
+            'message': f'Employee (UID: {employee_uid}) successfully deleted from Auth and Firestore.',
+            'job': job,
         })
 
+    except EmployeeDeletionError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
     except firebase_admin.exceptions.FirebaseError as e:
         # Handle cases where the user might not exist in Auth
         error_message = f"Firebase error during deletion: {e}"
@@ -164,18 +185,70 @@ def delete_employee(request):
 
 
 @firebase_login_required
-def employee_dashboard(request):
-    user = request.session.get("user")
-    employee_id = user.get("uid") if user and user.get("uid") else "default-user-id"
+@admin_required
+@require_POST
+def delete_employees(request):
+    """
+    Bulk deletion: every UID posted as 'uids' is removed from Firebase Auth
+    with auth.delete_users() (1000 per call) and their clients are cascaded
+    by one background job, as in delete_employee.
+    """
+    uids = request.POST.getlist('uids')
+    try:
+        job = start_employee_deletion(
+            uids,
+            mode=request.POST.get('cascade'),
+            target_id=request.POST.get('reassign_to'),
+            requested_by=request.session['user'].get('email'),
+        )
+    except EmployeeDeletionError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+    except firebase_admin.exceptions.FirebaseError as e:
+        print(f"Firebase error during bulk deletion: {e}", file=sys.stderr)
+        return JsonResponse({'success': False, 'message': 'Deletion failed due to a Firebase issue.'}, status=500)
 
-    # CRITICAL: Call the dedicated function to get the filtered clients
-    employee_clients = get_employee_clients(employee_id)
+    return JsonResponse({
+        'success': not job['authFailures'],
+        'message': f"{len(job['uids'])} of {len(set(uids))} employees deleted.",
+        'job': job,
+    })
 
-    # 1. CALL THE UTILITY FUNCTION for Distributors
-    # This fetches the list of employees/distributors.
-    distributors = get_distributor_data()
 
-    leaderboard_list = get_monthly_leaderboard(3)
+@firebase_login_required
+@admin_required
+def employee_deletion_status(request, job_id):
+    """Progress of an employee deletion job (status, total, processed, error)."""
+    job = get_employee_deletion(job_id)
+    if job is None:
+        return JsonResponse({'error': 'No such deletion job.'}, status=404)
+    return JsonResponse(job)
+
+
+@firebase_login_required
+async def employee_dashboard(request):
+    user = await request.session.aget("user")
+    employee_id = user.get("uid") if user and user.get("uid") else "default-user-id"
+
+    # Load the employee's clients, the distributor list and the leaderboard
+    # concurrently; a loader that fails or times out falls back to empty data.
+    data, failed = await arun_loaders({
+        # CRITICAL: the dedicated function returns only this employee's clients
+        'employee_clients': Loader(aget_employee_clients, employee_id, fallback={
+            'clients': [],
+            'kpi_total_clients': 0,
+            'kpi_clients_month': 0,
+            'kpi_top_distributor_name': 'N/A',
+            'kpi_top_distributor_count': 0,
+        }),
+        'distributors': Loader(aget_distributor_data, fallback=[]),
+        'leaderboard_list': Loader(aget_monthly_leaderboard, 3, fallback=[]),
+    })
+    if failed:
+        messages.warning(request, "Some dashboard data could not be loaded. Please refresh shortly.")
+
+    employee_clients = data['employee_clients']
+    distributors = data['distributors']
+    leaderboard_list = data['leaderboard_list']
 
     # 3. Combine ALL data into a single context dictionary
     context = {
@@ -199,24 +272,58 @@ def employee_dashboard(request):
     return render(request, "employee_dashboard.html", context)
 
 
+def _load_admin_data(request):
+    """
+    Loads the distributor list and the client metrics for the admin pages in
+    parallel, falling back to empty data for any loader that fails.
+    """
+    data, failed = run_loaders({
+        'distributors': Loader(get_distributor_data, fallback=[]),
+        'client_metrics': Loader(get_client_kpis, fallback={
+            'kpi_total_clients': 0,
+            'kpi_clients_month': 0,
+            'kpi_top_distributor': 'N/A',
+            'num_clients': 0,
+        }),
+    })
+    if failed:
+        messages.warning(request, "Some dashboard data could not be loaded. Please refresh shortly.")
+    return data['distributors'], data['client_metrics']
+
+
+async def _aload_admin_data(request):
+    """_load_admin_data() for async views: the loaders are awaited concurrently."""
+    data, failed = await arun_loaders({
+        'distributors': Loader(aget_distributor_data, fallback=[]),
+        'client_metrics': Loader(aget_client_kpis, fallback={
+            'kpi_total_clients': 0,
+            'kpi_clients_month': 0,
+            'kpi_top_distributor': 'N/A',
+            'num_clients': 0,
+        }),
+    })
+    if failed:
+        messages.warning(request, "Some dashboard data could not be loaded. Please refresh shortly.")
+    return data['distributors'], data['client_metrics']
+
+
 @firebase_login_required
 @admin_required
-def admin_dashboard(request):
+@rate_limited('admin_dashboard')
+@concurrency_limited('admin_dashboard')
+async def admin_dashboard(request):
     """
     Renders the admin dashboard, fetching both distributor and client data
     via reusable utility functions (DRY principle).
     """
-    user = request.session.get("user")
-
-    # 1. CALL THE UTILITY FUNCTION for Distributors
-    # This fetches the list of employees/distributors.
-    distributors = get_distributor_data()
+    user = await request.session.aget("user")
 
-    # 2. CALL THE UTILITY FUNCTION for Clients/KPIs
-    # This fetches client list, total clients, monthly leads, and top distributor data.
-    client_metrics = get_client_data()
+    # 1. CALL THE UTILITY FUNCTIONS for Distributors and Client KPIs concurrently
+    # The client loader fetches total clients, monthly leads, and top distributor data;
+    # the client table itself is paged in from client_list_api.
+    distributors, client_metrics = await _aload_admin_data(request)
 
-    # 3. Combine ALL data into a single context dictionary
+    # 2. Combine ALL data into a single context dictionary
     context = {
         "user": user,
 
@@ -224,8 +331,7 @@ def admin_dashboard(request):
         "employees": distributors,
         "total_employees": len(distributors),
 
-        # Client Data and KPIs (for dashboard metrics and optional client lists)
-        "clients": client_metrics['clients'],
+        # Client KPIs (for dashboard metrics)
         "kpi_total_clients": client_metrics['kpi_total_clients'],
         "kpi_clients_month": client_metrics['kpi_clients_month'],
         # Note: kpi_top_distributor now contains the live name and count
@@ -233,7 +339,7 @@ def admin_dashboard(request):
         "num_clients": client_metrics['num_clients'],
     }
 
-    # 4. Render the dashboard template
+    # 3. Render the dashboard template
     return render(request, "admin_dashboard.html", context)
 
 
@@ -261,31 +367,18 @@ def distributor_list(request):
 
 def check_for_duplicate_contact(contact):
     """
-    CONCEPTUAL: Checks if a contact (email or phone) already exists in any client lead.
+    Checks if a contact (email or phone) already belongs to any client lead.
 
-    This simulates the complex, multi-field, server-side check required
-    to ensure uniqueness across the entire public 'clients' collection.
-
-    Note: Firestore requires separate queries for each field check.
+    Contacts are kept unique through the contact index (one document per
+    normalized contact), so this is a single point lookup instead of one
+    query per contact field.
     """
-    clients_ref = db.collection(f'artifacts/{settings.FIREBASE_WEB_APP_ID}/public/data/clients')
-
-    # Check if contact is already in 'contact1' field
-    # We query the normalized field in the database
-    query1 = clients_ref.where('contact1', '==', contact).limit(1).get()
-    if len(query1) > 0:
-        return True
-
-    # Check if contact is already in 'contact2' field
-    query2 = clients_ref.where('contact2', '==', contact).limit(1).get()
-    if len(query2) > 0:
-        return True
-
-    return False
+    return contact_is_claimed(contact)
 
 
 # --- Client Submission Logic (Updated) ---
-def submit_client_lead(request):
+@rate_limited('submit_lead', methods=('POST',))
+async def submit_client_lead(request):
     """
     Django view to receive and save a new client lead to Firestore.
     Ensures the client is correctly associated with the authenticated employee.
@@ -295,7 +388,7 @@ def submit_client_lead(request):
         return HttpResponseBadRequest(json.dumps({'error': 'Only POST method allowed'}), status=405)
 
     # Assuming user authentication has been handled and 'request.user' is available
-    user = request.session.get("user")
+    user = await request.session.aget("user")
 
     if not user or 'uid' not in user:
         # The user must be logged in to submit a lead
@@ -308,69 +401,102 @@ def submit_client_lead(request):
     except json.JSONDecodeError:
         return HttpResponseBadRequest(json.dumps({'error': 'Invalid JSON format'}), status=400)
 
-    # Extract and clean data
-    full_name = data.get('fullName', '').strip()
-    initial_notes = data.get('initialNotes', '').strip()
-
-    # --- FIX: Safely normalize contact_1 (Required) ---
-    contact_1_raw = data.get('contact1')
-    contact_1 = str(contact_1_raw).strip().lower() if contact_1_raw else None
-
-    # --- FIX: Safely normalize contact_2 (Optional) ---
-    contact_2_raw = data.get('contact2')
-    contact_2 = str(contact_2_raw).strip().lower() if contact_2_raw else None
-
-    # 2. Basic Server-side Data Validation
-    if not full_name or len(full_name) < 3:
-        return HttpResponseBadRequest(json.dumps({'error': 'Full name required.'}), status=400)
-
-    if not contact_1 or len(contact_1) < 5:
-        return HttpResponseBadRequest(json.dumps({'error': 'Primary contact required and must be valid.'}), status=400)
-
-    if contact_2 and contact_1 == contact_2:
-        return HttpResponseBadRequest(json.dumps({'error': 'Contacts cannot be identical.'}), status=400)
-
-    # If the optional contact_2 was just an empty string and became None, we treat it as valid.
-    if contact_2 == "":
-        contact_2 = None
-
-    # 3. CRITICAL: Contact Uniqueness Check
-    # Check contact 1
-    if check_for_duplicate_contact(contact_1):
-        return HttpResponseBadRequest(
-            json.dumps({'error': 'Primary contact already registered with another client.'}), status=409)
-
-    # Check contact 2 (only if provided)
-    if contact_2 and check_for_duplicate_contact(contact_2):
-        return HttpResponseBadRequest(
-            json.dumps({'error': 'Secondary contact already registered with another client.'}), status=409)
-
-    # 4. Save to Database (FIRESTORE)
+    # 2. Extract, normalize and validate the lead fields
+    try:
+        lead = clean_client_lead(data)
+    except LeadValidationError as e:
+        return HttpResponseBadRequest(json.dumps({'error': str(e)}), status=400)
+    contact_1 = lead['contact1']
+
+    # 3. Save to Database (FIRESTORE)
+    # CRITICAL: Contact uniqueness is enforced by claiming each contact in the
+    # contact index within the same transaction as the client write.
     try:
         # Path: /artifacts/{APP_ID}/public/data/clients
-        clients_ref = db.collection(f'artifacts/{settings.FIREBASE_WEB_APP_ID}/public/data/clients')
-
         client_data = {
             'ownerId': employee_uid,  # Enforces client-to-employee ownership
-            'fullName': full_name,
-            'contact1': contact_1,  # Normalized contact
-            'contact2': contact_2,  # Normalized contact (None if not provided)
-            'initialNotes': initial_notes,
-            'dateLogged': firestore.SERVER_TIMESTAMP  # Uses server time for reliable logging
+            'fullName': lead['fullName'],
+            'contact1': lead['contact1'],  # Normalized contact
+            'contact2': lead['contact2'],  # Normalized contact (None if not provided)
+            'initialNotes': lead['initialNotes'],
+            'dateLogged': firestore.SERVER_TIMESTAMP  # Stamped with an explicit time by asave_client_lead()
         }
 
-        # Save the new document
-        update_time, doc_ref = clients_ref.add(client_data)
+        # Save the new document, claim its contacts and bump the owner's monthly counter atomically
+        doc_ref = await asave_client_lead(employee_uid, client_data)
+        invalidate_monthly_aggregate()
+        await apublish_new_leads(employee_uid, clients=[{
+            'id': doc_ref.id,
+            'fullName': lead['fullName'],
+            'contact1': lead['contact1'],
+        }])
 
         # Returns success response with the new document ID
         return JsonResponse({'message': 'Client lead saved successfully', 'id': doc_ref.id}, status=201)
 
+    except DuplicateContactError as e:
+        label = 'Primary' if e.contact == contact_1 else 'Secondary'
+        return HttpResponseBadRequest(
+            json.dumps({'error': f'{label} contact already registered with another client.'}), status=409)
+
+    except AlreadyExists:
+        # Another submission claimed one of the contacts between our read and commit.
+        return HttpResponseBadRequest(
+            json.dumps({'error': 'Contact already registered with another client.'}), status=409)
+
     except Exception as e:
         # Log error details here
         print(f"Firestore Save Error: {e}")
         return JsonResponse({'error': 'Database save failed.'}, status=500)
 
 
+@firebase_login_required
+@require_POST
+@rate_limited('import_leads')
+@concurrency_limited('import_leads')
+def import_client_leads_view(request):
+    """
+    Bulk import of client leads for the logged-in employee from an uploaded
+    CSV or JSONL file (multipart field 'file'). The file is parsed as a stream,
+    validated like submit_client_lead and written in batches; the response
+    reports the outcome of every row.
+
+    Files over settings.IMPORT_MAX_FILE_SIZE bytes or IMPORT_MAX_ROWS rows are
+    rejected with a 413 before any lead is written.
+    """
+    employee_uid = request.session["user"].get("uid")
+    upload = request.FILES.get('file')
+    if not employee_uid or upload is None:
+        return JsonResponse({'error': "A CSV or JSONL file is required in the 'file' field."}, status=400)
+
+    file_format = request.POST.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+    if file_format not in IMPORT_FORMATS:
+        return JsonResponse({'error': 'Unsupported file format. Use .csv or .jsonl.'}, status=400)
+
+    max_size = getattr(settings, 'IMPORT_MAX_FILE_SIZE', 5 * 1024 * 1024)
+    if upload.size > max_size:
+        return JsonResponse({'error': f'The file is larger than {max_size} bytes.'}, status=413)
+
+    # Rows are checked before the first chunk is written, so an oversized file imports nothing.
+    max_rows = getattr(settings, 'IMPORT_MAX_ROWS', 5000)
+    try:
+        records = list(itertools.islice(iter_lead_records(upload.file, file_format), max_rows + 1))
+        if len(records) > max_rows:
+            return JsonResponse({'error': f'The file has more than {max_rows} rows.'}, status=413)
+        result = import_client_leads(records, employee_uid)
+    except (UnicodeDecodeError, csv.Error) as e:
+        return JsonResponse({'error': f'Could not read the file: {e}'}, status=400)
+
+    if result['created']:
+        publish_new_leads(employee_uid, count=result['created'])
+
+    return JsonResponse(result, status=201 if result['created'] else 200)
+
+
+@firebase_login_required
+@admin_required
+@rate_limited('admin_client_list')
+@concurrency_limited('admin_client_list')
 def admin_client_list(request):
     """
     Renders the Admin Client List page by fetching, joining, and processing
@@ -382,15 +508,12 @@ def admin_client_list(request):
     """
     user = request.session.get("user")
 
-    # 1. CALL THE UTILITY FUNCTION for Distributors
-    # This fetches the list of employees/distributors.
-    distributors = get_distributor_data()
+    # 1. CALL THE UTILITY FUNCTIONS for Distributors and Client KPIs concurrently
+    # The client loader fetches total clients, monthly leads, and top distributor data;
+    # the client table itself is paged in from client_list_api.
+    distributors, client_metrics = _load_admin_data(request)
 
-    # 2. CALL THE UTILITY FUNCTION for Clients/KPIs
-    # This fetches client list, total clients, monthly leads, and top distributor data.
-    client_metrics = get_client_data()
-
-    # 3. Combine ALL data into a single context dictionary
+    # 2. Combine ALL data into a single context dictionary
     context = {
         "user": user,
 
@@ -398,8 +521,7 @@ def admin_client_list(request):
         "employees": distributors,
         "total_employees": len(distributors),
 
-        # Client Data and KPIs (for dashboard metrics and optional client lists)
-        "clients": client_metrics['clients'],
+        # Client KPIs (for dashboard metrics)
         "kpi_total_clients": client_metrics['kpi_total_clients'],
         "kpi_clients_month": client_metrics['kpi_clients_month'],
         # Note: kpi_top_distributor now contains the live name and count
@@ -407,4 +529,166 @@ def admin_client_list(request):
         "num_clients": client_metrics['num_clients'],
     }
 
-    return render(request, "admin_client_list.html", context)
\ No newline at end of file
+    return render(request, "admin_client_list.html", context)
+
+
+# Largest page the client list API will serve, whatever the client asks for.
+CLIENT_PAGE_MAX_SIZE = 100
+
+
+@firebase_login_required
+@admin_required
+def client_list_api(request):
+    """
+    JSON endpoint for the admin client table in DataTables server-side mode.
+
+    Reads the standard DataTables parameters (draw, start, length, order[0][dir])
+    plus 'cursor' (ID of the last client of the previous page, returned as
+    'next_cursor') and 'owner' (distributor UID filter). Only one page of
+    clients is read from Firestore per request, ordered by dateLogged.
+    """
+    try:
+        draw = int(request.GET.get('draw', 0))
+        start = max(int(request.GET.get('start', 0)), 0)
+        length = int(request.GET.get('length', 25))
+    except ValueError:
+        return JsonResponse({'error': 'draw, start and length must be integers.'}, status=400)
+
+    # DataTables sends length=-1 for "All"; never serve more than one page.
+    if length < 1 or length > CLIENT_PAGE_MAX_SIZE:
+        length = CLIENT_PAGE_MAX_SIZE
+
+    cursor = request.GET.get('cursor') or None
+    page = get_client_page(
+        length,
+        owner_id=request.GET.get('owner') or None,
+        descending=request.GET.get('order[0][dir]', 'desc') != 'asc',
+        cursor=cursor,
+        offset=0 if cursor else start,
+    )
+
+    return JsonResponse({
+        'draw': draw,
+        'recordsTotal': page['total'],
+        'recordsFiltered': page['filtered'],
+        'data': page['clients'],
+        'next_cursor': page['next_cursor'],
+    })
+
+
+def _parse_export_date(value, local_tz, next_day=False):
+    """Turns a 'YYYY-MM-DD' local date into a naive UTC datetime at the start (or end) of that day."""
+    day = datetime.datetime.strptime(value, '%Y-%m-%d')
+    if next_day:
+        day += datetime.timedelta(days=1)
+    return local_tz.localize(day).astimezone(pytz.utc).replace(tzinfo=None)
+
+
+@firebase_login_required
+@admin_required
+def export_clients(request):
+    """
+    Streams the clients as a CSV or JSONL download (?format=csv|jsonl),
+    optionally filtered by distributor (?owner=<uid>) and by local date range
+    (?from=YYYY-MM-DD&to=YYYY-MM-DD, both inclusive). Clients are read from
+    Firestore page by page while the response is being sent, so the export
+    never holds the whole collection in memory.
+    """
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    local_tz = pytz.timezone(settings.TIME_ZONE)
+    try:
+        start_utc = _parse_export_date(request.GET['from'], local_tz) if request.GET.get('from') else None
+        end_utc = _parse_export_date(request.GET['to'], local_tz, next_day=True) if request.GET.get('to') else None
+    except ValueError:
+        return HttpResponseBadRequest('from and to must be dates in YYYY-MM-DD format.')
+
+    content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(
+        iter_client_export(file_format, owner_id=request.GET.get('owner') or None,
+                           start_utc=start_utc, end_utc=end_utc),
+        content_type=f'{content_type}; charset=utf-8',
+    )
+    filename = f"clients-{datetime.datetime.now(local_tz):%Y%m%d-%H%M}.{file_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Most rows the leaderboard API ranks, whatever the client asks for.
+LEADERBOARD_MAX_TOP_N = 50
+
+
+@firebase_login_required
+def leaderboard_api(request):
+    """
+    Leaderboard of any local date window (?from=YYYY-MM-DD&to=YYYY-MM-DD,
+    both inclusive; defaults to the current month so far) with ?top_n= rows
+    (default 3, ties included). Closed days, weeks and months are read from
+    their rollups; only today is counted from the raw clients.
+    """
+    today = local_today()
+    try:
+        start = datetime.date.fromisoformat(request.GET['from']) if request.GET.get('from') else today.replace(day=1)
+        end = datetime.date.fromisoformat(request.GET['to']) if request.GET.get('to') else today
+        top_n = int(request.GET.get('top_n', 3))
+    except ValueError:
+        return JsonResponse({'error': 'from and to must be dates in YYYY-MM-DD format; top_n an integer.'},
+                            status=400)
+    if end < start:
+        return JsonResponse({'error': 'to must not be before from.'}, status=400)
+
+    return JsonResponse({
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'leaderboard': get_leaderboard(start, end + datetime.timedelta(days=1),
+                                       max(1, min(top_n, LEADERBOARD_MAX_TOP_N))),
+    })
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint: per-view Firestore/Auth call counts, documents
+    and bytes read, and latency histograms of this process. Scrapers send
+    settings.METRICS_TOKEN as a bearer token; otherwise an admin session is
+    required, as the per-view numbers describe the app's internals.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    authorized = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized and (request.session.get('user') or {}).get('role') != 'admin':
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@firebase_login_required
+@admin_required
+def profile_list(request):
+    """Lists the stored request profiles (newest first) with their request details."""
+    return JsonResponse({'profiles': list_profiles()})
+
+
+@firebase_login_required
+@admin_required
+def download_profile(request, name):
+    """
+    Downloads one stored request profile as a .prof file (open it with
+    `python -m pstats` or snakeviz), or with ?format=txt as a plain-text
+    report of the top functions (?sort=cumulative|tottime|calls).
+    """
+    if request.GET.get('format') == 'txt':
+        sort = request.GET.get('sort', 'cumulative')
+        if sort not in PROFILE_REPORT_SORTS:
+            return HttpResponseBadRequest(f"Unsupported sort. Use one of: {', '.join(PROFILE_REPORT_SORTS)}.")
+        report = render_profile_report(name, sort=sort)
+        if report is None:
+            return HttpResponse('Profile not found', status=404, content_type='text/plain')
+        return HttpResponse(report, content_type='text/plain; charset=utf-8')
+
+    data = read_profile(name)
+    if data is None:
+        return HttpResponse('Profile not found', status=404, content_type='text/plain')
+    response = HttpResponse(data, content_type='application/octet-stream')
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    return response
@@ -12,8 +12,6 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
 
 from dotenv import load_dotenv
@@ -54,13 +52,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'ecmanagerapp.middleware.FirestoreMetricsMiddleware',
+    'ecmanagerapp.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ecmanagerapp.middleware.RequestProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'hrmanager.urls'
@@ -82,15 +82,28 @@ TEMPLATES = [
 
 ASGI_APPLICATION = 'hrmanager.asgi.application'
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {
-            # The 'hosts' key takes a list of URLs
-            "hosts": [os.environ.get("REDIS_URL")],
+# Channel layer used to push live updates to dashboard WebSockets:
+#   "redis"  - channels_redis, shared by every worker process (production)
+#   "memory" - in-process layer for local development and tests; updates only
+#              reach sockets connected to the same process
+CHANNEL_LAYER_BACKEND = os.environ.get("CHANNEL_LAYER_BACKEND", "redis")
+
+if CHANNEL_LAYER_BACKEND == "memory":
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
         },
-    },
-}
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                # The 'hosts' key takes a list of URLs
+                "hosts": [os.environ.get("REDIS_URL")],
+            },
+        },
+    }
 
 # CHANNEL_LAYERS = {
 #     'default': {
@@ -103,6 +116,25 @@ CHANNEL_LAYERS = {
 
 # daphne -p 8000 hrmanager.asgi:application
 
+# Django cache, used by rate limiting and concurrency admission control:
+#   "redis"  - shared by every worker process (production, needs REDIS_URL)
+#   "memory" - per-process local memory (local development and tests)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "redis" if os.environ.get("REDIS_URL") else "memory")
+
+if CACHE_BACKEND == "redis":
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL"),
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        },
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -174,15 +206,101 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Data backend used by ecmanagerapp.datastore:
+#   'firebase' -> Cloud Firestore + Firebase Auth (production)
+#   'memory'   -> in-memory stand-ins for local profiling/tests (no credentials needed)
+ECMANAGER_DATASTORE = os.environ.get("ECMANAGER_DATASTORE", "firebase")
+
+# Seconds the distributor UID -> name map is cached per process
+# (invalidated on employee registration/deletion).
+DISTRIBUTOR_MAP_CACHE_TTL = int(os.environ.get("DISTRIBUTOR_MAP_CACHE_TTL", 300))
+
+# Seconds before the per-process mirror of Firebase Auth users (employee list
+# with last login) is refreshed in the background; registrations and
+# deletions made through this process are applied to it immediately.
+AUTH_USERS_CACHE_TTL = int(os.environ.get("AUTH_USERS_CACHE_TTL", 300))
+
+# Dashboard data loaders run concurrently on a bounded thread pool;
+# a loader slower than the timeout (seconds) is replaced by empty data.
+DASHBOARD_LOADER_WORKERS = int(os.environ.get("DASHBOARD_LOADER_WORKERS", 8))
+DASHBOARD_LOADER_TIMEOUT = float(os.environ.get("DASHBOARD_LOADER_TIMEOUT", 10))
+# Threads used to issue independent Firestore queries (e.g. KPI count() aggregations) in parallel.
+QUERY_FANOUT_WORKERS = int(os.environ.get("QUERY_FANOUT_WORKERS", 16))
+# Threads running background jobs such as the client cascade of employee deletions.
+BACKGROUND_JOB_WORKERS = int(os.environ.get("BACKGROUND_JOB_WORKERS", 2))
+
+# What happens to the clients of a deleted employee when the request does not
+# say: 'archive' moves them to the archived_clients collection, 'reassign'
+# hands them to the distributor given as reassign_to.
+EMPLOYEE_DELETE_CASCADE = os.environ.get("EMPLOYEE_DELETE_CASCADE", "archive")
+
+# Largest lead import accepted, in bytes of the uploaded file and in rows;
+# bigger uploads are rejected with a 413 before anything is written.
+IMPORT_MAX_FILE_SIZE = int(os.environ.get("IMPORT_MAX_FILE_SIZE", 5 * 1024 * 1024))
+IMPORT_MAX_ROWS = int(os.environ.get("IMPORT_MAX_ROWS", 5000))
+
+# Seconds the current month's per-distributor client tally is memoized
+# (shared by the leaderboard and the top-distributor KPI; cleared on new leads).
+MONTHLY_AGGREGATE_CACHE_TTL = int(os.environ.get("MONTHLY_AGGREGATE_CACHE_TTL", 60))
+
+# Monthly per-distributor counts come from sharded counters maintained by
+# submit_client_lead ('counters'), or from scanning the month's clients ('scan').
+# Counters are only used for months marked complete, so until
+# `python manage.py rebuild_monthly_counters --months 12` has backfilled them
+# once, months are scanned; after that each new month inherits the mark.
+MONTHLY_AGGREGATE_SOURCE = os.environ.get("MONTHLY_AGGREGATE_SOURCE", "counters")
+MONTHLY_COUNTER_SHARDS = int(os.environ.get("MONTHLY_COUNTER_SHARDS", 4))
+
+# Admin KPIs are kept in a persisted state document ('incremental'): each
+# refresh only reads the clients logged after its dateLogged watermark, minus
+# KPI_WATERMARK_OVERLAP seconds for leads committed out of order. Every
+# KPI_RECONCILE_INTERVAL seconds (and at the start of each month) it is
+# recomputed from count() aggregations and the monthly counters. 'count'
+# issues the count() aggregations on every load instead.
+CLIENT_KPI_SOURCE = os.environ.get("CLIENT_KPI_SOURCE", "incremental")
+KPI_WATERMARK_OVERLAP = int(os.environ.get("KPI_WATERMARK_OVERLAP", 60))
+KPI_RECONCILE_INTERVAL = int(os.environ.get("KPI_RECONCILE_INTERVAL", 3600))
+
+# Keep a per-process replica of the clients and distributors collections,
+# fed by Firestore snapshot listeners, and serve dashboard reads from it once
+# loaded. Each worker holds every client in memory and keeps two listeners
+# open, so enable it only when that fits the deployment.
+CLIENT_REPLICA_ENABLED = os.environ.get("CLIENT_REPLICA_ENABLED", "false").lower() in ("1", "true", "yes")
+# Seconds before a replica whose listeners failed is started again, doubling
+# with every start that does not get warm, up to the maximum.
+CLIENT_REPLICA_RETRY_DELAY = float(os.environ.get("CLIENT_REPLICA_RETRY_DELAY", 5))
+CLIENT_REPLICA_RETRY_MAX_DELAY = float(os.environ.get("CLIENT_REPLICA_RETRY_MAX_DELAY", 300))
+
+# Count and time every Firestore/Auth call per view (served at /metrics).
+FIRESTORE_INSTRUMENTATION = os.environ.get("FIRESTORE_INSTRUMENTATION", "true").lower() in ("1", "true", "yes")
+# Also report each request's Firestore/Auth time in a Server-Timing header.
+SERVER_TIMING_HEADER = os.environ.get("SERVER_TIMING_HEADER", "false").lower() in ("1", "true", "yes")
+# Bearer token for scraping /metrics; without it only admin sessions can read it.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# On-demand request profiling: admins add ?profile=1 (or an X-Profile: 1
+# header) to profile one request with cProfile; profiles are listed and
+# downloaded at /admins/profiles/. At most one request per process is profiled
+# every REQUEST_PROFILING_MIN_INTERVAL seconds and the newest
+# REQUEST_PROFILE_KEEP profiles are kept in REQUEST_PROFILE_DIR.
+REQUEST_PROFILING_ENABLED = os.environ.get("REQUEST_PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+REQUEST_PROFILING_MIN_INTERVAL = int(os.environ.get("REQUEST_PROFILING_MIN_INTERVAL", "30"))
+REQUEST_PROFILE_KEEP = int(os.environ.get("REQUEST_PROFILE_KEEP", "20"))
+REQUEST_PROFILE_DIR = os.environ.get("REQUEST_PROFILE_DIR") or os.path.join(BASE_DIR, "profiles")
+
 # Firebase Configuration
-# Initialize the Firebase Admin SDK.
-# The `serviceAccountKey.json` file should be placed at the root of your project.
-FIREBASE_CRED = credentials.Certificate(os.path.join(BASE_DIR, 'django-fw-firebase-adminsdk-fbsvc-e75ca1d06d.json'))
-firebase_admin.initialize_app(FIREBASE_CRED)
+# The Firebase Admin SDK is initialized lazily, on the first Firestore/Auth
+# call (see ecmanagerapp/datastore.py), so settings import and manage.py
+# commands do not need credentials. The service-account key file should be
+# placed at the root of your project; without it, Application Default
+# Credentials are used.
+FIREBASE_CREDENTIALS_FILE = os.environ.get("FIREBASE_CREDENTIALS_FILE") or os.path.join(
+    BASE_DIR, 'django-fw-firebase-adminsdk-fbsvc-e75ca1d06d.json')
 
-# Create a global reference to the Firestore client
-# This allows you to import `db` from settings in any part of your app.
-db = firestore.client()
+# Warm up each worker at startup, in the background: open the Firestore
+# channel and prefetch the distributor map, so the first request after a
+# deploy does not pay for it.
+FIREBASE_WARM_UP = os.environ.get("FIREBASE_WARM_UP", "false").lower() in ("1", "true", "yes")
 
 
 # Go to your Firebase Console → select your project.
@@ -192,6 +310,42 @@ db = firestore.client()
 FIREBASE_WEB_API_KEY=os.environ.get("FIREBASE_WEB_API_KEY")
 FIREBASE_WEB_APP_ID=os.environ.get("FIREBASE_WEB_APP_ID")
 
+# Sign-in calls to the Identity Toolkit: connect/read timeouts in seconds and
+# retries on connection errors or 429/5xx responses (pooled connections).
+SIGN_IN_CONNECT_TIMEOUT = float(os.environ.get("SIGN_IN_CONNECT_TIMEOUT", 3.05))
+SIGN_IN_READ_TIMEOUT = float(os.environ.get("SIGN_IN_READ_TIMEOUT", 10))
+SIGN_IN_RETRIES = int(os.environ.get("SIGN_IN_RETRIES", 2))
+
+# Admission control for the expensive endpoints, through the cache above.
+# RATE_LIMITS are token buckets written 'N/period' (s, m, h or d, e.g.
+# '10/m'): a burst of N requests refilled at N per period, per signed-in
+# user (per client IP for logins); over it a view answers 429. An empty rate
+# disables that limit. Behind a load balancer, set RATE_LIMIT_PROXY_COUNT to
+# the number of proxies appending to X-Forwarded-For so clients are told apart.
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMITS = {
+    "login": os.environ.get("LOGIN_RATE_LIMIT", "10/m"),
+    "submit_lead": os.environ.get("SUBMIT_LEAD_RATE_LIMIT", "60/m"),
+    "import_leads": os.environ.get("IMPORT_LEADS_RATE_LIMIT", "5/m"),
+    "admin_dashboard": os.environ.get("ADMIN_DASHBOARD_RATE_LIMIT", "20/m"),
+    "admin_client_list": os.environ.get("ADMIN_CLIENT_LIST_RATE_LIMIT", "20/m"),
+}
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get("RATE_LIMIT_PROXY_COUNT", 0))
+# Requests of a view allowed to run at once across all workers. Extra ones
+# wait up to CONCURRENCY_QUEUE_TIMEOUT seconds for a slot (0 rejects them
+# right away), then get a 503; a slot is freed after CONCURRENCY_SLOT_TTL
+# seconds if its worker died.
+CONCURRENCY_LIMITS = {
+    "admin_dashboard": int(os.environ.get("ADMIN_DASHBOARD_CONCURRENCY", 4)),
+    "admin_client_list": int(os.environ.get("ADMIN_CLIENT_LIST_CONCURRENCY", 4)),
+    "import_leads": int(os.environ.get("IMPORT_LEADS_CONCURRENCY", 2)),
+}
+CONCURRENCY_QUEUE_TIMEOUT = float(os.environ.get("CONCURRENCY_QUEUE_TIMEOUT", 2))
+CONCURRENCY_SLOT_TTL = int(os.environ.get("CONCURRENCY_SLOT_TTL", 60))
+
+# Seconds a user's distributor profile (role) is cached for logins. Role
+# changes made directly in Firestore take up to this long to apply.
+ROLE_CACHE_TTL = int(os.environ.get("ROLE_CACHE_TTL", 60))
 
 #link for enabling Cloud Firestore API  --> https://console.developers.google.com/apis/api/firestore.googleapis.com/overview?project=django-fw
 #link for creating firebase datastore(database) --> https://console.cloud.google.com/datastore/setup?project=django-fw
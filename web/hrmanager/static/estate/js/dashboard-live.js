@@ -0,0 +1,86 @@
+// Live dashboard updates over the /ws/dashboard/ WebSocket (see ecmanagerapp/consumers.py).
+// Elements opt in with data-kpi="total|month|top-name|top-count"; the employee client
+// table body is #client-list-body and the leaderboard is #leaderboard-list.
+(function() {
+    const RECONNECT_MAX_DELAY = 30000;
+    let reconnectDelay = 1000;
+
+    function addToKpi(name, delta) {
+        document.querySelectorAll(`[data-kpi="${name}"]`).forEach(function(el) {
+            el.textContent = (parseInt(el.textContent, 10) || 0) + delta;
+        });
+    }
+
+    function setKpi(name, value) {
+        document.querySelectorAll(`[data-kpi="${name}"]`).forEach(function(el) {
+            el.textContent = value;
+        });
+    }
+
+    function prependClientRows(clients) {
+        const body = document.getElementById('client-list-body');
+        if (!body || !clients.length) {
+            return;
+        }
+        // Drop the "no client leads yet" placeholder row.
+        body.querySelectorAll('td[colspan]').forEach(function(cell) { cell.parentElement.remove(); });
+
+        clients.forEach(function(client) {
+            const row = document.createElement('tr');
+            [
+                ['text-nowrap', client.fullName],
+                ['text-nowrap', client.contact1],
+                ['text-center text-nowrap', client.date_logged_formatted],
+            ].forEach(function([className, text]) {
+                const cell = document.createElement('td');
+                cell.className = className;
+                cell.textContent = text || 'N/A';
+                row.appendChild(cell);
+            });
+            const actions = document.createElement('td');
+            actions.className = 'text-center';
+            actions.innerHTML = '<button class="btn btn-sm btn-info">Edit</button>';
+            row.appendChild(actions);
+            body.prepend(row);
+        });
+    }
+
+    function handleEvent(payload) {
+        if (payload.event === 'new_lead') {
+            addToKpi('total', payload.kpi_delta.total);
+            addToKpi('month', payload.kpi_delta.month);
+            prependClientRows(payload.clients);
+            document.dispatchEvent(new CustomEvent('dashboard:new-lead', { detail: payload }));
+        } else if (payload.event === 'leaderboard') {
+            const list = document.getElementById('leaderboard-list');
+            if (list) {
+                list.outerHTML = payload.html;
+            }
+            setKpi('top-name', payload.top_distributor);
+            setKpi('top-count', payload.top_distributor_count);
+        }
+    }
+
+    function connect() {
+        const scheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const socket = new WebSocket(`${scheme}://${window.location.host}/ws/dashboard/`);
+
+        socket.onopen = function() {
+            reconnectDelay = 1000;
+        };
+        socket.onmessage = function(message) {
+            handleEvent(JSON.parse(message.data));
+        };
+        socket.onclose = function(event) {
+            // 1000 = normal close; anything else (server restart, network drop) retries with backoff.
+            if (event.code !== 1000) {
+                setTimeout(connect, reconnectDelay);
+                reconnectDelay = Math.min(reconnectDelay * 2, RECONNECT_MAX_DELAY);
+            }
+        };
+    }
+
+    if ('WebSocket' in window) {
+        connect();
+    }
+})();